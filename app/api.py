@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, Response, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from openai import OpenAI
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
 
 import asyncio
@@ -15,12 +15,27 @@ dotenv.load_dotenv()
 
 from .logs.logger import setup_logger
 from .db.conn import db_client
-from .db.agent_chat_queries import get_chat_history_with_agent, append_message_to_convo
+from .db.agent_chat_queries import flow_fields, get_chat_history_with_agent, get_conversation_snapshot, issue_draft_fields
+from .db.chat_write_buffer import ChatWriteBuffer
 from .db.user_issue_queries import create_user_issue
-from .utils.ws_connection import ConnectionManager
-from .utils.agent_setup import ChatAssistantChain
-from .utils.issue_extractor import IssueExtractor
+from .db.geek_locations import GEO_MATCH_ENABLED, GeekLocationSync
+from .db.indexes import ENSURE_AT_STARTUP as ENSURE_INDEXES_AT_STARTUP, OWN_COLLECTIONS, ensure_indexes
+from .utils.ws_connection import ConnectionManager, WebSocketCallbackHandler
+from .utils.agent_setup import AgentTemplate, ChatAssistantChain
+from .utils.chat_memory import RESUME_MAX_MESSAGES, tokenizer
+from .utils.category_classifier import category_hint, rebuild_classifier
+from .utils.conversation_flow import ConversationFlow, FlowState
+from .utils.llm_clients import close_clients, shared_openai_client
+from .utils.metrics import metrics
+from .utils.issue_extractor import IssueExtractor, format_transcript
+from .utils.issue_draft import IssueDraft
+from .utils.tts import AUDIO_FORMATS, DEFAULT_FORMAT, DEFAULT_VOICE, TTS_INSTRUCTIONS, negotiate_audio_format, open_speech_stream
+from .utils.tts_cache import TTSCache, load_hot_phrases
+from .utils.stt import MAX_UPLOAD_BYTES, UploadTooLargeError, check_upload_size, transcribe_upload
+from .utils.voice import UtteranceBuffer, VoiceReplyStreamer, transcribe_utterance
 from .utils.agent_tools import get_geeks_from_user_issue
+from .utils.catalog import CatalogSnapshot
+from .utils.geek_index import MATCH_ENGINE as GEEK_MATCH_ENGINE, GeekMatchIndex
 
 from .models.user_issue_model import UserIssueCreate
 from .models.agent_chat_model import ChatMessageBase, MessageSender
@@ -56,7 +71,7 @@ app.add_middleware(
 )
 
 ws_connection = ConnectionManager()
-client = OpenAI()
+client = shared_openai_client()
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -74,16 +89,68 @@ async def log_requests(request: Request, call_next):
     
     return response
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Reject oversized audio before the multipart body is read and spooled
+    if request.url.path == "/stt":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit():
+            try:
+                check_upload_size(int(content_length))
+            except UploadTooLargeError as e:
+                return JSONResponse(status_code=413, content={"error": str(e)})
+    return await call_next(request)
+
 @app.on_event("startup")
-def startup_db_client():
+async def startup_db_client():
     app.mongodb_client = db_client()
     app.state.database = app.mongodb_client[os.environ["DB_NAME"]]
     print("Connnected to MongoDB database.")
+    if ENSURE_INDEXES_AT_STARTUP:
+        await ensure_indexes(app.state.database, OWN_COLLECTIONS)
+    app.state.chat_writer = ChatWriteBuffer(app.state.database)
+    app.state.catalog = CatalogSnapshot()
+    # The classifier is rebuilt off the event loop with every catalog load
+    app.state.catalog.add_refresh_hook(rebuild_classifier)
+    await app.state.catalog.start(app.state.database)
+    # Prompt, tools and model are shared by every chat session
+    app.state.agent_template = AgentTemplate(catalog=app.state.catalog)
+    app.state.issue_extractor = IssueExtractor()
+    app.state.geek_locations = None
+    if GEO_MATCH_ENABLED:
+        app.state.geek_locations = GeekLocationSync()
+        await app.state.geek_locations.start(app.state.database)
+    app.state.geek_index = None
+    if GEEK_MATCH_ENGINE == "index":
+        app.state.geek_index = GeekMatchIndex()
+        await app.state.geek_index.start(app.state.database)
+
+@app.on_event("startup")
+async def startup_tokenizer():
+    # Loading the encoding may download it; keep that off the first chat turn
+    await asyncio.to_thread(tokenizer)
+
+@app.on_event("startup")
+async def startup_tts_cache():
+    app.state.tts_cache = TTSCache.from_env()
+    # Pre-rendering runs in the background so it never delays startup
+    voices = os.environ.get("TTS_PRERENDER_VOICES", DEFAULT_VOICE).split(",")
+    formats = os.environ.get("TTS_PRERENDER_FORMATS", DEFAULT_FORMAT).split(",")
+    app.state.tts_prerender = asyncio.create_task(
+        app.state.tts_cache.prerender(client, load_hot_phrases(), voices, formats)
+    )
     
 @app.on_event("shutdown")
-def shutdown_db_client():
-    app.mongodb_client.close()
+async def shutdown_db_client():
+    await app.state.chat_writer.close()
+    await app.state.catalog.stop()
+    if app.state.geek_index:
+        await app.state.geek_index.stop()
+    if app.state.geek_locations:
+        await app.state.geek_locations.stop()
+    await app.mongodb_client.close()
     print("Disconnected from MongoDB database.")
+    await close_clients()
 
 @app.get("/")
 async def index():
@@ -92,61 +159,163 @@ async def index():
 
 
 @app.post("/tts")
-async def tts(request: dict):
+async def tts(request: dict, http_request: Request):
     text = request.get("text")
-    voice = request.get("voice", "verse")
+    voice = request.get("voice", DEFAULT_VOICE)
+    tts_cache = app.state.tts_cache
 
     try:
-        response = client.audio.speech.create(
-            model="gpt-4o-mini-tts",
+        audio_format = negotiate_audio_format(request.get("format"), http_request.headers.get("accept"))
+        media_type = AUDIO_FORMATS[audio_format]
+
+        cache_key = tts_cache.make_key(text, voice, TTS_INSTRUCTIONS, audio_format)
+        cached_audio = await tts_cache.get(cache_key)
+        if cached_audio is not None:
+            return Response(content=cached_audio, media_type=media_type)
+
+        audio_chunks, upstream = await open_speech_stream(
+            client,
+            text=text,
             voice=voice,
-            input=text,
-            response_format="wav",
-            instructions='Voice Affect: Calm, composed, and reassuring. Competent and in control, instilling trust.\n\nTone: Sincere, empathetic, with genuine concern for the customer and understanding of the situation.\n\nPacing: Slower during the apology to allow for clarity and processing. Faster when offering solutions to signal action and resolution.\n\nEmotions: Calm reassurance, empathy, and gratitude.\n\nPronunciation: Clear, precise: Ensures clarity, especially with key details.'
+            audio_format=audio_format,
         )
 
-        # response is a streaming response, so we can yield chunks
-        audio_bytes = response.read()  # blocking full read (for simple case)
-
-        return Response(
-            content=audio_bytes,
-            media_type="audio/wav"
+        # Audio is relayed chunk by chunk as it is synthesized, and cached once complete
+        return StreamingResponse(
+            tts_cache.tee(cache_key, audio_chunks),
+            media_type=media_type,
+            background=BackgroundTask(upstream.aclose),
         )
 
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return JSONResponse(status_code=200, content=metrics.snapshot())
+
+@app.get("/tts/cache_stats")
+async def tts_cache_stats():
+    return JSONResponse(status_code=200, content=app.state.tts_cache.stats())
+
+
 @app.post("/stt")
 async def speech_to_text(file: UploadFile = File(...)):
-    audio_bytes = await file.read()
-    
-    # Whisper auto-detects language
-    transcription = client.audio.transcriptions.create(
-        model="whisper-1",
-        file=("audio.wav", audio_bytes, file.content_type)
-    )
+    try:
+        transcription = await transcribe_upload(client, file)
+    except UploadTooLargeError as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    if transcription.preprocessing:
+        return {"text": transcription.text, "preprocessing": transcription.preprocessing.summary()}
     return {"text": transcription.text}
 
 
 @app.websocket("/chat/{user_id}")
-async def chat(websocket: WebSocket, user_id: str, conversation_id: str):
+async def chat(
+    websocket: WebSocket,
+    user_id: str,
+    conversation_id: str,
+    stream: bool = False,
+    voice: bool = False,
+    tts_voice: str = DEFAULT_VOICE,
+    tts_format: str = DEFAULT_FORMAT,
+):
+    if voice:
+        try:
+            tts_format = negotiate_audio_format(tts_format)
+        except ValueError as e:
+            await websocket.close(code=1008, reason=str(e))
+            return
     agent_last_question = {}
     # logger.info("Chat with agent initiated.")
-    extractor = IssueExtractor()
-    assistant = ChatAssistantChain(db_instance=app.state.database)
+    extractor = app.state.issue_extractor
+    # With ?stream=true the reply is also sent token by token before the final message,
+    # with ?voice=true replies to audio turns are spoken back sentence by sentence
+    callback_handler = WebSocketCallbackHandler(websocket, ws_connection, send_deltas=stream) if stream or voice else None
+    assistant = ChatAssistantChain(
+        db_instance=app.state.database, callback_handler=callback_handler, conversation_id=conversation_id,
+        template=app.state.agent_template, chat_writer=app.state.chat_writer,
+    )
+    # The issue is extracted a turn at a time in the background, ready for confirmation
+    issue_draft = IssueDraft(
+        extractor,
+        on_update=lambda fields, through: app.state.chat_writer.update_header(
+            conversation_id, issue_draft_fields(fields, through)
+        ),
+    )
+    audio_buffer = UtteranceBuffer(MAX_UPLOAD_BYTES)
+
+    async def save_flow(state: dict):
+        # The flow lives on the header, which only an append creates
+        try:
+            saved = await app.state.chat_writer.update_header(conversation_id, flow_fields(state))
+            if not saved:
+                logger.warning(f"Conversation {conversation_id} has no header yet, flow state not saved")
+        except Exception as e:
+            logger.error(f"Error saving the flow state of conversation {conversation_id}: {e}")
+
+    async def run_agent(user_input: str, **kwargs) -> dict:
+        response = await assistant.run(user_input, **kwargs)
+        if not response.get("error"):
+            flow.observe_agent_reply(response["response"])
+        return response
     
     await ws_connection.connect(websocket)
     try:
+        # Rebuild the agent's memory from the stored conversation, so resuming only
+        # needs the conversation_id
+        await app.state.chat_writer.flush(conversation_id)
+        snapshot = await get_conversation_snapshot(conversation_id, app.state.database, RESUME_MAX_MESSAGES)
+        pending_message = assistant.resume(snapshot)
+        issue_draft.restore(
+            snapshot.issue_draft,
+            snapshot.messages[:-1] if pending_message is not None else snapshot.messages,
+            snapshot.first_seq,
+        )
+        last_reply = None
+        if snapshot.messages and snapshot.messages[-1].sender == MessageSender.BOT:
+            last_reply = json.dumps({"response": snapshot.messages[-1].message, "options": None})
+        flow = ConversationFlow.resumed(snapshot.flow, last_reply, snapshot.message_count)
+        stored_flow = snapshot.flow
+        if last_reply is not None:
+            agent_last_question[conversation_id] = json.dumps({"response": snapshot.messages[-1].message, "options": flow.options or None})
         while True:
             try:
-                query = await ws_connection.receive_message(websocket)
+                query = await ws_connection.receive_frame(websocket)
+                if isinstance(query, bytes):
+                    # Voice mode: audio frames are buffered until the client sends audio_end
+                    error = audio_buffer.add(query)
+                    if error:
+                        await ws_connection.send_message(json.dumps({"type": "error", "error": error}), websocket)
+                    continue
                 logger.info(f"Received message: {query}")
+                voice_turn = False
                 
                 try:
                     query = json.loads(query)
                     if isinstance(query, dict) and query.get('action') == "continue_conversation":
                         is_continuation = True
+                    elif isinstance(query, dict) and query.get('action') == "audio_end":
+                        audio = audio_buffer.take()
+                        if not audio:
+                            # Nothing buffered, or the utterance was dropped as too large
+                            continue
+                        try:
+                            transcription = await transcribe_utterance(client, audio, query.get("format", "wav"))
+                        except Exception as e:
+                            # Only this utterance fails; the conversation carries on
+                            logger.error(f"Error transcribing voice message: {e}")
+                            error = str(e) if isinstance(e, UploadTooLargeError) else "The audio message could not be transcribed."
+                            await ws_connection.send_message(json.dumps({"type": "error", "error": error}), websocket)
+                            continue
+                        query = transcription.text
+                        logger.info(f"Transcribed voice message: {query}")
+                        await ws_connection.send_message(json.dumps({"type": "transcript", "text": query}), websocket)
+                        if not query:
+                            continue
+                        voice_turn = True
+                        is_continuation = False
                     else:
                         is_continuation = False
                 except json.JSONDecodeError:
@@ -159,40 +328,48 @@ async def chat(websocket: WebSocket, user_id: str, conversation_id: str):
                         sender=MessageSender.USER,
                         message=str(query)
                     )
-                    await append_message_to_convo(user_id, conversation_id, user_message, app.state.database)
+                    await app.state.chat_writer.append(user_id, conversation_id, user_message)
                     logger.info("User message saved to DB.")
                     
                     # CHECK FOR COMPLETION TRIGGER
-                    # If the agent;s last message was the confirmation prompt and user says 'yes'
-                    last_question = agent_last_question.get(conversation_id)
-                    print("LAST QUESTION: ", last_question)
-                    if last_question and "Is this summary correct?" in last_question and "yes" in str(query).lower():
+                    # If the agent's last message was the confirmation prompt and user says 'yes'
+                    if flow.confirms(str(query)):
                         logger.info("Processing the chat and extracting details...")
-                        await ws_connection.send_message(json.dumps({'response': "Your issue is being processed and we'll find a suitable geek for you shortly.", 'options': None}), websocket)
-                        
-                        # A. fetch the full conversation history
-                        logger.info('fetching the chat hisotry from database...')
-                        history = await get_chat_history_with_agent(conversation_id, app.state.database)
-                        transcript = "\n".join([f"{msg.sender.value}: {msg.message}" for msg in history[0].chat_messages])
-                        
-                        # B. use the extractor to get structured data
-                        logger.info("extracting details from conversation history...")
-                        extracted_data = await extractor.extract_issue_details(
-                            transcript=transcript,
-                            user_id=ObjectId(user_id),
-                            conversation_id=conversation_id
-                        )
+                        # A. the draft extracted turn by turn is normally complete by now
+                        extracted_data = await issue_draft.result()
+                        if extracted_data is not None:
+                            logger.info("Using the issue draft extracted during the conversation")
+                            extracted_data['user_id'] = ObjectId(user_id)
+                            extracted_data['conversation_id'] = conversation_id
+                        else:
+                            await ws_connection.send_message(json.dumps({'response': "Your issue is being processed and we'll find a suitable geek for you shortly.", 'options': None}), websocket)
+                            
+                            # B. otherwise fetch the full conversation history
+                            logger.info('fetching the chat hisotry from database...')
+                            await app.state.chat_writer.flush(conversation_id)
+                            history = await get_chat_history_with_agent(conversation_id, app.state.database)
+                            transcript = format_transcript(history[0].chat_messages)
+                            
+                            # and use the extractor to get structured data
+                            logger.info("extracting details from conversation history...")
+                            extracted_data = await extractor.extract_issue_details(
+                                transcript=transcript,
+                                user_id=ObjectId(user_id),
+                                conversation_id=conversation_id
+                            )
                         
                         
                         # C. create the user issue from the extracted data
                         logger.info("creating user issue from extracted data...")
                         issue = UserIssueCreate(**extracted_data)
-                        issue_in_db = await create_user_issue(issue, app.state.database)
+                        issue_in_db = await app.state.chat_writer.write_through(
+                            conversation_id, lambda: create_user_issue(issue, app.state.database)
+                        )
                         logger.info("User issue saved to DB.")
                         
                         try:
                             logger.info(f"Fetching geeks from user issue: {issue}")                   
-                            geeks = get_geeks_from_user_issue(app.state.database, issue_in_db, page=1, page_size=5)
+                            geeks = await get_geeks_from_user_issue(app.state.database, app.state.catalog, issue_in_db, page=1, page_size=5, geek_index=app.state.geek_index)
                             logger.info(f"Geeks fetched: {len(geeks.geeks)}")
                             if geeks and len(geeks.geeks) > 0: 
                                 await ws_connection.send_message(json.dumps({'response': f"Please select a Geek to proceed", 'options': [geeks.model_dump_json()]}), websocket)
@@ -204,17 +381,53 @@ async def chat(websocket: WebSocket, user_id: str, conversation_id: str):
                             logger.error(f"Error fetching geeks from user issue: {e}")
                         
                         # D. Clean up and close the connection
-                        del agent_last_question[conversation_id]
+                        flow.state = FlowState.DONE
+                        await save_flow(flow.persisted())
+                        agent_last_question.pop(conversation_id, None)
                         break # Exit the while loop to close the socket
                 
-                    response = await assistant.run(str(query))
+                    if voice_turn and callback_handler is not None:
+                        callback_handler.voice_streamer = VoiceReplyStreamer(
+                            websocket, client, app.state.tts_cache, voice=tts_voice, audio_format=tts_format
+                        )
+                    # Structured steps (category -> subcategory -> brand options) are
+                    # answered from the catalog without a model call
+                    opening = flow.state == FlowState.START
+                    reply = flow.answer(str(query), app.state.catalog)
+                    if reply is not None:
+                        response = {"response": json.dumps(reply)}
+                        await assistant.record_turn(str(query), response["response"])
+                    else:
+                        # A free-text opening message clearly about one category is routed
+                        # locally, sparing the agent its category lookup round trips
+                        hint = category_hint(str(query), app.state.catalog) if opening else None
+                        response = await run_agent(str(query), hint=hint)
                     
+                elif pending_message is not None:
+                    # The previous session ended before the agent answered this
+                    query = pending_message
+                    response = await run_agent(pending_message)
+                    pending_message = None
+                elif conversation_id in agent_last_question:
+                    # Already resumed on connect: repeat the question the user is answering
+                    await ws_connection.send_message(agent_last_question[conversation_id], websocket)
+                    continue
                 else:
-                    response = await assistant.run(json.dumps(query['chat_history']))
+                    # Nothing stored to resume from: fall back to the client's copy
+                    response = await run_agent(json.dumps(query.get('chat_history', [])), input_stored=False)
+                    # That history never reaches the draft; the issue is extracted from the transcript
+                    issue_draft.incomplete = True
                     
                 await ws_connection.send_message(response['response'], websocket)
+                if response.get("error"):
+                    # Nothing of a failed turn is stored; the user message is answered when sent again
+                    continue
                 agent_response_text = response.get("response", "Sorry, something went wrong.")
                 
+                if callback_handler is not None and callback_handler.voice_streamer is not None:
+                    await callback_handler.voice_streamer.finish(json.loads(agent_response_text).get("response"))
+                    callback_handler.voice_streamer = None
+                
                 # Store the agent's question for the next loop
                 agent_last_question[conversation_id] = agent_response_text
 
@@ -224,12 +437,21 @@ async def chat(websocket: WebSocket, user_id: str, conversation_id: str):
                     sender=MessageSender.BOT,
                     message=json.loads(agent_response_text)["response"]
                 )
-                await append_message_to_convo(user_id, conversation_id, agent_message, app.state.database)
+                await app.state.chat_writer.append(user_id, conversation_id, agent_message)
                 logger.info("Agent message saved to DB.")
+                issue_draft.add_turn(str(query), agent_message.message)
+                if flow.persisted() != stored_flow:
+                    stored_flow = flow.persisted()
+                    await save_flow(stored_flow)
             except asyncio.TimeoutError:
                 await ws_connection.send_message(websocket, "Session timed out due to inactivity.")
                 await ws_connection.disconnect(websocket)
                 logger.error(f"WebSocket Session timed out due to inactivity.")
+            finally:
+                # A turn that failed or was cut short never finished its voice reply
+                if callback_handler is not None and callback_handler.voice_streamer is not None:
+                    voice_streamer, callback_handler.voice_streamer = callback_handler.voice_streamer, None
+                    await voice_streamer.cancel()
     except WebSocketDisconnect:
         if conversation_id in agent_last_question:
             del agent_last_question[conversation_id]
@@ -239,6 +461,12 @@ async def chat(websocket: WebSocket, user_id: str, conversation_id: str):
         ws_connection.disconnect(websocket)
         logger.error(f"Error during chat: {e}")
         await websocket.close()
+    finally:
+        # Persist whatever this session still has buffered
+        try:
+            await app.state.chat_writer.flush(conversation_id)
+        except Exception as e:
+            logger.error(f"Error saving buffered messages of conversation {conversation_id}: {e}")
                 
              
 app.include_router(db_router)
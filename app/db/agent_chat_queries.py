@@ -1,14 +1,22 @@
+import base64
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+
 from bson import ObjectId
-from pymongo.database import Database
-from typing import List, Optional
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import List, Optional, Tuple
 
 from ..models.helper import PyObjectId
-from ..models.agent_chat_model import ChatMessageInDB, ChatConversationCreate, ChatMessageBase
+from ..models.agent_chat_model import ChatMessageInDB, ChatConversationCreate, ChatMessageBase, ConversationSnapshot, ConversationSummary, MessageSender, PaginatedConversationResponse
 from ..logs.logger import setup_logger
 
 logger  = setup_logger("GoD AI Chatbot: Agent Chat Query", "app.log")
 
-# async def create_chat_message(message: ChatMessageCreate, db: Database) -> ChatMessageInDB:
+# async def create_chat_message(message: ChatMessageCreate, db: AsyncDatabase) -> ChatMessageInDB:
 #     try:
 #         message_dict = message.dict()
 #         logger.info("Inserting message to DB")
@@ -19,21 +27,214 @@ logger  = setup_logger("GoD AI Chatbot: Agent Chat Query", "app.log")
 #         logger.error("Error inserting message to DB: ", e)
 #         raise e
     
-async def append_message_to_convo(user_id: str, conversation_id: str, message: ChatMessageBase, db: Database) -> ChatMessageBase:
-    try:
-        logger.info("Appending message to conversation")
-        db.chat_messages_with_bot.update_one(
-            {"conversation_id": conversation_id}, 
+# Conversations are stored as one header document in `conversations` (owner and
+# counters) plus fixed-size buckets of messages in `chat_message_buckets`, so no
+# document grows without bound and a read only touches the buckets it needs.
+# `chat_messages_with_bot` holds conversations written before the split; they are
+# still read until migrated with `python -m app.db.migrate_chat_buckets`.
+BUCKET_SIZE = int(os.environ.get("CHAT_BUCKET_SIZE", 50))
+# Other state (flow, drafts, summaries) can reach a header before any message does,
+# so a conversation counts as bucketed only once its header counts its messages
+BUCKETED = {"message_count": {"$exists": True}}
+# Conversations still in the legacy layout are listed too; turn off once
+# migrate_chat_buckets has run, to save the extra read per listing page
+LEGACY_LISTING_ENABLED = os.environ.get("CHAT_LEGACY_LISTING", "true").lower() == "true"
+# The header doubles as the conversation's summary for per-user listings
+TITLE_CHARS = 60
+PREVIEW_CHARS = 120
+
+
+def bucket_updates(user_id: str, conversation_id: str, first_seq: int, messages: List[dict]) -> List[UpdateOne]:
+    """
+    One upsert per bucket touched by messages numbered first_seq, first_seq + 1, ...
+    Messages are kept sorted by seq inside a bucket even if concurrent appends land
+    out of order.
+    """
+    updates = []
+    now = datetime.now(timezone.utc)
+    seq = first_seq
+    while messages:
+        bucket = seq // BUCKET_SIZE
+        room = (bucket + 1) * BUCKET_SIZE - seq
+        batch, messages = messages[:room], messages[room:]
+        updates.append(UpdateOne(
+            {"conversation_id": conversation_id, "bucket": bucket},
             {
-                # "$setOnInsert": {"user_id": user_id},
-            "$setOnInsert": {"user_id": ObjectId(user_id)},
-            "$push": {"chat_messages": message.dict()}},
-        upsert=True)
+                "$setOnInsert": {"user_id": ObjectId(user_id), "start_seq": bucket * BUCKET_SIZE, "createdAt": now},
+                "$push": {"messages": {
+                    "$each": [{**message, "seq": seq + i} for i, message in enumerate(batch)],
+                    "$sort": {"seq": 1},
+                }},
+                "$inc": {"count": len(batch)},
+            },
+            upsert=True,
+        ))
+        seq += len(batch)
+    return updates
+
+
+def shorten(text: str, limit: int) -> str:
+    text = " ".join(str(text).split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0].rstrip(",.;:") + "…"
+
+
+def summary_fields(messages: List[dict]) -> dict:
+    """Title candidate (the first user message) and last-message preview for a run of messages."""
+    fields = {}
+    first_user = next((m for m in messages if m.get("sender") == MessageSender.USER.value), None)
+    if first_user is not None:
+        fields["title"] = shorten(first_user["message"], TITLE_CHARS)
+    if messages:
+        last = messages[-1]
+        fields["last_message"] = {
+            "sender": last.get("sender"),
+            "preview": shorten(last.get("message", ""), PREVIEW_CHARS),
+            "sentAt": last.get("sentAt"),
+        }
+    return fields
+
+
+def build_buckets(doc: dict) -> list:
+    messages = doc.get("chat_messages") or []
+    created_at = doc.get("createdAt") or (messages[0].get("sentAt") if messages else None) or datetime.now(timezone.utc)
+    buckets = []
+    for start in range(0, len(messages), BUCKET_SIZE):
+        batch = messages[start:start + BUCKET_SIZE]
+        buckets.append({
+            "conversation_id": doc["conversation_id"],
+            "bucket": start // BUCKET_SIZE,
+            "user_id": doc.get("user_id"),
+            "start_seq": start,
+            "createdAt": batch[0].get("sentAt") or created_at,
+            "messages": [{**message, "seq": start + i} for i, message in enumerate(batch)],
+            "count": len(batch),
+        })
+    return buckets
+
+
+async def migrate_conversation(doc: dict, db: AsyncDatabase, delete_legacy: bool = False) -> int:
+    conversation_id = doc["conversation_id"]
+    messages = doc.get("chat_messages") or []
+
+    await db.chat_message_buckets.delete_many({"conversation_id": conversation_id})
+    buckets = build_buckets(doc)
+    if buckets:
+        await db.chat_message_buckets.insert_many(buckets, ordered=True)
+
+    created_at = buckets[0]["createdAt"] if buckets else doc.get("createdAt") or datetime.now(timezone.utc)
+    # Completes a header that only holds other state; one that already counts its
+    # messages fails the filter and the upsert raises DuplicateKeyError instead
+    await db.conversations.update_one(
+        {"conversation_id": conversation_id, "message_count": {"$exists": False}},
+        {"$set": {
+            "user_id": doc.get("user_id"),
+            "createdAt": created_at,
+            "updatedAt": (messages[-1].get("sentAt") if messages else None) or created_at,
+            "message_count": len(messages),
+            **summary_fields(messages),
+        }},
+        upsert=True,
+    )
+    if delete_legacy:
+        await db.chat_messages_with_bot.delete_one({"_id": doc["_id"]})
+    return len(messages)
+
+
+# Recently used conversations known to be bucketed, so appends skip the legacy
+# check and empty range reads skip the legacy fallback
+BUCKETED_CACHE_SIZE = int(os.environ.get("CHAT_BUCKETED_CACHE_SIZE", 10000))
+_bucketed_conversations: "OrderedDict[str, None]" = OrderedDict()
+
+
+def _known_bucketed(conversation_id: str) -> bool:
+    if conversation_id not in _bucketed_conversations:
+        return False
+    _bucketed_conversations.move_to_end(conversation_id)
+    return True
+
+
+def _remember_bucketed(conversation_id: str):
+    _bucketed_conversations[conversation_id] = None
+    _bucketed_conversations.move_to_end(conversation_id)
+    while len(_bucketed_conversations) > BUCKETED_CACHE_SIZE:
+        _bucketed_conversations.popitem(last=False)
+
+
+async def ensure_bucketed(conversation_id: str, db: AsyncDatabase):
+    """Migrates a legacy conversation on its first append after the layout change."""
+    if _known_bucketed(conversation_id):
+        return
+    if not await db.conversations.find_one({"conversation_id": conversation_id, **BUCKETED}, {"_id": 1}):
+        legacy = await db.chat_messages_with_bot.find_one({"conversation_id": conversation_id})
+        if legacy is not None:
+            logger.info(f"Migrating legacy conversation {conversation_id} to buckets")
+            try:
+                await migrate_conversation(legacy, db)
+            except DuplicateKeyError:
+                pass  # migrated concurrently
+    _remember_bucketed(conversation_id)
+
+
+async def append_messages_to_convo(
+    user_id: str,
+    conversation_id: str,
+    messages: List[ChatMessageBase],
+    db: AsyncDatabase,
+    header_fields: Optional[dict] = None,
+) -> List[ChatMessageBase]:
+    """
+    Appends messages to a conversation: reserves their sequence numbers on the header
+    (and refreshes its summary, plus any `header_fields` from the *_fields helpers)
+    in one atomic update, then pushes them into the bucket(s) those numbers fall in.
+    """
+    if not messages:
+        return []
+    try:
+        await ensure_bucketed(conversation_id, db)
+        logger.info(f"Appending {len(messages)} message(s) to conversation")
+        documents = [message.model_dump(mode="python") for message in messages]
+        for document in documents:
+            document["sender"] = MessageSender(document["sender"]).value
+        summary = summary_fields(documents)
+        header_update = {
+            "user_id": {"$ifNull": ["$user_id", ObjectId(user_id)]},
+            "createdAt": {"$ifNull": ["$createdAt", messages[0].sentAt]},
+            "updatedAt": messages[-1].sentAt,
+            "message_count": {"$add": [{"$ifNull": ["$message_count", 0]}, len(messages)]},
+            # Literal so a message text starting with "$" is never read as a field path
+            "last_message": {"$literal": summary["last_message"]},
+        }
+        if "title" in summary:
+            header_update["title"] = {"$ifNull": ["$title", {"$literal": summary["title"]}]}
+        header_update.update(header_fields or {})
+        header = await db.conversations.find_one_and_update(
+            {"conversation_id": conversation_id},
+            [{"$set": header_update}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first_seq = header["message_count"] - len(messages)
+        updates = bucket_updates(user_id, conversation_id, first_seq, documents)
+        try:
+            await db.chat_message_buckets.bulk_write(updates, ordered=True)
+        except BulkWriteError as e:
+            # Two appends racing to create the same bucket: the loser retries as an update
+            if not all(error.get("code") == 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            failed = e.details["writeErrors"][0]["index"]
+            await db.chat_message_buckets.bulk_write(updates[failed:], ordered=True)
         logger.info("Message appended to conversation successfully.")
-        return ChatMessageBase(**message.dict())
+        return [ChatMessageBase(**message.model_dump()) for message in messages]
     except Exception as e:
-        logger.error("Error inserting message to DB: ", e)
+        logger.error(f"Error inserting message to DB: {e}")
         raise e
+
+
+async def append_message_to_convo(user_id: str, conversation_id: str, message: ChatMessageBase, db: AsyncDatabase) -> ChatMessageBase:
+    appended = await append_messages_to_convo(user_id, conversation_id, [message], db)
+    return appended[0]
   
   
 def parse_chat_message_in_db(doc) -> ChatMessageInDB:
@@ -44,65 +245,315 @@ def parse_chat_message_in_db(doc) -> ChatMessageInDB:
     doc["chat_messages"] = [ChatMessageBase(**msg) for msg in doc["chat_messages"]]
 
     return ChatMessageInDB(**doc)
+
+
+async def get_message_count(conversation_id: str, db: AsyncDatabase) -> int:
+    header = await db.conversations.find_one({"conversation_id": conversation_id, **BUCKETED}, {"message_count": 1})
+    if header is not None:
+        _remember_bucketed(conversation_id)
+        return header["message_count"]
+    legacy = await db.chat_messages_with_bot.aggregate([
+        {"$match": {"conversation_id": conversation_id}},
+        {"$project": {"count": {"$size": {"$ifNull": ["$chat_messages", []]}}}},
+    ])
+    counts = await legacy.to_list()
+    return counts[0]["count"] if counts else 0
+
+
+async def get_messages_range(
+    conversation_id: str, db: AsyncDatabase, offset: int, limit: int, bucketed: Optional[bool] = None
+) -> List[ChatMessageBase]:
+    """
+    Messages offset .. offset + limit - 1 of a conversation, oldest first. Only the
+    buckets covering the range are read, each filtered server-side by seq, so a
+    message missing from a bucket never shifts the range.
+
+    Args:
+        bucketed: Whether the conversation's header counts its messages, if the
+            caller already knows. Only the matching layout is read then; otherwise
+            an empty bucket read falls back to the legacy layout unless the
+            conversation is known to be bucketed.
+    """
+    if limit <= 0 or offset < 0:
+        return []
+    try:
+        if bucketed is False:
+            return await _legacy_messages_range(conversation_id, db, offset, limit)
+        first_bucket, last_bucket = offset // BUCKET_SIZE, (offset + limit - 1) // BUCKET_SIZE
+        cursor = await db.chat_message_buckets.aggregate([
+            {"$match": {"conversation_id": conversation_id, "bucket": {"$gte": first_bucket, "$lte": last_bucket}}},
+            {"$sort": {"bucket": 1}},
+            {"$project": {"_id": 0, "messages": {"$filter": {
+                "input": "$messages",
+                "cond": {"$and": [{"$gte": ["$$this.seq", offset]}, {"$lt": ["$$this.seq", offset + limit]}]},
+            }}}},
+        ])
+        messages = [message async for bucket in cursor for message in bucket["messages"]]
+        if not messages and not bucketed and not _known_bucketed(conversation_id):
+            # Possibly not bucketed yet: slice the legacy single-document layout instead
+            return await _legacy_messages_range(conversation_id, db, offset, limit)
+        return [ChatMessageBase(**message) for message in messages[:limit]]
+    except Exception as e:
+        logger.error(f"Error fetching messages of conversation {conversation_id}: {e}")
+        raise e
+
+
+async def _legacy_messages_range(conversation_id: str, db: AsyncDatabase, offset: int, limit: int) -> List[ChatMessageBase]:
+    legacy = await db.chat_messages_with_bot.find_one(
+        {"conversation_id": conversation_id}, {"chat_messages": {"$slice": [offset, limit]}}
+    )
+    messages = legacy["chat_messages"] if legacy else []
+    return [ChatMessageBase(**message) for message in messages[:limit]]
+
+
+async def get_latest_messages(conversation_id: str, db: AsyncDatabase, limit: int) -> List[ChatMessageBase]:
+    """The last `limit` messages of a conversation, oldest first."""
+    count = await get_message_count(conversation_id, db)
+    return await get_messages_range(conversation_id, db, max(0, count - limit), min(limit, count))
   
-async def get_chat_history_with_agent(conversation_id: str, db: Database) -> List[ChatMessageInDB]:
+async def get_chat_history_with_agent(conversation_id: str, db: AsyncDatabase) -> List[ChatMessageInDB]:
     try:
         logger.info("Fetching chat history with agent")
-        chat_history = []
-        cursor = db.chat_messages_with_bot.find({"conversation_id": conversation_id})
-        if cursor:
-            logger.info("Chat history fetched successfully")
-            for doc in cursor:
-                print(doc)
-                parsed_doc = parse_chat_message_in_db(doc)
-                chat_history.append(parsed_doc)
-        # print(cursor)
+        header = await db.conversations.find_one({"conversation_id": conversation_id, **BUCKETED})
+        if header is None:
+            # Conversation predates bucketed storage
+            chat_history = []
+            async for doc in db.chat_messages_with_bot.find({"conversation_id": conversation_id}):
+                chat_history.append(parse_chat_message_in_db(doc))
             return chat_history
-        else:
-            return []
+
+        messages = await get_messages_range(conversation_id, db, 0, header.get("message_count", 0), bucketed=True)
+        logger.info("Chat history fetched successfully")
+        return [ChatMessageInDB(
+            _id=header["_id"],
+            user_id=header["user_id"],
+            conversation_id=conversation_id,
+            createdAt=header["createdAt"],
+            chat_messages=messages,
+        )]
     except Exception as e:
         logger.error(f"Error fetching chat history with agent: {e}")
         raise e
+
+
+async def get_conversation_snapshot(conversation_id: str, db: AsyncDatabase, max_messages: int) -> ConversationSnapshot:
+    """
+    What a new session needs to pick a conversation up: the stored memory summary
+    and the messages after it (at most the last max_messages), fetched from the
+    header and its trailing buckets in one round trip.
+    """
+    try:
+        cursor = await db.conversations.aggregate([
+            {"$match": {"conversation_id": conversation_id}},
+            {"$project": {
+                "_id": 0,
+                "bucketed": {"$ne": [{"$type": "$message_count"}, "missing"]},
+                "message_count": {"$ifNull": ["$message_count", 0]},
+                "memory_summary": 1,
+                "flow": 1,
+                "issue_draft": 1,
+                "first_seq": {"$max": [
+                    {"$ifNull": ["$memory_summary.through", 0]},
+                    {"$subtract": [{"$ifNull": ["$message_count", 0]}, max_messages]},
+                ]},
+            }},
+            {"$lookup": {
+                "from": "chat_message_buckets",
+                "let": {"first_bucket": {"$floor": {"$divide": ["$first_seq", BUCKET_SIZE]}}, "first_seq": "$first_seq"},
+                "pipeline": [
+                    {"$match": {"conversation_id": conversation_id, "$expr": {"$gte": ["$bucket", "$$first_bucket"]}}},
+                    {"$sort": {"bucket": 1}},
+                    {"$project": {"_id": 0, "messages": {"$filter": {
+                        "input": "$messages", "cond": {"$gte": ["$$this.seq", "$$first_seq"]},
+                    }}}},
+                ],
+                "as": "buckets",
+            }},
+        ])
+        headers = await cursor.to_list()
+        header = headers[0] if headers else {}
+        summary = header.get("memory_summary")
+        if not header.get("bucketed"):
+            # Conversation predates bucketed storage (or was never stored); its
+            # header, if any, only holds state saved alongside the legacy document
+            count = await get_message_count(conversation_id, db)
+            first_seq = min(count, max(summary.get("through", 0) if summary else 0, count - max_messages))
+            messages = await get_messages_range(conversation_id, db, first_seq, count - first_seq, bucketed=False)
+        else:
+            _remember_bucketed(conversation_id)
+            count, first_seq = header["message_count"], header["first_seq"]
+            messages = [ChatMessageBase(**message) for bucket in header["buckets"] for message in bucket["messages"]]
+        return ConversationSnapshot(
+            message_count=count,
+            first_seq=first_seq,
+            memory_summary=summary.get("facts") if summary else None,
+            flow=header.get("flow"),
+            issue_draft=header.get("issue_draft"),
+            messages=messages,
+        )
+    except Exception as e:
+        logger.error(f"Error fetching snapshot of conversation {conversation_id}: {e}")
+        raise e
+
+
+def _unless_newer(field: str, value: dict) -> dict:
+    """Pipeline expression setting `field` to `value` unless the stored one covers more messages."""
+    stored = f"${field}"
+    return {"$cond": [{"$lt": [{"$ifNull": [f"{stored}.through", -1]}, value["through"]]}, {"$literal": value}, stored]}
+
+
+def memory_summary_fields(facts: dict, through: int) -> dict:
+    """Header fields storing the facts folded from messages 0 .. through - 1."""
+    summary = {"facts": facts, "through": through, "updatedAt": datetime.now(timezone.utc)}
+    return {"memory_summary": _unless_newer("memory_summary", summary)}
+
+
+def issue_draft_fields(fields: dict, through: int) -> dict:
+    """Header fields storing the issue fields extracted from messages 0 .. through - 1."""
+    draft = {"fields": fields, "through": through, "updatedAt": datetime.now(timezone.utc)}
+    return {"issue_draft": _unless_newer("issue_draft", draft)}
+
+
+def flow_fields(flow: dict) -> dict:
+    """Header fields storing the flow state."""
+    return {"flow": {"$literal": flow}}
+
+
+async def update_conversation_header(conversation_id: str, fields: dict, db: AsyncDatabase) -> bool:
+    """
+    Applies header fields built by the *_fields helpers above (pipeline $set
+    expressions, so they can also ride on an append's header update). The header is
+    never created here, since a legacy conversation has none until its first append
+    migrates it.
+
+    Returns:
+        Whether the conversation had a header to store them on.
+    """
+    result = await db.conversations.update_one({"conversation_id": conversation_id}, [{"$set": fields}])
+    return result.matched_count > 0
+
+
+async def save_memory_summary(conversation_id: str, facts: dict, through: int, db: AsyncDatabase) -> bool:
+    """Stores the facts folded from messages 0 .. through - 1, unless a newer summary is already stored."""
+    return await update_conversation_header(conversation_id, memory_summary_fields(facts, through), db)
+
+
+async def save_issue_draft(conversation_id: str, fields: dict, through: int, db: AsyncDatabase) -> bool:
+    """Stores the issue fields extracted from messages 0 .. through - 1, unless a newer draft is already stored."""
+    return await update_conversation_header(conversation_id, issue_draft_fields(fields, through), db)
+
+
+async def save_conversation_flow(conversation_id: str, flow: dict, db: AsyncDatabase) -> bool:
+    """Stores the flow state on the conversation header, if it has one."""
+    return await update_conversation_header(conversation_id, flow_fields(flow), db)
+
+
+async def delete_conversation_messages(conversation_id: str, db: AsyncDatabase) -> int:
+    """Deletes a conversation in either layout; returns the number of documents removed."""
+    deleted = 0
+    for collection in (db.conversations, db.chat_message_buckets, db.chat_messages_with_bot):
+        result = await collection.delete_many({"conversation_id": conversation_id})
+        deleted += result.deleted_count
+    return deleted
     
-async def get_message_by_id(message_id: str, db: Database) -> Optional[dict]:
+async def get_message_by_id(message_id: str, db: AsyncDatabase) -> Optional[dict]:
     try:
         logger.info("Fetching message by id", message_id)
-        message = db.chat_messages_with_bot.find_one({"_id": ObjectId(message_id)})
+        message = await db.chat_messages_with_bot.find_one({"_id": ObjectId(message_id)})
         return message
     except Exception as e:
         logger.error("Error fetching message by id: ", e)
         raise e
     
-async def get_conversations_by_user(user_id: str, db: Database) -> List[dict]:
+def encode_listing_cursor(updated_at: datetime, conversation_id: str) -> str:
+    payload = json.dumps([updated_at.isoformat(), conversation_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_listing_cursor(cursor: str) -> Tuple[datetime, str]:
     try:
-        pipeline = [
-        {
-            "$match": {"user_id": ObjectId(user_id)}
-        },
-        {
-            "$sort": {"created_at": 1}
-        },
-        {
-            "$group": {
-                "_id": "$conversation_id",
-                "messages": {
-                    "$push": {
-                        "sender": "$sender",
-                        "message": "$message",
-                        "createdAt": "$createdAt"
-                    }
-                },
-                "startTime": {"$min": "$createdAt"}
-            }
-        },
-        {
-            "$sort": {"startTime": -1}
-        }
+        updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(updated_at), conversation_id
+    except Exception as e:
+        raise ValueError(f"Malformed cursor: {e}") from e
+
+
+async def get_legacy_conversation_summaries(user_id: str, db: AsyncDatabase, limit: int, keyset: Optional[dict] = None) -> List[ConversationSummary]:
+    """
+    Listing entries for a user's conversations still in the legacy layout, newest
+    first; those a bucketed header already lists are skipped.
+    """
+    messages = {"$ifNull": ["$chat_messages", []]}
+    pipeline = [
+        {"$match": {"user_id": ObjectId(user_id)}},
+        {"$lookup": {
+            "from": "conversations",
+            "localField": "conversation_id",
+            "foreignField": "conversation_id",
+            "pipeline": [{"$match": BUCKETED}, {"$project": {"_id": 1}}],
+            "as": "header",
+        }},
+        {"$match": {"header": []}},
+        {"$project": {
+            "_id": 0,
+            "conversation_id": 1,
+            "createdAt": 1,
+            "message_count": {"$size": messages},
+            "first_user": {"$first": {"$filter": {"input": messages, "cond": {"$eq": ["$$this.sender", MessageSender.USER.value]}}}},
+            "last": {"$last": messages},
+        }},
+        {"$set": {"updatedAt": {"$ifNull": ["$last.sentAt", {"$ifNull": ["$createdAt", "$$NOW"]}]}}},
     ]
-        logger.info("Fetching conversations by user", user_id)
-        cursor = db.chat_messages_with_bot.aggregate(pipeline)
-        
-        return [conversation for conversation in cursor]
+    if keyset:
+        pipeline.append({"$match": keyset})
+    pipeline += [{"$sort": {"updatedAt": -1, "conversation_id": -1}}, {"$limit": limit}]
+
+    summaries = []
+    async for doc in await db.chat_messages_with_bot.aggregate(pipeline):
+        ends = [message for message in (doc.get("first_user"), doc.get("last")) if message]
+        summaries.append(ConversationSummary(
+            conversation_id=doc["conversation_id"],
+            message_count=doc["message_count"],
+            createdAt=doc.get("createdAt") or doc["updatedAt"],
+            updatedAt=doc["updatedAt"],
+            **summary_fields(ends),
+        ))
+    return summaries
+
+
+async def get_conversations_by_user(user_id: str, db: AsyncDatabase, limit: int = 20, cursor: Optional[str] = None) -> PaginatedConversationResponse:
+    """
+    One page of a user's conversations, most recently active first, read straight
+    from the conversation headers with a (updatedAt, conversation_id) keyset.
+    Until LEGACY_LISTING_ENABLED is turned off, conversations not migrated yet are
+    merged in from the legacy layout.
+    """
+    try:
+        logger.info(f"Fetching conversations by user {user_id}")
+        query = {"user_id": ObjectId(user_id)}
+        keyset = None
+        if cursor:
+            updated_at, conversation_id = decode_listing_cursor(cursor)
+            keyset = {"$or": [
+                {"updatedAt": {"$lt": updated_at}},
+                {"updatedAt": updated_at, "conversation_id": {"$lt": conversation_id}},
+            ]}
+            query.update(keyset)
+        headers = db.conversations.find(
+            query,
+            {"_id": 0, "conversation_id": 1, "title": 1, "last_message": 1, "message_count": 1, "createdAt": 1, "updatedAt": 1},
+        ).sort([("updatedAt", -1), ("conversation_id", -1)]).limit(limit + 1)
+        conversations = [ConversationSummary(**header) async for header in headers]
+        if LEGACY_LISTING_ENABLED:
+            conversations += await get_legacy_conversation_summaries(user_id, db, limit + 1, keyset)
+            conversations.sort(key=lambda c: (c.updatedAt, c.conversation_id), reverse=True)
+
+        next_cursor = None
+        if len(conversations) > limit:
+            conversations = conversations[:limit]
+            last = conversations[-1]
+            next_cursor = encode_listing_cursor(last.updatedAt, last.conversation_id)
+        return PaginatedConversationResponse(conversations=conversations, next_cursor=next_cursor)
     except Exception as e:
-        logger.error("Error fetching conversations by user: ", e)
-        raise e
\ No newline at end of file
+        logger.error(f"Error fetching conversations by user: {e}")
+        raise e
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Change Feed", "app.log")
+
+
+async def follow_changes(
+    label: str,
+    open_stream: Callable[[], Awaitable],
+    on_change: Callable[[dict], Awaitable[None]],
+    resync: Callable[[], Awaitable[None]],
+    refresh_seconds: float,
+    watch: bool = True,
+    reopen_seconds: float = 1.0,
+):
+    """
+    Keeps an in-memory view in step with MongoDB.
+
+    Follows a change stream and hands every event to `on_change`. A stream that
+    ends (invalidated by a drop or rename, or its cursor closed by the server) is
+    reopened after `reopen_seconds` and a `resync`, since events may have been
+    missed in between. If the server cannot open one (e.g. Cosmos DB without change
+    feed support) or the stream dies, falls back to calling `resync` every
+    `refresh_seconds`. A callback that fails is logged and the stream is followed
+    on. Meant to run as a background task for the lifetime of the app.
+    """
+    while watch:
+        try:
+            async with await open_stream() as change_stream:
+                logger.info(f"Watching {label} for changes")
+                async for change in change_stream:
+                    try:
+                        await on_change(change)
+                    except Exception as e:
+                        # e.g. a malformed document; the view catches up on the next event or resync
+                        logger.error(f"Error applying {label} change {change.get('operationType')}: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"{label} change stream unavailable, falling back to TTL refresh: {e}")
+            break
+        logger.warning(f"{label} change stream ended, resyncing and reopening it")
+        await asyncio.sleep(reopen_seconds)
+        try:
+            await resync()
+        except Exception as e:
+            logger.error(f"Error refreshing {label}: {e}")
+
+    while True:
+        await asyncio.sleep(refresh_seconds)
+        try:
+            await resync()
+        except Exception as e:
+            logger.error(f"Error refreshing {label}: {e}")
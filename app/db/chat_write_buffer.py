@@ -0,0 +1,193 @@
+import asyncio
+import os
+import weakref
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from pymongo.asynchronous.database import AsyncDatabase
+
+from .agent_chat_queries import append_messages_to_convo, update_conversation_header
+from ..models.agent_chat_model import ChatMessageBase
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Chat Write Buffer", "app.log")
+
+# "buffered": messages are acknowledged once queued and written in batches. Until
+#             the batch is written (at most FLUSH_INTERVAL_SECONDS) a turn exists
+#             only in this process: a crash loses it, and another instance serving
+#             the same conversation does not see it. Header state derived from the
+#             messages (flow, summary, draft) rides on the same batched write while
+#             they are pending (see update_header), and the issue waits for a flush
+#             (see write_through), so stored state never refers to messages that
+#             were not written.
+# "immediate": every append waits for its write, as before the buffer existed. Use
+#             it when a lost turn matters more than a write per message.
+DURABILITY = os.environ.get("CHAT_WRITE_DURABILITY", "buffered").lower()
+# A user message and the bot reply make one turn, so by default a turn is one write
+FLUSH_MAX_MESSAGES = int(os.environ.get("CHAT_FLUSH_MAX_MESSAGES", 2))
+# Only a backstop for a turn that never gets its reply: it must outlast the agent's
+# answer, or the user message is written alone and the turn takes two writes
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("CHAT_FLUSH_INTERVAL_SECONDS", 30.0))
+# How long shutdown waits for the final flush before giving up on what is left
+SHUTDOWN_FLUSH_SECONDS = float(os.environ.get("CHAT_SHUTDOWN_FLUSH_SECONDS", 10.0))
+
+T = TypeVar("T")
+
+
+class ChatWriteBuffer:
+    """
+    Write-behind buffer for chat messages.
+
+    Messages are queued per conversation and persisted as one batched append (one
+    header $inc plus one $push $each per bucket) once FLUSH_MAX_MESSAGES are pending,
+    FLUSH_INTERVAL_SECONDS after the first one was queued, when the client
+    disconnects, before anything reads the conversation back or creates its issue,
+    and on shutdown. Header fields set while messages are pending are folded into
+    that same write.
+    Flushes of one conversation are serialized so messages keep their order; a
+    failed flush puts its messages back at the head of the queue to be retried.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabase,
+        durability: str = DURABILITY,
+        max_messages: int = FLUSH_MAX_MESSAGES,
+        interval_seconds: float = FLUSH_INTERVAL_SECONDS,
+    ):
+        self.db = db
+        self.durability = durability
+        self.max_messages = max_messages
+        self.interval_seconds = interval_seconds
+        self._pending: Dict[str, Tuple[str, List[ChatMessageBase]]] = {}
+        self._header_fields: Dict[str, dict] = {}
+        # Locks live only while someone holds or waits on them
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._timers: Dict[str, asyncio.Task] = {}
+        self._flushes: set = set()
+        self.writes = 0
+        self.messages_written = 0
+
+    def _lock(self, conversation_id: str) -> asyncio.Lock:
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = self._locks[conversation_id] = asyncio.Lock()
+        return lock
+
+    async def append(self, user_id: str, conversation_id: str, message: ChatMessageBase) -> ChatMessageBase:
+        if self.durability == "immediate":
+            async with self._lock(conversation_id):
+                await append_messages_to_convo(user_id, conversation_id, [message], self.db)
+            self.writes += 1
+            self.messages_written += 1
+            return message
+
+        _, queued = self._pending.setdefault(conversation_id, (user_id, []))
+        queued.append(message)
+        if len(queued) >= self.max_messages:
+            # Written in the background: the caller's turn does not wait on Mongo
+            self._spawn(self._flush_quietly(conversation_id))
+        elif conversation_id not in self._timers:
+            self._timers[conversation_id] = asyncio.create_task(self._flush_later(conversation_id))
+        return message
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_later(self, conversation_id: str):
+        await asyncio.sleep(self.interval_seconds)
+        self._timers.pop(conversation_id, None)
+        await self._flush_quietly(conversation_id)
+
+    async def _flush_quietly(self, conversation_id: str):
+        try:
+            await self.flush(conversation_id)
+        except Exception:
+            pass  # already logged and re-queued by flush
+
+    async def update_header(self, conversation_id: str, fields: dict) -> bool:
+        """
+        Stores header fields built by the agent_chat_queries *_fields helpers without
+        forcing a flush: while messages are pending they are written with them (and
+        the append creates the header if needed), otherwise they are set right away.
+
+        Returns:
+            Whether the fields were queued or stored; False if the conversation has no
+            header yet.
+        """
+        async with self._lock(conversation_id):
+            if self.pending_count(conversation_id):
+                self._header_fields.setdefault(conversation_id, {}).update(fields)
+                return True
+            return await update_conversation_header(conversation_id, fields, self.db)
+
+    async def write_through(self, conversation_id: str, write: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs a write outside the conversation header (the issue) once the buffered
+        messages are persisted, so it never refers to messages that were not written.
+        """
+        await self.flush(conversation_id)
+        return await write()
+
+    def pending_count(self, conversation_id: Optional[str] = None) -> int:
+        if conversation_id is not None:
+            return len(self._pending.get(conversation_id, ("", []))[1])
+        return sum(len(messages) for _, messages in self._pending.values())
+
+    async def flush(self, conversation_id: Optional[str] = None):
+        """Persists everything queued for one conversation, or for all of them."""
+        if conversation_id is None:
+            await asyncio.gather(*(self.flush(pending_id) for pending_id in list(self._pending)))
+            return
+
+        timer = self._timers.pop(conversation_id, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+
+        async with self._lock(conversation_id):
+            user_id, messages = self._pending.pop(conversation_id, (None, []))
+            header_fields = self._header_fields.pop(conversation_id, None)
+            if not messages:
+                return
+            try:
+                await append_messages_to_convo(user_id, conversation_id, messages, self.db, header_fields)
+            except Exception as e:
+                logger.error(f"Error flushing {len(messages)} message(s) of conversation {conversation_id}: {e}")
+                _, requeued = self._pending.setdefault(conversation_id, (user_id, []))
+                requeued[:0] = messages
+                if header_fields:
+                    self._header_fields[conversation_id] = header_fields
+                if conversation_id not in self._timers:
+                    self._timers[conversation_id] = asyncio.create_task(self._flush_later(conversation_id))
+                raise
+            self.writes += 1
+            self.messages_written += len(messages)
+
+    async def close(self, timeout: float = SHUTDOWN_FLUSH_SECONDS):
+        """Flushes every queued message, waiting at most `timeout`; called on shutdown."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+        async def drain():
+            if self._flushes:
+                await asyncio.gather(*self._flushes, return_exceptions=True)
+            await self.flush()
+
+        queued = self.pending_count()
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Chat write buffer still flushing after {timeout}s on shutdown, up to {queued} queued message(s) lost")
+        except Exception as e:
+            logger.error(f"Error flushing chat messages on shutdown: {e}")
+        logger.info(f"Chat write buffer closed: {self.messages_written} messages in {self.writes} writes")
+
+    def stats(self) -> dict:
+        return {
+            "durability": self.durability,
+            "pending": self.pending_count(),
+            "writes": self.writes,
+            "messages_written": self.messages_written,
+        }
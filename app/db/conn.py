@@ -1,17 +1,20 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient
 import os
 
 def db_client():
     """
-    Asynchronously creates and returns a MongoClient instance connected to the MongoDB
+    Creates and returns an AsyncMongoClient instance connected to the MongoDB
     database specified by the MONGODB_URI environment variable.
 
+    The client is backed by PyMongo's native asyncio driver, so every query awaits
+    on the event loop instead of blocking it.
+
     Returns:
-        MongoClient: A client instance connected to the specified MongoDB database.
+        AsyncMongoClient: A client instance connected to the specified MongoDB database.
     """
     try:
         MONGODB_URI = os.environ["MONGODB_URI"]
-        client = MongoClient(MONGODB_URI)
+        client = AsyncMongoClient(MONGODB_URI)
         return client
     except Exception as e:
-        return f"Error connecting to MongoDB: {e}"
\ No newline at end of file
+        return f"Error connecting to MongoDB: {e}"
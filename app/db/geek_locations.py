@@ -0,0 +1,187 @@
+import asyncio
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import PyMongoError
+
+from .change_feed import follow_changes
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Geek Locations", "app.log")
+
+# GeoJSON points derived from address.coordinates live in a collection of our own,
+# keyed by geek _id, so nothing is written into the main backend's geeks collection
+LOCATIONS_COLLECTION = "geek_locations"
+# Served by a 2dsphere index (see indexes.py)
+LOCATION_FIELD = "location"
+LOCATION_INDEX_NAME = "geek_location_2dsphere"
+GEO_MATCH_ENABLED = os.environ.get("GEO_MATCH_ENABLED", "true").lower() == "true"
+GEO_MAX_DISTANCE_KM = float(os.environ.get("GEO_MAX_DISTANCE_KM", 25))
+SYNC_REFRESH_SECONDS = float(os.environ.get("GEO_SYNC_REFRESH_SECONDS", 900))
+SYNC_WATCH_ENABLED = os.environ.get("GEO_SYNC_WATCH", "true").lower() == "true"
+
+# Mean radius used by MongoDB for spherical distances
+EARTH_RADIUS_M = 6378100.0
+
+_LATITUDE = "$address.coordinates.latitude"
+_LONGITUDE = "$address.coordinates.longitude"
+
+# Coordinates the 2dsphere index accepts; (0, 0) is treated as "not set"
+_VALID_COORDINATES = {
+    "address.coordinates.latitude": {"$type": "number", "$gte": -90, "$lte": 90},
+    "address.coordinates.longitude": {"$type": "number", "$gte": -180, "$lte": 180},
+    "$nor": [{"address.coordinates.latitude": 0, "address.coordinates.longitude": 0}],
+}
+
+
+def point_from_address(address: Optional[dict]) -> Optional[Tuple[float, float]]:
+    """
+    Returns (longitude, latitude) for an address with usable coordinates, mirroring
+    the filter used to fill geek_locations.
+    """
+    coordinates = (address or {}).get("coordinates") or {}
+    latitude, longitude = coordinates.get("latitude"), coordinates.get("longitude")
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude == 0 and longitude == 0):
+        return None
+    return float(longitude), float(latitude)
+
+
+def haversine_m(longitude: float, latitude: float, longitudes: np.ndarray, latitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distances in metres from one point to arrays of points."""
+    lon1, lat1 = np.radians(longitude), np.radians(latitude)
+    lon2, lat2 = np.radians(longitudes), np.radians(latitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def geo_point(longitude: float, latitude: float) -> dict:
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+async def sync_locations(db: AsyncDatabase, geek_id=None) -> int:
+    """
+    Brings the geek_locations point of one geek (or all of them) in line with
+    address.coordinates, writing only points that are missing or moved, and drops
+    the points of geeks that no longer have usable coordinates or no longer exist.
+
+    Returns:
+        The number of points removed.
+    """
+    scope = {"_id": geek_id} if geek_id is not None else {}
+    locations = db[LOCATIONS_COLLECTION]
+
+    cursor = await db.geeks.aggregate([
+        {"$match": {**scope, **_VALID_COORDINATES}},
+        {"$project": {LOCATION_FIELD: {"type": "Point", "coordinates": [_LONGITUDE, _LATITUDE]}}},
+        # Only points that are new or moved reach $merge, so a sync of unchanged
+        # geeks (every startup and TTL tick) writes nothing
+        {"$lookup": {
+            "from": LOCATIONS_COLLECTION,
+            "localField": "_id",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"_id": 0, LOCATION_FIELD: 1}}],
+            "as": "stored",
+        }},
+        {"$match": {"$expr": {"$ne": [{"$first": f"$stored.{LOCATION_FIELD}"}, f"${LOCATION_FIELD}"]}}},
+        {"$project": {"stored": 0}},
+        {"$merge": {"into": LOCATIONS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    await cursor.to_list()
+
+    cursor = await locations.aggregate([
+        {"$match": scope},
+        {"$lookup": {
+            "from": "geeks",
+            "localField": "_id",
+            "foreignField": "_id",
+            "pipeline": [{"$match": _VALID_COORDINATES}, {"$project": {"_id": 1}}],
+            "as": "geek",
+        }},
+        {"$match": {"geek": []}},
+        {"$project": {"_id": 1}},
+    ])
+    orphaned = [doc["_id"] for doc in await cursor.to_list()]
+    if not orphaned:
+        return 0
+    result = await locations.delete_many({"_id": {"$in": orphaned}})
+    return result.deleted_count
+
+
+class GeekLocationSync:
+    """
+    Keeps geek_locations in step with geeks.address.coordinates.
+
+    Geek profiles are written by the main backend, which knows nothing about the
+    GeoJSON points, so this runs a full sync at startup and then re-syncs single
+    geeks whenever a change stream reports an address change or a deletion (or
+    everything on a TTL when change streams are unavailable). Only
+    geek_locations is ever written.
+    """
+
+    def __init__(self, refresh_seconds: float = SYNC_REFRESH_SECONDS, watch: bool = SYNC_WATCH_ENABLED):
+        self.refresh_seconds = refresh_seconds
+        self.watch = watch
+        self._db: Optional[AsyncDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db: AsyncDatabase):
+        self._db = db
+        try:
+            removed = await sync_locations(db)
+            logger.info(f"Geek locations synced, {removed} stale points removed")
+        except PyMongoError as e:
+            logger.error(f"Error syncing geek locations: {e}")
+        self._task = asyncio.create_task(follow_changes(
+            "geek locations",
+            open_stream=lambda: self._db.geeks.watch(),
+            on_change=self._on_change,
+            resync=self._resync,
+            refresh_seconds=self.refresh_seconds,
+            watch=self.watch,
+        ))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _resync(self):
+        await sync_locations(self._db)
+
+    async def _on_change(self, change: dict):
+        operation = change.get("operationType")
+        if operation == "update":
+            description = change.get("updateDescription") or {}
+            fields = list(description.get("updatedFields") or {}) + list(description.get("removedFields") or [])
+            if not any(field == "address" or field.startswith("address.") for field in fields):
+                return
+        elif operation not in ("insert", "replace", "delete"):
+            return
+        try:
+            await sync_locations(self._db, change["documentKey"]["_id"])
+        except PyMongoError as e:
+            logger.error(f"Error syncing location of geek {change['documentKey']['_id']}: {e}")
+
+
+if __name__ == "__main__":
+    import dotenv
+
+    from .conn import db_client
+    from .indexes import ensure_indexes
+
+    async def main():
+        dotenv.load_dotenv()
+        client = db_client()
+        db = client[os.environ["DB_NAME"]]
+        await ensure_indexes(db, [LOCATIONS_COLLECTION])
+        print(f"Geek locations synced, {await sync_locations(db)} stale points removed")
+        await client.close()
+
+    asyncio.run(main())
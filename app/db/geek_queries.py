@@ -1,4 +1,4 @@
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 from bson import ObjectId
 from typing import Optional, List, Dict, Any
 
@@ -8,7 +8,7 @@ from ..logs.logger import setup_logger
 
 logger = setup_logger("GoD AI Chatbot: Geek Query", "app.log")
 
-def get_geeks(
+async def get_geeks(
     db,
     geek_type: Optional[str] = None,
     primary_skill: Optional[str] = None,
@@ -23,7 +23,7 @@ def get_geeks(
     Query Geek documents from MongoDB with optional filters.
 
     Args:
-        db: The pymongo database instance.
+        db: The async pymongo database instance.
         geek_type: Optional filter for geek type ('Individual' or 'Corporate').
         primary_skill: Optional filter for primary skill ObjectId as a string.
         brand: Optional filter for brand ObjectId as a string.
@@ -65,7 +65,7 @@ def get_geeks(
     cursor = db.geeks.find(query).skip(skip).limit(limit)
 
     results = []
-    for doc in cursor:
+    async for doc in cursor:
         geek_type = doc.get("type")
         if geek_type == "Individual":
             geek = IndividualGeek(**doc)
@@ -78,10 +78,10 @@ def get_geeks(
     return results
 
 
-def get_geek_by_id(geek_id: str, db: Database) -> Optional[GeekBase]:
+async def get_geek_by_id(geek_id: str, db: AsyncDatabase) -> Optional[GeekBase]:
     try:
         logger.info("Fetching geek by id: ", geek_id)
-        geek = db.geeks.find_one({"_id": ObjectId(geek_id)})
+        geek = await db.geeks.find_one({"_id": ObjectId(geek_id)})
         if geek:
             geek_type = geek.get("type")
             if geek_type == "Individual":
@@ -98,12 +98,12 @@ def get_geek_by_id(geek_id: str, db: Database) -> Optional[GeekBase]:
         logger.error(f"Error fetching geek by id {geek_id}: {e}")
         return None
 
-def get_all_geeks(db: Database) -> List[GeekBase]:
+async def get_all_geeks(db: AsyncDatabase) -> List[GeekBase]:
     try:
         logger.info("Fetching all geeks")
         cursor = db.geeks.find()
         results = []
-        for doc in cursor:
+        async for doc in cursor:
             geek_type = doc.get("type")
             if geek_type == "Individual":
                 geek = IndividualGeek(**doc)
@@ -117,12 +117,12 @@ def get_all_geeks(db: Database) -> List[GeekBase]:
         logger.error(f"Error fetching all geeks: {e}")
         return []
 
-def get_all_services(db: Database) -> List[CategoryBase]:
+async def get_all_services(db: AsyncDatabase) -> List[CategoryBase]:
     try:
         logger.info("Fetching all service categories")
         cursor = db.categories.find()
         results = []
-        for doc in cursor:
+        async for doc in cursor:
             results.append(CategoryBase(**doc))
         return results
     except Exception as e:
@@ -0,0 +1,247 @@
+"""
+Every index the service relies on, in one place.
+
+Indexes on the collections this service owns (OWN_COLLECTIONS) are applied
+idempotently at startup (MONGO_ENSURE_INDEXES=false to skip). Those on collections
+the main backend owns (geeks) are only applied from the command line, which can
+also check that each canonical query shape is served by an index:
+
+    python -m app.db.indexes --apply --check [--max-ratio 2.0] [--uri mongodb://localhost:27017]
+
+The check runs explain() on every shape in QUERY_SHAPES and fails (exit status 1) on
+a COLLSCAN or when keys examined per document returned exceed --max-ratio.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure
+
+from .geek_locations import LOCATION_FIELD, LOCATION_INDEX_NAME, LOCATIONS_COLLECTION
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Indexes", "app.log")
+
+ENSURE_AT_STARTUP = os.environ.get("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+MAX_KEYS_PER_RESULT = 2.0
+
+# Server error codes for an index that exists under another name or with other options
+_INDEX_CONFLICT_CODES = {85, 86}
+
+# Written by this service; everything else belongs to the main backend
+OWN_COLLECTIONS = ["conversations", "chat_message_buckets", "chat_messages_with_bot", LOCATIONS_COLLECTION, "user_issues"]
+
+
+class IndexSpec(BaseModel):
+    collection: str
+    keys: List[Tuple[str, Any]]
+    # None keeps the server's default name (e.g. "user_id_1_created_at_1"), which is
+    # what indexes created before this module existed are already called
+    name: Optional[str] = None
+    unique: bool = False
+
+    def options(self) -> Dict[str, Any]:
+        options = {}
+        if self.name:
+            options["name"] = self.name
+        if self.unique:
+            options["unique"] = True
+        return options
+
+
+INDEXES: List[IndexSpec] = [
+    # Chat storage
+    IndexSpec(collection="conversations", keys=[("conversation_id", 1)], unique=True),
+    # Serves the per-user listing, most recently active first, as one range scan
+    IndexSpec(collection="conversations", keys=[("user_id", 1), ("updatedAt", -1), ("conversation_id", -1)]),
+    IndexSpec(collection="chat_message_buckets", keys=[("conversation_id", 1), ("bucket", 1)], unique=True),
+    IndexSpec(collection="chat_messages_with_bot", keys=[("conversation_id", 1)]),
+    # Lists conversations not migrated yet (see LEGACY_LISTING_ENABLED)
+    IndexSpec(collection="chat_messages_with_bot", keys=[("user_id", 1)]),
+    # Geek matching (the catalog is answered from the in-memory snapshot)
+    IndexSpec(collection="geeks", keys=[("primarySkill", 1)]),
+    IndexSpec(collection="geeks", keys=[("secondarySkills", 1)]),
+    IndexSpec(collection="geeks", keys=[("address.city", 1)]),
+    IndexSpec(collection="geeks", keys=[("address.state", 1)]),
+    IndexSpec(collection=LOCATIONS_COLLECTION, keys=[(LOCATION_FIELD, "2dsphere")], name=LOCATION_INDEX_NAME),
+    # Issues
+    IndexSpec(collection="user_issues", keys=[("user_id", 1), ("created_at", 1)]),
+]
+
+
+async def ensure_indexes(db: AsyncDatabase, collections: Optional[Iterable[str]] = None, specs: List[IndexSpec] = INDEXES) -> List[str]:
+    """
+    Creates every index in `specs` (or only those on `collections`). Creating an
+    index that already exists is a no-op; one that exists under a different name
+    or with different options is logged and left alone.
+
+    Returns:
+        The names of the indexes created or already present.
+    """
+    wanted = set(collections) if collections is not None else None
+    applied = []
+    for spec in specs:
+        if wanted is not None and spec.collection not in wanted:
+            continue
+        try:
+            applied.append(await db[spec.collection].create_index(spec.keys, **spec.options()))
+        except OperationFailure as e:
+            if e.code in _INDEX_CONFLICT_CODES:
+                logger.warning(f"Index {spec.keys} on {spec.collection} conflicts with an existing index: {e}")
+            else:
+                logger.error(f"Error creating index {spec.keys} on {spec.collection}: {e}")
+                raise
+    logger.info(f"Ensured {len(applied)} indexes")
+    return applied
+
+
+class QueryShape(BaseModel):
+    """One hot query as the code issues it, with representative values."""
+    name: str
+    collection: str
+    filter: Optional[Dict[str, Any]] = None
+    sort: Optional[Dict[str, Any]] = None
+    pipeline: Optional[List[Dict[str, Any]]] = None
+
+    def explain_command(self) -> Dict[str, Any]:
+        if self.pipeline is not None:
+            return {"aggregate": self.collection, "pipeline": self.pipeline, "cursor": {}}
+        command = {"find": self.collection, "filter": self.filter or {}}
+        if self.sort:
+            command["sort"] = self.sort
+        return command
+
+
+_ID = ObjectId()
+_SKILLS = [ObjectId(), ObjectId()]
+
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape(name="conversation header", collection="conversations", filter={"conversation_id": "c"}),
+    QueryShape(
+        name="user conversation listing",
+        collection="conversations",
+        filter={"user_id": _ID},
+        sort={"updatedAt": -1, "conversation_id": -1},
+    ),
+    QueryShape(
+        name="message range",
+        collection="chat_message_buckets",
+        pipeline=[{"$match": {"conversation_id": "c", "bucket": {"$gte": 0, "$lte": 1}}}, {"$sort": {"bucket": 1}}],
+    ),
+    QueryShape(name="legacy conversation", collection="chat_messages_with_bot", filter={"conversation_id": "c"}),
+    QueryShape(
+        name="geeks by skill",
+        collection="geeks",
+        filter={"$or": [{"primarySkill": {"$in": _SKILLS}}, {"secondarySkills": {"$in": _SKILLS}}]},
+    ),
+    QueryShape(name="geeks by city", collection="geeks", filter={"address.city": "Pune"}),
+    QueryShape(
+        name="geeks near user",
+        collection=LOCATIONS_COLLECTION,
+        pipeline=[{"$geoNear": {
+            "near": {"type": "Point", "coordinates": [73.85, 18.52]},
+            "key": LOCATION_FIELD,
+            "distanceField": "distance",
+            "maxDistance": 25000,
+            "spherical": True,
+        }}],
+    ),
+    QueryShape(name="issues of user", collection="user_issues", filter={"user_id": _ID}, sort={"created_at": 1}),
+]
+
+
+def _walk(node: Any) -> Iterable[Dict[str, Any]]:
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+
+def plan_stages(explain: Dict[str, Any]) -> List[str]:
+    """Every plan stage name in an explain() result, whatever its server version layout."""
+    stages = []
+    for node in _walk(explain):
+        planner = node.get("queryPlanner")
+        if isinstance(planner, dict):
+            stages.extend(n["stage"] for n in _walk(planner.get("winningPlan", {})) if isinstance(n.get("stage"), str))
+    return stages
+
+
+def execution_totals(explain: Dict[str, Any]) -> Tuple[int, int]:
+    """(keys examined, documents returned) summed over every executionStats section."""
+    keys = returned = 0
+    for node in _walk(explain):
+        stats = node.get("executionStats")
+        if isinstance(stats, dict):
+            keys += stats.get("totalKeysExamined", 0)
+            returned += stats.get("nReturned", 0)
+    return keys, returned
+
+
+async def check_query_shapes(db: AsyncDatabase, max_ratio: float = MAX_KEYS_PER_RESULT, shapes: List[QueryShape] = QUERY_SHAPES) -> List[str]:
+    """
+    Explains every canonical query shape and returns a description of each one that
+    scans a collection or examines too many keys per result.
+    """
+    failures = []
+    for shape in shapes:
+        try:
+            explain = await db.command({"explain": shape.explain_command(), "verbosity": "executionStats"})
+        except OperationFailure as e:
+            failures.append(f"{shape.name}: explain failed: {e}")
+            continue
+        stages = plan_stages(explain)
+        keys, returned = execution_totals(explain)
+        ratio = keys / max(returned, 1)
+        if "COLLSCAN" in stages:
+            failures.append(f"{shape.name}: COLLSCAN on {shape.collection} (plan: {' > '.join(stages)})")
+        elif ratio > max_ratio:
+            failures.append(f"{shape.name}: {keys} keys examined for {returned} documents (ratio {ratio:.1f} > {max_ratio})")
+        else:
+            logger.info(f"{shape.name}: {' > '.join(stages)}, {keys} keys / {returned} docs")
+    return failures
+
+
+async def main():
+    import dotenv
+
+    from .conn import db_client
+
+    parser = argparse.ArgumentParser(description="Apply and verify MongoDB indexes.")
+    parser.add_argument("--apply", action="store_true", help="Create missing indexes")
+    parser.add_argument("--check", action="store_true", help="Explain every canonical query shape")
+    parser.add_argument("--max-ratio", type=float, default=MAX_KEYS_PER_RESULT, help="Allowed keys examined per document returned")
+    parser.add_argument("--uri", help="MongoDB URI (defaults to MONGODB_URI)")
+    parser.add_argument("--db", help="Database name (defaults to DB_NAME)")
+    args = parser.parse_args()
+
+    dotenv.load_dotenv()
+    if args.uri:
+        os.environ["MONGODB_URI"] = args.uri
+    client = db_client()
+    try:
+        db = client[args.db or os.environ["DB_NAME"]]
+        if args.apply or not args.check:
+            for name in await ensure_indexes(db):
+                print(f"ok  {name}")
+        if args.check:
+            failures = await check_query_shapes(db, args.max_ratio)
+            for failure in failures:
+                print(f"FAIL {failure}")
+            if failures:
+                sys.exit(1)
+            print(f"All {len(QUERY_SHAPES)} query shapes use an index")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Converts conversations from the legacy layout (one `chat_messages_with_bot` document
+per conversation holding every message) to a `conversations` header plus
+`chat_message_buckets`.
+
+    python -m app.db.migrate_chat_buckets [--batch-size N] [--delete-legacy] [--dry-run]
+
+Headers written before conversation summaries existed (no title or last message)
+are backfilled from their first and last buckets in the same run.
+
+The migration is idempotent: a conversation whose header already counts its
+messages is skipped, and a conversation whose migration was interrupted (buckets
+written, message count not yet) is rewritten from scratch, since the count is
+written last. A header holding only other state (e.g. a saved flow) is completed,
+not taken as a finished migration.
+"""
+import argparse
+import asyncio
+import os
+
+import dotenv
+from pymongo.asynchronous.database import AsyncDatabase
+
+from .agent_chat_queries import BUCKETED, migrate_conversation, summary_fields
+from .conn import db_client
+from .indexes import ensure_indexes
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Chat Bucket Migration", "app.log")
+
+
+async def migrate(db: AsyncDatabase, batch_size: int = 100, delete_legacy: bool = False, dry_run: bool = False):
+    await ensure_indexes(db, ["conversations", "chat_message_buckets"])
+    migrated = skipped = messages = 0
+    async for doc in db.chat_messages_with_bot.find({}, batch_size=batch_size):
+        if not doc.get("conversation_id"):
+            continue
+        if await db.conversations.find_one({"conversation_id": doc["conversation_id"], **BUCKETED}, {"_id": 1}):
+            skipped += 1
+            if delete_legacy and not dry_run:
+                await db.chat_messages_with_bot.delete_one({"_id": doc["_id"]})
+            continue
+        if dry_run:
+            migrated += 1
+            messages += len(doc.get("chat_messages") or [])
+            continue
+        try:
+            messages += await migrate_conversation(doc, db, delete_legacy)
+            migrated += 1
+        except Exception as e:
+            logger.error(f"Error migrating conversation {doc['conversation_id']}: {e}")
+    logger.info(f"Chat bucket migration: {migrated} conversations ({messages} messages) migrated, {skipped} already done")
+    print(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} conversations ({messages} messages), skipped {skipped}")
+
+
+async def backfill_summaries(db: AsyncDatabase, dry_run: bool = False) -> int:
+    updated = 0
+    async for header in db.conversations.find({"last_message": {"$exists": False}, **BUCKETED}, {"conversation_id": 1}):
+        conversation_id = header["conversation_id"]
+        first = await db.chat_message_buckets.find_one({"conversation_id": conversation_id}, sort=[("bucket", 1)])
+        last = await db.chat_message_buckets.find_one({"conversation_id": conversation_id}, sort=[("bucket", -1)])
+        if first is None:
+            continue
+        # The title comes from the first bucket, the preview from the last message overall
+        fields = summary_fields(first["messages"])
+        fields.update({k: v for k, v in summary_fields(last["messages"]).items() if k == "last_message"})
+        if not dry_run:
+            await db.conversations.update_one({"_id": header["_id"]}, {"$set": fields})
+        updated += 1
+    print(f"{'Would backfill' if dry_run else 'Backfilled'} {updated} conversation summaries")
+    return updated
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Move chat history into bucketed storage.")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--delete-legacy", action="store_true", help="Remove legacy documents once migrated")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    dotenv.load_dotenv()
+    client = db_client()
+    try:
+        db = client[os.environ["DB_NAME"]]
+        await migrate(db, args.batch_size, args.delete_legacy, args.dry_run)
+        await backfill_summaries(db, args.dry_run)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
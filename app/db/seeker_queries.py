@@ -1,4 +1,4 @@
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 from bson import ObjectId
 from typing import Optional, List
 
@@ -7,10 +7,10 @@ from ..logs.logger import setup_logger
 
 logger = setup_logger("GoD AI Chatbot: Seeker Query", "app.log")
 
-def get_seeker_by_id(seeker_id: str, db: Database) -> Optional[SeekerBase]:
+async def get_seeker_by_id(seeker_id: str, db: AsyncDatabase) -> Optional[SeekerBase]:
     try:
         logger.info(f"Fetching seeker by id: {seeker_id}")
-        seeker = db.users.find({"_id": ObjectId(seeker_id)})
+        seeker = await db.users.find_one({"_id": ObjectId(seeker_id)})
         if seeker:
             logger.info(f"Found seeker with id: {seeker_id}")
             return SeekerBase(**seeker)
@@ -21,12 +21,12 @@ def get_seeker_by_id(seeker_id: str, db: Database) -> Optional[SeekerBase]:
         logger.error(f"Error fetching seeker by id {seeker_id}: {e}")
         raise e
     
-def get_all_seekers(db: Database) -> List[SeekerBase]:
+async def get_all_seekers(db: AsyncDatabase) -> List[SeekerBase]:
     try:
         logger.info("Fetching all seekers")
         seekers = db.users.find()
         logger.info("Fetched all seekers")
-        return [SeekerBase(**seeker) for seeker in seekers]
+        return [SeekerBase(**seeker) async for seeker in seekers]
     except Exception as e:
         logger.error(f"Error fetching all seekers: {e}")
         raise e
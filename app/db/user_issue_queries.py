@@ -1,4 +1,4 @@
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 from typing import List, Optional
 from bson import ObjectId
 
@@ -7,23 +7,23 @@ from ..logs.logger import setup_logger
 
 logger = setup_logger("GoD AI Chatbot: User Issue Query", "app.log")
 
-async def create_user_issue(issue: UserIssueCreate, db: Database) -> UserIssueInDB:
+async def create_user_issue(issue: UserIssueCreate, db: AsyncDatabase) -> UserIssueInDB:
     try:
         issue_dict = issue.model_dump()
         logger.info("Inserting issue to DB")
-        db.user_issues.insert_one(issue_dict)
+        await db.user_issues.insert_one(issue_dict)
         logger.info("Issue inserted to DB successfully.")
         return UserIssueInDB(**issue_dict)
     except Exception as e:
         logger.error("Error inserting issue to DB: ", e)
         raise e
 
-async def get_issue_by_user(user_id: str, db: Database) -> List[UserIssueInDB]:
+async def get_issue_by_user(user_id: str, db: AsyncDatabase) -> List[UserIssueInDB]:
     try:
         issues = []
         logger.info("Fetching issues for user")
         cursor = db.user_issues.find({"user_id": ObjectId(user_id)}).sort("created_at", 1)
-        for issue in cursor:
+        async for issue in cursor:
             issues.append(UserIssueInDB(**issue))
         logger.info("Issues fetched successfully")
         return issues
@@ -31,7 +31,7 @@ async def get_issue_by_user(user_id: str, db: Database) -> List[UserIssueInDB]:
         logger.error("Error fetching issues for user: ", e)
         raise e
     
-async def get_issue_by_id(issue_id: str, db: Database) -> Optional[UserIssueInDB]:
+async def get_issue_by_id(issue_id: str, db: AsyncDatabase) -> Optional[UserIssueInDB]:
     """
     Fetches a single user issue by its ID.
     """
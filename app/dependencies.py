@@ -1,5 +1,20 @@
+from typing import Optional
+
 from fastapi import Request
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
+
+from .db.chat_write_buffer import ChatWriteBuffer
+from .utils.catalog import CatalogSnapshot
+from .utils.geek_index import GeekMatchIndex
+
+def get_database(request: Request) -> AsyncDatabase:
+    return request.app.state.database
+
+def get_catalog(request: Request) -> CatalogSnapshot:
+    return request.app.state.catalog
+
+def get_geek_index(request: Request) -> Optional[GeekMatchIndex]:
+    return request.app.state.geek_index
 
-def get_database(request: Request) -> Database:
-    return request.app.state.database
\ No newline at end of file
+def get_chat_writer(request: Request) -> ChatWriteBuffer:
+    return request.app.state.chat_writer
@@ -36,4 +36,31 @@ class ChatMessageInDB(ChatConversationCreate):
         validate_by_name = True
         from_attributes = True
             
-    
\ No newline at end of file
+    
+# --- Models for listing a user's conversations --- #
+class LastMessagePreview(BaseModel):
+    sender: Optional[MessageSender] = None
+    preview: str = ""
+    sentAt: Optional[datetime] = None
+
+class ConversationSummary(BaseModel):
+    conversation_id: str
+    title: Optional[str] = None
+    last_message: Optional[LastMessagePreview] = None
+    message_count: int = 0
+    createdAt: datetime
+    updatedAt: datetime
+
+class PaginatedConversationResponse(BaseModel):
+    conversations: list[ConversationSummary] = []
+    next_cursor: Optional[str] = Field(default=None, description="Pass back as ?cursor= for the next page.")
+
+
+# --- Models for resuming a conversation server-side --- #
+class ConversationSnapshot(BaseModel):
+    message_count: int = 0
+    first_seq: int = Field(default=0, description="Sequence number of the first message in `messages`.")
+    memory_summary: Optional[dict] = Field(default=None, description="Facts folded from messages before first_seq.")
+    flow: Optional[dict] = Field(default=None, description="Persisted ConversationFlow state.")
+    issue_draft: Optional[dict] = Field(default=None, description="Issue fields extracted so far and the messages they cover.")
+    messages: list[ChatMessageBase] = []
@@ -39,20 +39,24 @@ class CategoryDetails(BaseModel):
     category: Optional[str] = None
     subcategory: Optional[str] = None
 
-class UserIssueBase(BaseModel):
-    user_id: Optional[Union[str, PyObjectId]] = Field(..., description="The ID of the user reporting the issue.")
-    conversation_id: str = Field(..., description="The ID of the conversation where this issue was reported.")
-    status: IssueStatus = Field(default=IssueStatus.OPEN, description="The current status of the issue.")
-    modeOfService: ModeEnum = Field(default=ModeEnum.All, description="The mode of service for the issue.")
+class IssueDetails(BaseModel):
+    """The part of a user issue that is extracted from the conversation."""
+    modeOfService: Optional[ModeEnum] = Field(default=None, description="The mode of service for the issue.")
     location: Optional[str] = None
     
-    device_details: DeviceDetails = None
-    purchase_info: PurchaseInformation = None
-    problem_description: ProblemDescription = None
-    category_details: CategoryDetails = None
+    device_details: Optional[DeviceDetails] = None
+    purchase_info: Optional[PurchaseInformation] = None
+    problem_description: Optional[ProblemDescription] = None
+    category_details: Optional[CategoryDetails] = None
     
     summary: str = Field(..., description="The final summary of the issue confirmed by the agent.")
 
+class UserIssueBase(IssueDetails):
+    user_id: Optional[Union[str, PyObjectId]] = Field(..., description="The ID of the user reporting the issue.")
+    conversation_id: str = Field(..., description="The ID of the conversation where this issue was reported.")
+    status: IssueStatus = Field(default=IssueStatus.OPEN, description="The current status of the issue.")
+    modeOfService: ModeEnum = Field(default=ModeEnum.All, description="The mode of service for the issue.")
+
 class UserIssueCreate(UserIssueBase):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), alias="createdAt")
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), alias="updatedAt")
@@ -1,9 +1,18 @@
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException, Depends
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 
 from ..logs.logger import setup_logger
-from ..dependencies import get_database
-from ..db.agent_chat_queries import get_chat_history_with_agent, get_conversations_by_user
+from ..dependencies import get_chat_writer, get_database
+from ..db.chat_write_buffer import ChatWriteBuffer
+from ..db.agent_chat_queries import (
+    delete_conversation_messages,
+    get_chat_history_with_agent,
+    get_conversations_by_user,
+    get_latest_messages,
+    get_messages_range,
+)
 
 chat_router = APIRouter(
     prefix="/chat",
@@ -14,9 +23,15 @@ chat_router = APIRouter(
 logger = setup_logger("GoD AI Chatbot: Chat Route", "app.log")
 
 @chat_router.get("/chat_history/{conversation_id}")
-async def chat_history(conversation_id: str, db: Database = Depends(get_database)):
+async def chat_history(conversation_id: str, limit: Optional[int] = None, offset: Optional[int] = None, db: AsyncDatabase = Depends(get_database), chat_writer: ChatWriteBuffer = Depends(get_chat_writer)):
     try:
         logger.info("Fetching chat history")
+        await chat_writer.flush(conversation_id)
+        if limit is not None:
+            # Just a window of messages: the latest `limit`, or `limit` from `offset`
+            if offset is None:
+                return await get_latest_messages(conversation_id, db, limit)
+            return await get_messages_range(conversation_id, db, offset, limit)
         chat_history =  await get_chat_history_with_agent(conversation_id, db)
         if chat_history:
             print(chat_history)
@@ -30,27 +45,26 @@ async def chat_history(conversation_id: str, db: Database = Depends(get_database
         raise HTTPException(status_code=500, detail="Error fetching chat history")
     
 @chat_router.get("/conversation/{user_id}")
-async def get_conversation(user_id: str, db: Database = Depends(get_database)):
+async def get_conversation(user_id: str, limit: int = 20, cursor: Optional[str] = None, db: AsyncDatabase = Depends(get_database)):
     try:
         logger.info("Fetching conversation")
-        conversations = await get_conversations_by_user(user_id, db)
-        if conversations:
-            logger.info("Conversation fetched successfully")
-            print(f"{len(conversations)} conversations found for user {user_id}")
-            return conversations
+        conversations = await get_conversations_by_user(user_id, db, limit=limit, cursor=cursor)
+        if conversations.conversations:
+            logger.info(f"{len(conversations.conversations)} conversations found for user {user_id}")
         else:
-            logger.error("Conversation not found")
-            return None
+            logger.info(f"No conversations found for user {user_id}")
+        return conversations
     except Exception as e:
         logger.error(f"Error fetching conversation: {e}")
         raise HTTPException(status_code=500, detail="Error fetching conversation")
     
 @chat_router.delete("/delete/{conversation_id}")
-async def delete_conversation(conversation_id: str, db: Database = Depends(get_database)):
+async def delete_conversation(conversation_id: str, db: AsyncDatabase = Depends(get_database), chat_writer: ChatWriteBuffer = Depends(get_chat_writer)):
     try:
         logger.info(f"Deleting conversation with id: {conversation_id}")
-        result = db.chat_messages_with_bot.delete_many({"conversation_id": conversation_id})
-        if result.deleted_count > 0:
+        await chat_writer.flush(conversation_id)
+        deleted = await delete_conversation_messages(conversation_id, db)
+        if deleted > 0:
             logger.info(f"Conversation with id {conversation_id} deleted successfully")
             return {"message": f"Conversation with id {conversation_id} deleted successfully"}
         else:
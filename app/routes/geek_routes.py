@@ -1,9 +1,14 @@
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException, Depends, Body
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 
 from ..logs.logger import setup_logger
-from ..dependencies import get_database
-from ..db.geek_queries import get_all_geeks, get_geek_by_id, get_all_services
+from ..dependencies import get_database, get_catalog, get_geek_index
+from ..db.geek_queries import get_all_geeks, get_geek_by_id
+from ..utils.catalog import CatalogSnapshot
+from ..utils.geek_index import GeekMatchIndex
+from ..utils.geek_pagination import InvalidCursorError
 from ..utils.agent_tools import get_geeks_from_user_issue, get_subcategories_by_category_slug
 
 from ..models.user_issue_model import UserIssueInDB
@@ -17,10 +22,10 @@ router = APIRouter(
 logger = setup_logger("GoD AI Chatbot: Geek Route", "app.log")
 
 @router.get("/get_all_geeks")
-async def get_geeks_all(db: Database = Depends(get_database)):
+async def get_geeks_all(db: AsyncDatabase = Depends(get_database)):
     try:
         logger.info("Fetching all geeks")
-        geeks = get_all_geeks(db)
+        geeks = await get_all_geeks(db)
         print(len(geeks))
         if not geeks:
             logger.error("Geeks not found")
@@ -31,10 +36,10 @@ async def get_geeks_all(db: Database = Depends(get_database)):
         return {"error": str(e)}
     
 @router.get("/get_geek/{id}")
-async def get_geek_from_id(id: str, db: Database = Depends(get_database)):
+async def get_geek_from_id(id: str, db: AsyncDatabase = Depends(get_database)):
     try:
         logger.info(f"Fetching geek with id: {id}")
-        geek = get_geek_by_id(id, db=db)
+        geek = await get_geek_by_id(id, db=db)
         if not geek:
             logger.error("Geek not found")
             raise HTTPException(status_code=404, detail="Geek not found")
@@ -44,10 +49,10 @@ async def get_geek_from_id(id: str, db: Database = Depends(get_database)):
         return {"error": str(e)}
     
 @router.get("/get_service_categories")
-async def get_service_categories(db: Database = Depends(get_database)):
+async def get_service_categories(catalog: CatalogSnapshot = Depends(get_catalog)):
     try:
         logger.info("Fetching available service categories")
-        categories = get_all_services(db)
+        categories = catalog.categories()
         if not categories:  
             logger.error("Service categories not found")
             raise HTTPException(status_code=404, detail="Service categories not found")
@@ -57,10 +62,10 @@ async def get_service_categories(db: Database = Depends(get_database)):
         return {"error": str(e)}
     
 @router.get("/get_subcategories_from_slug/{slug}")
-async def get_slug_subcategories( slug: str, db: Database = Depends(get_database)):
+async def get_slug_subcategories( slug: str, catalog: CatalogSnapshot = Depends(get_catalog)):
     try:
         logger.info(f"Fetching subcategories from slug: {slug}")
-        subcategories = get_subcategories_by_category_slug(db=db, category_slug=slug)
+        subcategories = await get_subcategories_by_category_slug(catalog=catalog, category_slug=slug)
         if not subcategories:
             logger.error("Subcategories not found")
             raise HTTPException(status_code=404, detail="Subcategories not found")
@@ -70,10 +75,10 @@ async def get_slug_subcategories( slug: str, db: Database = Depends(get_database
         return {"error": str(e)}
     
 @router.post("/get_geeks_from_user_issue")
-async def get_geeks_from_issue(db: Database = Depends(get_database), user_issue: UserIssueInDB = Body(...), page: int = 1, page_size: int = 5):
+async def get_geeks_from_issue(db: AsyncDatabase = Depends(get_database), catalog: CatalogSnapshot = Depends(get_catalog), user_issue: UserIssueInDB = Body(...), page: int = 1, page_size: int = 5, cursor: Optional[str] = None, geek_index: Optional[GeekMatchIndex] = Depends(get_geek_index)):
     try:
         logger.info("Fetching geeks from user issue")
-        geeks = get_geeks_from_user_issue(db, user_issue, page=page, page_size=page_size)
+        geeks = await get_geeks_from_user_issue(db, catalog, user_issue, page=page, page_size=page_size, geek_index=geek_index, cursor=cursor)
         if not geeks:
             logger.error("Geeks not found")
             raise HTTPException(status_code=404, detail="Geeks not found")
@@ -81,6 +86,9 @@ async def get_geeks_from_issue(db: Database = Depends(get_database), user_issue:
             logger.info("No matching geeks found for user issue")
             raise HTTPException(status_code=404, detail="No matching geeks found for user issue")
         return geeks
+    except InvalidCursorError as e:
+        logger.warning(f"Rejected geek match cursor: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting geeks from user issue: {e}")
         return {"error": str(e)}
\ No newline at end of file
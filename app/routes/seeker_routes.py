@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends
-from pymongo.database import Database
+from pymongo.asynchronous.database import AsyncDatabase
 
 from ..logs.logger import setup_logger
 from ..dependencies import get_database
@@ -14,10 +14,10 @@ seeker_router = APIRouter(
 logger = setup_logger("GoD AI Chatbot: Seeker Route", "app.log")
 
 @seeker_router.get("/get_all_seekers")
-async def get_all_seekers(db: Database = Depends(get_database)):
+async def get_seekers_all(db: AsyncDatabase = Depends(get_database)):
     try:
         logger.info("Fetching all seekers")
-        seekers = get_all_seekers(db)
+        seekers = await get_all_seekers(db)
         if not seekers:
             logger.error("Seekers not found")
             raise HTTPException(status_code=404, detail="Seekers not found")
@@ -27,10 +27,10 @@ async def get_all_seekers(db: Database = Depends(get_database)):
         return {"error": str(e)}
     
 @seeker_router.get("/get_seeker/{id}")
-async def get_seeker_from_id(id: str, db: Database = Depends(get_database)):
+async def get_seeker_from_id(id: str, db: AsyncDatabase = Depends(get_database)):
     try:
         logger.info(f"Fetching seeker with id: {id}")
-        seeker = get_seeker_by_id(id, db=db)
+        seeker = await get_seeker_by_id(id, db=db)
         if not seeker:
             logger.error("Seeker not found")
             raise HTTPException(status_code=404, detail="Seeker not found")
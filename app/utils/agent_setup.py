@@ -1,15 +1,22 @@
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.tools import Tool
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.tools import StructuredTool
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
+from uuid import UUID
 from datetime import date
+import time
 
 from .agent_tools import get_subcategories_by_category_slug, get_brands_by_category_slug, get_categories
+from .chat_memory import TokenBudgetMemory, create_memory, history_messages
+from .llm_clients import LLMUsageRecorder, chat_model
+from .metrics import FAST_LATENCY_BUCKETS_MS, metrics
+from ..db.agent_chat_queries import memory_summary_fields, save_memory_summary
+from ..models.agent_chat_model import ConversationSnapshot, MessageSender
 
 from ..logs.logger import setup_logger
 
@@ -20,14 +27,18 @@ class AgentResponse(BaseModel):
 class CategoryInput(BaseModel):
     category_slug: str = Field(description="The lowercase slug of the main category (e.g., 'cloud-service-and-maintain').")
 
+class NoInput(BaseModel):
+    pass
+
 
 logger = setup_logger("GoD AI Chatbot: Agent Setup", "app.log")
 parser = JsonOutputParser(pydantic_object=AgentResponse)
-current_date = date.today()
+
+# Sent in place of the agent's reply when a turn fails
+ERROR_REPLY = AgentResponse(response="Sorry, something went wrong. Please send your message again.")
 
 SYS_PROMPT="""You are a technical support agent whose role is to gather comprehensive information about device issues through structured conversation. You do not troubleshoot or resolve problems - your goal is to collect detailed information about the user's device and technical issue.
 Always keep you messages crisp and short.
-Today's date is {current_date}.
 
 Information to Collect:
     Issue:
@@ -59,6 +70,7 @@ Communication Guidelines:
     Use straightforward, professional language
     Provide options only when context-appropriate (e.g., device types, frequency patterns,possible issues, yes/no questions, etc.)
     Summarize all collected information before confirmation
+    When you need both the subcategories and the brands of a category, call both tools in the same step
     Stay focused on information gathering rather than problem-solving
     
 
@@ -99,68 +111,187 @@ You will be provided with conversation history to understand what information ha
 ALWAYS respond in the same language the user uses.
 """
 
-class ChatAssistantChain:
-    def __init__(self, db_instance=None, callback_handler=None):
-        self.memory = ConversationBufferMemory(return_messages=True, memory_key="chat_history")
+# Rendered once, so every session sends a byte-identical system prompt: together with
+# the tool definitions it forms the long static prefix the provider's prompt cache
+# can reuse. Anything that varies (the date, the conversation) comes after it.
+STATIC_SYS_PROMPT = SYS_PROMPT.format(format_instructions=parser.get_format_instructions())
+DATE_PROMPT = "Today's date is {current_date}."
+
+def catalog_tools(catalog) -> List[StructuredTool]:
+    """
+    The agent's tools, as coroutines over the in-memory catalog snapshot. None of
+    them does I/O, and the executor runs the tool calls of one step concurrently
+    (e.g. get_subcategories and get_brands for the same category).
+    """
+    async def get_subcategories(category_slug: str) -> List[str]:
+        return await get_subcategories_by_category_slug(catalog=catalog, category_slug=category_slug)
+
+    async def get_brands(category_slug: str) -> List[str]:
+        return await get_brands_by_category_slug(catalog=catalog, category_slug=category_slug)
+
+    async def list_categories() -> List[str]:
+        return await get_categories(catalog=catalog)
+
+    return [
+        StructuredTool.from_function(
+            coroutine=get_subcategories,
+            name="get_subcategories",
+            description="""Retrieves a list of subcategory names for a given main category slug. 
+            Use this when you ask the user about specific sub-category of services within a broader category. 
+            The input parameter is 'category_slug'.""",
+            args_schema=CategoryInput,
+        ),
+        StructuredTool.from_function(
+            coroutine=get_brands,
+            name="get_brands",
+            description="""
+            Retrieves a list of brand names associated with a given category slug.
+            Use this when you have to ask the user about brands available for a specific product category.
+            The input parameter is 'category_slug'.
+            """,
+            args_schema=CategoryInput,
+        ),
+        StructuredTool.from_function(
+            coroutine=list_categories,
+            name="get_categories",
+            description="""
+            Retrieves a list of category names from the database.
+            Use this when you have to ask the user about categories of services.
+            """,
+            args_schema=NoInput,
+        ),
+    ]
+
+
+class ToolTimingRecorder(AsyncCallbackHandler):
+    """
+    Records the latency of every tool call it sees, and for each batch of calls
+    that overlapped (one agent step) its wall time against the sum of its calls,
+    i.e. what running them concurrently saved over running them one by one.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.latency_ms = 0.0
+        self.saved_ms = 0.0
+        self._started: Dict[UUID, tuple] = {}
+        self._batch_started: Optional[float] = None
+        self._batch_calls = 0
+        self._batch_serial_ms = 0.0
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        now = time.perf_counter()
+        if not self._started:
+            self._batch_started, self._batch_calls, self._batch_serial_ms = now, 0, 0.0
+        self._batch_calls += 1
+        self._started[run_id] = (now, (serialized or {}).get("name") or kwargs.get("name") or "unknown")
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, "ok")
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, "error")
+
+    def _finish(self, run_id: UUID, outcome: str):
+        if run_id not in self._started:
+            return
+        started, name = self._started.pop(run_id)
+        now = time.perf_counter()
+        latency_ms = (now - started) * 1000
+        self.calls += 1
+        self.latency_ms += latency_ms
+        self._batch_serial_ms += latency_ms
+        metrics.incr("tool.calls", tool=name, outcome=outcome)
+        metrics.observe("tool.latency_ms", latency_ms, FAST_LATENCY_BUCKETS_MS, tool=name)
+
+        if self._started:
+            return
+        # Last call of the batch
+        wall_ms = (now - self._batch_started) * 1000
+        metrics.observe("tool.batch_wall_ms", wall_ms, FAST_LATENCY_BUCKETS_MS, calls=str(self._batch_calls))
+        if self._batch_calls > 1:
+            saved_ms = max(self._batch_serial_ms - wall_ms, 0.0)
+            self.saved_ms += saved_ms
+            metrics.incr("tool.concurrent_batches")
+            metrics.incr("tool.concurrent_saved_ms", saved_ms)
+
+    def summary(self) -> dict:
+        return {"calls": self.calls, "latency_ms": round(self.latency_ms, 2), "saved_ms": round(self.saved_ms, 2)}
+
+
+class AgentTemplate:
+    """
+    Everything about the agent that does not change between sessions: the tools
+    bound to the catalog snapshot, the rendered prompt and the tool-calling agent
+    runnable on the shared model. Built once at startup; a session only adds its
+    memory and callbacks (see ChatAssistantChain).
+    """
+    def __init__(self, catalog=None, llm=None):
+        self.catalog = catalog
+        self.llm = llm or chat_model("o4-mini", streaming=True)
         self.output_parser = parser
-        self.callback_handler = callback_handler
-        self.llm = ChatOpenAI(
-            model="o4-mini",
-            # callbacks=[self.callback_handler] ,
-        )
-        self.db_instance = db_instance
         self.tools = []
-        if self.db_instance is not None:
-            self.tools.append(
-                Tool(
-                    name= "get_subcategories",
-                    description= f"""Retrieves a list of subcategory names for a given main category slug. 
-                    Use this when you ask the user about specific sub-category of services within a broader category. 
-                    The input parameter is 'category_slug'.""",
-                    func=lambda category_slug: get_subcategories_by_category_slug(db=db_instance, category_slug=category_slug),
-                    args_schema=CategoryInput,
-                )
-            )
-            self.tools.append(
-                Tool(
-                    name="get_brands",
-                    description="""
-                    Retrieves a list of brand names associated with a given category slug.
-                    Use this when you have to ask the user about brands available for a specific product category.
-                    The input parameter is 'category_slug'.
-                    """,
-                    func=lambda category_slug: get_brands_by_category_slug(db=db_instance, category_slug=category_slug),
-                    args_schema=CategoryInput 
-                )
-            )
-            self.tools.append(
-                Tool(
-                    name="get_categories",
-                    description="""
-                    Retrieves a list of category names from the database.
-                    Use this when you have to ask the user about categories of services.
-                    """,
-                    func=lambda: get_categories(db=db_instance),
-                )
-            )
+        if self.catalog is not None:
+            self.tools = catalog_tools(self.catalog)
         else:
-            logger.warning("No tools initialized due to missing database connection.")
+            logger.warning("No tools initialized due to missing catalog snapshot.")
             
         self.prompt = ChatPromptTemplate.from_messages(
                 [
-                    ("system", SYS_PROMPT),
+                    SystemMessage(content=STATIC_SYS_PROMPT),
                     MessagesPlaceholder(variable_name="chat_history"),
+                    ("system", DATE_PROMPT),
                     ("human", "{input}"),
                     MessagesPlaceholder(variable_name="agent_scratchpad"),
                 ]
             )
-        partial_dict = {
-            "format_instructions":self.output_parser.get_format_instructions(),
-            "current_date": current_date
-        }
-        self.partial_prompt = self.prompt.partial(**partial_dict)
+        try:
+            self.agent = create_tool_calling_agent(
+                llm=self.llm,
+                tools=self.tools,
+                prompt=self.prompt
+            )
+        except Exception as e:
+            logger.error(f"Error initializing agent: {e}")
+            raise
+        logger.info("AgentTemplate initialized.")
+
+
+class ChatAssistantChain:
+    def __init__(self, db_instance=None, callback_handler=None, catalog=None, conversation_id=None, template=None, chat_writer=None):
+        self.memory = create_memory()
+        if isinstance(self.memory, TokenBudgetMemory) and db_instance is not None and conversation_id is not None:
+            def store_summary(facts, through):
+                facts = facts.model_dump(exclude_none=True, mode="json")
+                if chat_writer is None:
+                    return save_memory_summary(conversation_id, facts, through, db_instance)
+                # Stored with the messages it covers if they are still in the write buffer
+                return chat_writer.update_header(conversation_id, memory_summary_fields(facts, through))
+            self.memory.on_fold = store_summary
+        self.callback_handler = callback_handler
+        self.db_instance = db_instance
+        self.template = template or AgentTemplate(catalog)
+        self.catalog = self.template.catalog
         self.agent_executor = self._get_chain()
-        logger.info("ChatAssistantChain initialized.")
+
+    def resume(self, snapshot: ConversationSnapshot) -> Optional[str]:
+        """
+        Rebuilds the memory from a stored conversation.
+
+        Returns:
+            The trailing user message if the conversation ended before the agent
+            replied to it (it is left out of the memory so it can be run again).
+        """
+        messages = list(snapshot.messages)
+        pending = None
+        if messages and messages[-1].sender == MessageSender.USER:
+            pending = messages.pop().message
+        if isinstance(self.memory, TokenBudgetMemory):
+            self.memory.restore(snapshot.memory_summary, history_messages(messages), snapshot.first_seq)
+        else:
+            self.memory.chat_memory.add_messages(history_messages(messages))
+        logger.info(f"Memory restored from {len(messages)} stored messages")
+        return pending
 
     def get_memory_messages(self, query):
         try:
@@ -173,32 +304,44 @@ class ChatAssistantChain:
     
     def _get_chain(self):
         try:
-            # chain = (
-            #     RunnablePassthrough.assign(history=RunnableLambda(self.get_memory_messages))|self.partial_prompt|self.llm|parser)
-            agent = create_tool_calling_agent(
-                llm=self.llm,
-                tools=self.tools,
-                prompt=self.partial_prompt
-            )
-            
-            partial_chain = AgentExecutor(
-                agent=agent,
-                tools=self.tools,
+            return AgentExecutor(
+                agent=self.template.agent,
+                tools=self.template.tools,
                 memory=self.memory,
                 # verbose=True
             )
-            chain = partial_chain 
-            logger.info("AgentExecutor chain initialized.")
-            return chain
         except Exception as e:
             logger.error(f"Error initializing chain: {e}")
             raise
         
-    async def run(self, user_input):
+    async def record_turn(self, user_input: str, reply_text: str):
+        """Adds a turn answered without the agent to its memory, so it can carry on from there."""
+        await self.memory.asave_context({"input": user_input}, {"output": reply_text})
+
+    async def run(self, user_input, hint: Optional[str] = None, input_stored: bool = True):
+        """
+        Runs one agent turn. `hint` is server-side context for this turn (e.g. the
+        category the opening message was routed to), appended to the user's input.
+        `input_stored` is False for an input that is not saved to the conversation,
+        so the memory keeps its summary aligned with the stored messages.
+
+        Returns:
+            {"response": reply JSON, "usage": ...}; on failure the reply is
+            ERROR_REPLY and "error" is set, since nothing was added to the memory.
+        """
+        if hint:
+            user_input = f"{user_input}\n\n[{hint}]"
         try:
             # agent_executor = self.get_chain()
-            response = await self.agent_executor.ainvoke({"input": user_input})
-            return {"response": response["output"]}
+            usage = LLMUsageRecorder("agent")
+            tool_timing = ToolTimingRecorder()
+            callbacks = [usage, tool_timing] + ([self.callback_handler] if self.callback_handler else [])
+            response = await self.agent_executor.ainvoke(
+                {"input": user_input, "current_date": date.today().isoformat(), "input_stored": input_stored},
+                config={"callbacks": callbacks},
+            )
+            logger.info(f"Turn usage: {usage.summary()}, tools: {tool_timing.summary()}")
+            return {"response": response["output"], "usage": usage.summary()}
         except Exception as e:
             logger.error(f"Error during chain execution: {e}")
-            return None
\ No newline at end of file
+            return {"response": ERROR_REPLY.model_dump_json(), "usage": None, "error": True}
\ No newline at end of file
@@ -1,24 +1,31 @@
 from ..logs.logger import setup_logger
-from typing import List
+from typing import Dict, List, Tuple
 from typing import Optional
 from pydantic import BaseModel
 import math
-from functools import lru_cache
+import time
 import re
 
 from bson import ObjectId
-from pymongo.database import Database
-from pymongo.errors import ConnectionFailure, OperationFailure
-
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure
+
+from .catalog import CatalogSnapshot
+from .geek_index import GeekMatchCriteria, GeekMatchIndex, service_modes
+from .geek_pagination import CACHE_DEPTH, InvalidCursorError, MatchCursor, criteria_fingerprint, match_cache, total_cache
+from .geek_ranking import MAX_CANDIDATES, RANKING_ENABLED, CandidateSet, RankedPage, rank, ranking_projection
+from ..db.geek_locations import GEO_MATCH_ENABLED, LOCATION_FIELD, LOCATIONS_COLLECTION, geo_point, point_from_address
 from ..models.user_issue_model import UserIssueInDB
 from ..models.geek_model import GeekBase
-from ..models.service_category import CategoryBase
 
 logger = setup_logger("GoD AI Chatbot: Agent Tools", "app.log")
 
 class AggregatedGeekOutput(GeekBase):
     primarySkillName: Optional[str] = None
     secondarySkillsNames: Optional[List[str]] = None
+    distance: Optional[float] = None  # metres from the user, for location-based matches
+    score: Optional[float] = None  # ranking score, higher is better
     
 class PaginatedGeekResponse(BaseModel):
     geeks: List[AggregatedGeekOutput] = []
@@ -26,96 +33,44 @@ class PaginatedGeekResponse(BaseModel):
     limit: int = 5
     page: int = 1
     pages: int
+    next_cursor: Optional[str] = None  # opaque token for the following page
     user_issue: UserIssueInDB
 
-@lru_cache(maxsize=100)
-def get_categories(db: Database) -> List[str]:
+async def get_categories(catalog: CatalogSnapshot) -> List[str]:
     """
-    Fetches a list of category names from the database.
+    Fetches a list of category names from the catalog snapshot.
 
     Returns:
         List[str]: list of category names
     """
-    try:
-        categories_collection = db.categories
-        category_docs = categories_collection.find({}, {"title": 1, "_id": 0})
-
-        category_names = [doc['title'] for doc in category_docs if 'title' in doc]
-
-        logger.info(f"Found {len(category_names)} categories")
-        return category_names
-
-    except ConnectionFailure as e:
-        logger.error(f"MongoDB connection failed: {e}")
-        raise
-    except OperationFailure as e:
-        logger.error(f"MongoDB operation failed: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        raise
+    category_names = catalog.category_titles()
+    logger.info(f"Found {len(category_names)} categories")
+    return category_names
 
 # --- Function to fetch subcategories ---
-@lru_cache(maxsize=100)
-def get_subcategories_by_category_slug(db: Database, category_slug: str) -> List[str]:
+async def get_subcategories_by_category_slug(catalog: CatalogSnapshot, category_slug: str) -> List[str]:
     """
-    Fetches a list of subcategory names associated with a given category slug from the database.
+    Fetches a list of subcategory names associated with a given category slug from the catalog snapshot.
     """
     if not category_slug:
         raise ValueError("Category slug cannot be empty.")
 
     category_slug = category_slug.lower()
 
-    try:
-        categories_collection = db.categories
-        subcategories_collection = db.subcategories
-
-        category_doc = categories_collection.find_one({"slug": category_slug})
-
-        if not category_doc:
-            logger.info(f"Category with slug '{category_slug}' not found.")
-            return []
+    if not catalog.category_by_slug(category_slug):
+        logger.info(f"Category with slug '{category_slug}' not found.")
+        return []
 
-        try:
-            category = CategoryBase.model_validate(category_doc)
-        except Exception as e:
-            logger.error(f"Error validating category document from DB: {e}")
-            return []
-
-        if not category.subCategories:
-            logger.info(f"Category '{category.title}' has no subcategories.")
-            return []
+    subcategory_names = catalog.subcategory_titles(category_slug)
+    logger.info(f"Found subcategories for '{category_slug}': {subcategory_names}")
+    return subcategory_names
 
-        subcategory_ids = category.subCategories
-        object_ids_for_query = [ObjectId(sub_id) for sub_id in subcategory_ids]
-
-        sub_category_docs = subcategories_collection.find(
-            {"_id": {"$in": object_ids_for_query}},
-            {"title": 1, "_id": 0}
-        )
-
-        subcategory_names = [doc['title'] for doc in sub_category_docs if 'title' in doc]
-
-        logger.info(f"Found subcategories for '{category_slug}': {subcategory_names}")
-        return subcategory_names
-
-    except ConnectionFailure as e:
-        logger.error(f"MongoDB connection failed: {e}")
-        raise
-    except OperationFailure as e:
-        logger.error(f"MongoDB operation failed: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        raise
-
-@lru_cache(maxsize=100)
-def get_brands_by_category_slug(db: Database, category_slug: str) -> List[str]:
+async def get_brands_by_category_slug(catalog: CatalogSnapshot, category_slug: str) -> List[str]:
     """
-    Fetches a list of brand names associated with a given category slug from the database.
+    Fetches a list of brand names associated with a given category slug from the catalog snapshot.
 
     Args:
-        db: The MongoDB database client.
+        catalog: The in-memory catalog snapshot.
         category_slug: The slug of the parent category.
 
     Returns:
@@ -123,8 +78,6 @@ def get_brands_by_category_slug(db: Database, category_slug: str) -> List[str]:
         or has no brands associated.
 
     Raises:
-        ConnectionFailure: If there's an issue connecting to the MongoDB database.
-        OperationFailure: If a database operation fails.
         ValueError: If the category_slug is empty or invalid.
     """
     if not category_slug:
@@ -132,78 +85,29 @@ def get_brands_by_category_slug(db: Database, category_slug: str) -> List[str]:
 
     category_slug = category_slug.lower()
 
-    try:
-        categories_collection = db.categories
-        brands_collection = db.brands
-
-        # 1. Find the parent category by its slug to get its ID
-        category_doc = categories_collection.find_one({"slug": category_slug})
-
-        if not category_doc:
-            logger.info(f"Category with slug '{category_slug}' not found for brand lookup.")
-            return []
-
-        # Validate and get the category's ObjectId
-        try:
-            category_id = CategoryBase.model_validate(category_doc).id
-        except Exception as e:
-            logger.error(f"Error validating category document from DB for brand lookup: {e}")
-            return []
-
-        if not category_id:
-            logger.warning(f"Category '{category_slug}' found but its ID is missing. Cannot fetch brands.")
-            return []
-
-        # 2. Find brands associated with this category ID
-        # Project only the 'name' field
-        brand_docs = brands_collection.find(
-            {"category": ObjectId(category_id)}, # Ensure ObjectId type for the query
-            {"name": 1, "_id": 0} # Project only the name field
-        )
-
-        # 3. Extract brand names
-        brand_names = [doc['name'] for doc in brand_docs if 'name' in doc]
+    if not catalog.category_by_slug(category_slug):
+        logger.info(f"Category with slug '{category_slug}' not found for brand lookup.")
+        return []
 
-        logger.info(f"Found brands for category '{category_slug}': {brand_names}")
-        return brand_names
-
-    except ConnectionFailure as e:
-        logger.error(f"MongoDB connection failed: {e}")
-        raise
-    except OperationFailure as e:
-        logger.error(f"MongoDB operation failed: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"An unexpected error occurred while fetching brands: {e}")
-        raise
+    brand_names = catalog.brand_names(category_slug)
+    logger.info(f"Found brands for category '{category_slug}': {brand_names}")
+    return brand_names
     
-def get_geeks_from_user_issue(db: Database, user_issue: UserIssueInDB, page: int = 1, page_size: int = 5) -> PaginatedGeekResponse:
+async def build_match_criteria(db: AsyncDatabase, catalog: CatalogSnapshot, user_issue: UserIssueInDB) -> GeekMatchCriteria:
     """
-    Finds suitable geeks based on a user issue.
-
-    Args:
-        user_issue: The UserIssueInDB object representing the user's problem.
-
-    Returns:
-        A list of suitable GeekBase objects.
+    Derives the geek filters for a user issue: the skill ids of its category and
+    subcategory, the user's city/state, and the tokens of a free-text location.
     """
-    
-    logger.info(f"Fetching geeks for user issue: {user_issue.id}")
-    query = {}
-    skill_ids = []
-    
-    geeks_collection = db.geeks
-    categories_collection = db.categories
-    subcategories_collection = db.subcategories
-    
+    criteria = GeekMatchCriteria()
+
     try:
-        user = db.users.find_one({"_id": ObjectId(user_issue.user_id)})
+        user = await db.users.find_one({"_id": ObjectId(user_issue.user_id)})
         logger.info("User: ", user)
         if not user:
             logger.warning(f"No user found with id {user_issue.user_id}")
     except Exception as e:
         logger.error(f"Error fetching user's address: {e}")
-        return {"error": str(e)}
+        raise
 
     # 1. Match Category and Subcategory with Skills
     if user_issue.category_details and user_issue.category_details.category:
@@ -211,69 +115,101 @@ def get_geeks_from_user_issue(db: Database, user_issue: UserIssueInDB, page: int
         subcategory_name = user_issue.category_details.subcategory
 
         # Find skill ID for the category
-        category_skill = categories_collection.find_one({"title": category_name})
+        category_skill = catalog.category_by_title(category_name)
         if category_skill:
-            skill_ids.append(ObjectId(category_skill["_id"]))
+            criteria.skill_ids.append(ObjectId(category_skill.id))
 
         # Find skill ID for the subcategory if it exists and is different from category
         if subcategory_name and subcategory_name != category_name:
-            subcategory_skill = subcategories_collection.find_one({"title": subcategory_name})
+            subcategory_skill = catalog.subcategory_by_title(subcategory_name)
             if subcategory_skill:
-                skill_ids.append(ObjectId(subcategory_skill["_id"]))
+                criteria.skill_ids.append(ObjectId(subcategory_skill["_id"]))
 
-    if skill_ids:
-        # Geeks must have either primarySkill or any of secondarySkills matching the issue's skills
-        
-        query["$or"] = [
-            {"primarySkill": {"$in": skill_ids}},
-            {"secondarySkills": {"$in": skill_ids}}
-        ]
+    # 2. Only geeks offering the mode of service the user asked for
+    mode = user_issue.modeOfService
+    criteria.modes = service_modes(mode.value if hasattr(mode, "value") else mode)
 
+    # 3. Match geeks near the user when no explicit location was given, falling
+    #    back to the user's city/state when no geek in range has coordinates
+    if user and user.get("address") and user_issue.modeOfService != "Online" and not user_issue.location:  
+        criteria.city = user["address"].get("city")
+        criteria.state = user["address"].get("state")
+        criteria.origin = point_from_address(user["address"])
+        if GEO_MATCH_ENABLED:
+            criteria.near = criteria.origin
 
-    skip_amount = (page - 1) * page_size
-    if skip_amount < 0:
-        skip_amount = 0
-    
-    #Construct pipeline
+    # 4. Every token of an explicit location must appear somewhere in the address
+    if user_issue.modeOfService != "Online" and user_issue.location:
+        criteria.location_tokens = [t for t in re.split(r'\W+', user_issue.location) if t]
+
+    return criteria
+
+
+def build_match_stages(criteria: GeekMatchCriteria) -> List[dict]:
     pipeline = []
-    
-    if query:
-        pipeline.append({"$match": query})
+    skill_query = {}
+
+    if criteria.skill_ids:
+        # Geeks must have either primarySkill or any of secondarySkills matching the issue's skills
+        skill_query = {
+            "$or": [
+                {"primarySkill": {"$in": criteria.skill_ids}},
+                {"secondarySkills": {"$in": criteria.skill_ids}}
+            ]
+        }
+    if criteria.modes:
+        skill_query["modeOfService"] = {"$in": criteria.modes}
+
+    if criteria.near:
+        # Runs on geek_locations (see match_collection), served by its 2dsphere index;
+        # the geeks in range are joined back nearest first and then filtered
+        pipeline += [
+            {"$geoNear": {
+                "near": geo_point(*criteria.near),
+                "key": LOCATION_FIELD,
+                "distanceField": "distance",
+                "maxDistance": criteria.max_distance_m,
+                "spherical": True,
+            }},
+            {"$lookup": {"from": "geeks", "localField": "_id", "foreignField": "_id", "as": "geek"}},
+            {"$unwind": "$geek"},
+            {"$replaceRoot": {"newRoot": {"$mergeObjects": ["$geek", {"distance": "$distance"}]}}},
+        ]
+    if skill_query:
+        pipeline.append({"$match": skill_query})
         
-    if user and user.get("address") and user_issue.modeOfService != "Online" and not user_issue.location:  
-        city = user["address"].get("city")
-        state = user["address"].get("state")
-
-        # Only add $match if at least one is present
-        if city or state:
-            or_conditions = []
-            if city:
-                or_conditions.append({"address.city": city})
-            if state:
-                or_conditions.append({"address.state": state})
-
-            pipeline.append({"$match": {"$or": or_conditions}})
+    # Only add $match if at least one is present
+    if criteria.near is None and (criteria.city or criteria.state):
+        or_conditions = []
+        if criteria.city:
+            or_conditions.append({"address.city": criteria.city})
+        if criteria.state:
+            or_conditions.append({"address.state": criteria.state})
+
+        pipeline.append({"$match": {"$or": or_conditions}})
             
-    if user_issue.modeOfService != "Online" and user_issue.location:
-        tokens = re.split(r'\W+', user_issue.location)
-        
-        tokens = [t for t in tokens if t]
-        
-        if tokens:
-            for token in tokens:
-                if user_issue.location:
-                    pipeline.append({"$match": {
-                        "$or": [
-                                {"address.line1": {"$regex": re.escape(token), "$options": "i"}},
-                                {"address.line2": {"$regex": re.escape(token), "$options": "i"}},
-                                {"address.city":  {"$regex": re.escape(token), "$options": "i"}},
-                                {"address.state": {"$regex": re.escape(token), "$options": "i"}},
-                                {"address.pin": {"$regex": re.escape(token), "$options": "i"}},
-                                ]
-                    }})
-        
-    pipeline.extend(
-            [
+    for token in criteria.location_tokens:
+        pipeline.append({"$match": {
+            "$or": [
+                    {"address.line1": {"$regex": re.escape(token), "$options": "i"}},
+                    {"address.line2": {"$regex": re.escape(token), "$options": "i"}},
+                    {"address.city":  {"$regex": re.escape(token), "$options": "i"}},
+                    {"address.state": {"$regex": re.escape(token), "$options": "i"}},
+                    {"address.pin": {"$regex": re.escape(token), "$options": "i"}},
+                    ]
+        }})
+
+    return pipeline
+
+
+def match_collection(db: AsyncDatabase, criteria: GeekMatchCriteria) -> AsyncCollection:
+    """The collection the stages from build_match_stages run on."""
+    return db[LOCATIONS_COLLECTION] if criteria.near else db.geeks
+
+
+def build_output_stages() -> List[dict]:
+    """Resolves skill names and projects a matched geek into its response shape."""
+    return [
         {
             '$lookup': {
                 'from': 'categories', 
@@ -308,32 +244,299 @@ def get_geeks_from_user_issue(db: Database, user_issue: UserIssueInDB, page: int
                     ]
                 }, 
                 'secondarySkillsNames': '$secondarySkillsNames.title',
+                'distance': 1,
                 "reviews": 1,
                 "services": 1,
                     "type": 1, 
             }
-        }, {
-            '$facet': {
-                'geeks': [
-                    {'$skip': skip_amount},
-                    {'$limit': page_size}
-                ],
-                'totalCount': [
-                    {'$count': 'count'}
-                ]
-            }
         }
-    ]   )
+    ]
+
+
+def build_page_stages(
+    criteria: GeekMatchCriteria,
+    skip_amount: int,
+    page_size: int,
+    after: Optional[Tuple[float, str]] = None,
+) -> List[dict]:
+    """
+    Orders matched geeks the way unranked pages are cut, (distance, _id) for a geo
+    match and _id otherwise, and selects one page: strictly after the keyset
+    `after` (distance or 0, geek id) when given, else at skip_amount.
+    """
+    stages = []
+    if after is not None:
+        distance, geek_id = after
+        if criteria.near:
+            stages.append({"$match": {"$or": [
+                {"distance": {"$gt": distance}},
+                {"distance": distance, "_id": {"$gt": ObjectId(geek_id)}},
+            ]}})
+        else:
+            stages.append({"$match": {"_id": {"$gt": ObjectId(geek_id)}}})
+    stages.append({"$sort": {"distance": 1, "_id": 1} if criteria.near else {"_id": 1}})
+    if after is None and skip_amount:
+        stages.append({"$skip": skip_amount})
+    stages.append({"$limit": page_size})
+    return stages
+
+
+async def rank_matches(
+    db: AsyncDatabase,
+    criteria: GeekMatchCriteria,
+    depth: int,
+    after: Optional[Tuple[float, str]] = None,
+) -> RankedPage:
+    """
+    Pulls up to MAX_CANDIDATES matching geeks, reduced server-side to their ranking
+    features, and ranks them in one vectorized pass, returning the best `depth`
+    (after the keyset `after`, if given).
+    """
+    timings_ms = {}
+
+    started = time.perf_counter()
+    cursor = await match_collection(db, criteria).aggregate(build_match_stages(criteria) + [
+        {"$limit": MAX_CANDIDATES},
+        {"$project": {**ranking_projection(criteria.skill_ids), "distance": 1}},
+    ])
+    docs = await cursor.to_list()
+    timings_ms["fetch"] = (time.perf_counter() - started) * 1000
+    if len(docs) == MAX_CANDIDATES:
+        logger.warning(f"Geek match hit the ranking candidate limit of {MAX_CANDIDATES}")
+
+    started = time.perf_counter()
+    candidates = CandidateSet.from_documents(docs, criteria.skill_ids)
+    timings_ms["load"] = (time.perf_counter() - started) * 1000
+
+    ranked = rank(candidates, depth, criteria.origin, criteria.max_distance_m, after=after, timings_ms=timings_ms)
+    distances = {str(doc["_id"]): doc.get("distance") for doc in docs}
+    ranked.distances = [distances.get(geek_id) for geek_id in ranked.ids]
+    logger.info(f"Ranked {ranked.total} geeks: {ranked.timings_ms}")
+    return ranked
+
+
+async def hydrate_geeks(
+    db: AsyncDatabase,
+    catalog: CatalogSnapshot,
+    ids: List[str],
+    geek_index: Optional[GeekMatchIndex] = None,
+) -> Dict[str, dict]:
+    """Full response documents for a page of ranked geek ids, by id."""
+    if geek_index is not None and geek_index.ready:
+        return geek_index.hydrate(ids, catalog)
+    cursor = await db.geeks.aggregate(
+        [{"$match": {"_id": {"$in": [ObjectId(geek_id) for geek_id in ids]}}}] + build_output_stages()
+    )
+    return {str(geek["_id"]): geek for geek in await cursor.to_list()}
+
+
+async def rank_with_fallback(
+    db: AsyncDatabase,
+    criteria: GeekMatchCriteria,
+    depth: int,
+    after: Optional[Tuple[float, str]] = None,
+    geek_index: Optional[GeekMatchIndex] = None,
+) -> RankedPage:
+    async def run(criteria: GeekMatchCriteria) -> RankedPage:
+        if geek_index is not None and geek_index.ready:
+            return geek_index.rank(criteria, depth, after)
+        return await rank_matches(db, criteria, depth, after)
+
+    return await with_geo_fallback(criteria, run, lambda ranked: ranked.total)
+
+
+async def with_geo_fallback(criteria: GeekMatchCriteria, run, total_of):
+    """
+    Runs a match near the user first and, when nothing is in range (or the geo
+    stage is unavailable), again on the user's city/state.
+    """
+    if criteria.near:
+        try:
+            result = await run(criteria)
+            if total_of(result):
+                return result
+        except OperationFailure as e:
+            logger.error(f"Geo match failed, falling back to city/state: {e}")
+        criteria = criteria.without_geo()
+    return await run(criteria)
+
+
+async def count_matches(db: AsyncDatabase, criteria: GeekMatchCriteria, geek_index: Optional[GeekMatchIndex] = None) -> int:
+    if geek_index is not None and geek_index.ready:
+        return len(geek_index.match_slots(criteria)[0])
+    cursor = await match_collection(db, criteria).aggregate(build_match_stages(criteria) + [{"$count": "count"}])
+    counts = await cursor.to_list()
+    return counts[0]["count"] if counts else 0
+
+
+async def get_unranked_page(
+    db: AsyncDatabase,
+    catalog: CatalogSnapshot,
+    user_issue: UserIssueInDB,
+    criteria: GeekMatchCriteria,
+    skip_amount: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    geek_index: Optional[GeekMatchIndex] = None,
+) -> Tuple[List[dict], int, int, Optional[str]]:
+    """
+    One unranked page of the match, used when ranking is disabled, addressed by
+    offset or by a continuation cursor resolved as a (distance, geek id) keyset.
+
+    The total, and whether the geo match or its city/state fallback answered, are
+    cached per issue, so following pages only read the page itself.
+
+    Returns:
+        The page of geeks, the total, the page's position in the match and the
+        cursor for the next page (None on the last page).
+    """
+    fingerprint = criteria_fingerprint(criteria, ranked=False)
+    resumed = MatchCursor.decode(cursor, fingerprint) if cursor else None
+    cache_key = f"{user_issue.id}:{fingerprint}"
+
+    counted = total_cache.get(cache_key)
+    if counted is None:
+        async def count(criteria: GeekMatchCriteria) -> Tuple[int, bool]:
+            return await count_matches(db, criteria, geek_index), criteria.near is not None
+
+        counted = await with_geo_fallback(criteria, count, lambda counted: counted[0])
+        total_cache.put(cache_key, counted)
+    total, geo = counted
+    if not geo:
+        criteria = criteria.without_geo()
+
+    after = resumed.keyset if resumed else None
+    if geek_index is not None and geek_index.ready:
+        geeks, _ = geek_index.search(criteria, catalog, skip_amount, page_size, after)
+    else:
+        pipeline = build_match_stages(criteria) + build_page_stages(criteria, skip_amount, page_size, after) + build_output_stages()
+        geeks = await (await match_collection(db, criteria).aggregate(pipeline)).to_list()
+
+    position = (resumed.position or 0) if resumed else skip_amount
+    next_cursor = None
+    if geeks and position + len(geeks) < total:
+        last = geeks[-1]
+        next_cursor = MatchCursor(
+            score=(last.get("distance") or 0.0) if geo else 0.0,
+            geek_id=str(last["_id"]),
+            fingerprint=fingerprint,
+            position=position + len(geeks),
+        ).encode()
+    return geeks, total, position, next_cursor
+
+
+async def get_ranked_page(
+    db: AsyncDatabase,
+    catalog: CatalogSnapshot,
+    user_issue: UserIssueInDB,
+    criteria: GeekMatchCriteria,
+    skip_amount: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    geek_index: Optional[GeekMatchIndex] = None,
+) -> Tuple[List[dict], int, int, Optional[str]]:
+    """
+    One page of the ranked match, addressed by offset or by a continuation cursor.
+
+    The top of each issue's ranking is cached with its total, so following pages
+    are a slice of the cache. Past the cached depth (or once the entry expires) a
+    cursor is resolved as a keyset, (score, geek id) strictly after the last geek
+    seen, which costs one match-and-rank pass like the first page did.
+
+    Returns:
+        The page of geeks, the total, the page's position in the ranking and the
+        cursor for the next page (None on the last page).
+    """
+    fingerprint = criteria_fingerprint(criteria)
+    after = MatchCursor.decode(cursor, fingerprint).keyset if cursor else None
+    cache_key = f"{user_issue.id}:{fingerprint}"
+
+    ranked = match_cache.get(cache_key)
+    start = None
+    if ranked is not None:
+        start = skip_amount if after is None else ranked.position_after(*after)
+        # A page running past the cached depth is only served from it if the cache holds the whole ranking
+        if start is not None and start + page_size > len(ranked.ids) and len(ranked.ids) < ranked.total:
+            start = None
+
+    if start is None:
+        if after is None:
+            ranked = await rank_with_fallback(db, criteria, max(CACHE_DEPTH, skip_amount + page_size), geek_index=geek_index)
+            match_cache.put(cache_key, ranked)
+            start = skip_amount
+        else:
+            ranked = await rank_with_fallback(db, criteria, page_size, after, geek_index)
+            start = 0
+
+    end = start + page_size
+    documents = await hydrate_geeks(db, catalog, ranked.ids[start:end], geek_index)
+    geeks = []
+    for geek_id, geek_score, distance in zip(ranked.ids[start:end], ranked.scores[start:end], ranked.distances[start:end]):
+        geek = documents.get(geek_id)
+        if geek is None:
+            continue
+        geek["score"] = geek_score
+        if distance is not None:
+            geek["distance"] = distance
+        geeks.append(geek)
+
+    position = ranked.offset + start
+    next_cursor = None
+    returned = ranked.ids[start:end]
+    if returned and position + len(returned) < ranked.total:
+        next_cursor = MatchCursor(score=ranked.scores[start + len(returned) - 1], geek_id=returned[-1], fingerprint=fingerprint).encode()
+    return geeks, ranked.total, position, next_cursor
+
+
+async def get_geeks_from_user_issue(
+    db: AsyncDatabase,
+    catalog: CatalogSnapshot,
+    user_issue: UserIssueInDB,
+    page: int = 1,
+    page_size: int = 5,
+    geek_index: Optional[GeekMatchIndex] = None,
+    cursor: Optional[str] = None,
+) -> PaginatedGeekResponse:
+    """
+    Finds suitable geeks based on a user issue.
+
+    Args:
+        catalog: The catalog snapshot used to resolve category and subcategory titles.
+        user_issue: The UserIssueInDB object representing the user's problem.
+        geek_index: Optional in-process match index; when it is ready the match is
+            answered from it instead of an aggregation on the geeks collection.
+        cursor: The next_cursor of a previous page; takes precedence over `page`.
+
+    Returns:
+        A list of suitable GeekBase objects.
+
+    Raises:
+        InvalidCursorError: If `cursor` is malformed or belongs to another search
+            (including the same search before the ranking flag was switched).
+    """
     
-    # print(pipeline)
+    logger.info(f"Fetching geeks for user issue: {user_issue.id}")
 
+    try:
+        criteria = await build_match_criteria(db, catalog, user_issue)
+    except Exception as e:
+        return {"error": str(e)}
+
+    skip_amount = (page - 1) * page_size
+    if skip_amount < 0:
+        skip_amount = 0
+
+    next_cursor = None
     try:
         # 4. Execute the query
-        data = list(geeks_collection.aggregate(pipeline)) if pipeline else geeks_collection.find(query)
-        geeks = data[0]['geeks']
-        total = data[0]['totalCount'][0]['count']
-        
+        get_page = get_ranked_page if RANKING_ENABLED else get_unranked_page
+        geeks, total, position, next_cursor = await get_page(
+            db, catalog, user_issue, criteria, skip_amount, page_size, cursor, geek_index
+        )
+        page = position // page_size + 1
         
+    except InvalidCursorError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching geeks from user issue: {e}")
         raise
@@ -345,6 +548,7 @@ def get_geeks_from_user_issue(db: Database, user_issue: UserIssueInDB, page: int
             "limit": page_size,
             "page": page,
             "pages": math.ceil(total/page_size),
+            "next_cursor": next_cursor,
             "user_issue": user_issue
         }
         suitable_geeks = PaginatedGeekResponse(**geek_data)
@@ -0,0 +1,258 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import wave
+from typing import BinaryIO, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Audio Preprocess", "app.log")
+
+PREPROCESS_ENABLED = os.environ.get("STT_PREPROCESS", "true").lower() == "true"
+TARGET_RATE = int(os.environ.get("STT_TARGET_RATE", 16000))
+VAD_WINDOW_MS = 30
+VAD_PADDING_MS = int(os.environ.get("STT_VAD_PADDING_MS", 250))
+# Windows quieter than this are always silence, whatever the noise floor
+VAD_MIN_DBFS = -50.0
+# Optional codec for the upload to Whisper; needs ffmpeg on PATH (opus, mp3 or flac)
+COMPRESS_CODEC = os.environ.get("STT_COMPRESS_CODEC", "").lower() or None
+# Processed audio beyond this spills from memory to a temporary file
+OUTPUT_SPOOL_BYTES = 8 * 1024 * 1024
+# Audio decoded at a time; memory per request stays at a few blocks whatever the clip length
+BLOCK_SECONDS = float(os.environ.get("STT_BLOCK_SECONDS", 10))
+
+_CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"], "audio.ogg", "audio/ogg"),
+    "mp3": (["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"], "audio.mp3", "audio/mpeg"),
+    "flac": (["-c:a", "flac", "-f", "flac"], "audio.flac", "audio/flac"),
+}
+
+
+def pcm_to_float(raw: bytes, sampwidth: int, nchannels: int) -> np.ndarray:
+    """
+    Decodes little-endian PCM frames into a float32 array of shape (frames, channels)
+    scaled to [-1, 1].
+    """
+    if sampwidth == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sampwidth == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif sampwidth == 3:
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = bytes_[:, 0] | (bytes_[:, 1] << 8) | (bytes_[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        samples = values.astype(np.float32) / float(1 << 23)
+    elif sampwidth == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported sample width: {sampwidth}")
+    return samples.reshape(-1, nchannels)
+
+
+class PreprocessReport(BaseModel):
+    original_bytes: int
+    processed_bytes: int
+    original_seconds: float
+    processed_seconds: float
+    codec: str = "wav"
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.processed_bytes
+
+    def summary(self) -> dict:
+        return {**self.model_dump(), "bytes_saved": self.bytes_saved}
+
+
+def window_energies(wav: wave.Wave_read, window_frames: int) -> np.ndarray:
+    """RMS energy of consecutive windows, computed a block at a time to keep memory flat."""
+    nchannels, sampwidth = wav.getnchannels(), wav.getsampwidth()
+    block_windows = 1000
+    energies = []
+    wav.rewind()
+    while True:
+        raw = wav.readframes(window_frames * block_windows)
+        if not raw:
+            break
+        samples = pcm_to_float(raw, sampwidth, nchannels).mean(axis=1)
+        usable = len(samples) - len(samples) % window_frames
+        if usable:
+            windows = samples[:usable].reshape(-1, window_frames)
+            energies.append(np.sqrt(np.mean(windows ** 2, axis=1)))
+        if usable < len(samples):
+            tail = samples[usable:]
+            energies.append(np.array([np.sqrt(np.mean(tail ** 2))], dtype=np.float32))
+    wav.rewind()
+    if not energies:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(energies)
+
+
+def speech_bounds(energies: np.ndarray, window: int, rate: int, total_frames: int) -> Tuple[int, int]:
+    """
+    Energy-based voice activity trimming of leading and trailing silence, as a
+    (start_frame, end_frame) range.
+
+    The threshold sits a little above the noise floor (the 10th percentile of window
+    energy), and never below VAD_MIN_DBFS. A short padding is kept around speech.
+    """
+    if len(energies) == 0:
+        return 0, total_frames
+    energy_db = 20 * np.log10(energies + 1e-10)
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(VAD_MIN_DBFS, noise_floor + 10.0)
+
+    voiced = np.flatnonzero(energy_db > threshold)
+    if len(voiced) == 0:
+        return 0, total_frames
+
+    padding = rate * VAD_PADDING_MS // 1000
+    start = max(0, int(voiced[0]) * window - padding)
+    end = min(total_frames, (int(voiced[-1]) + 1) * window + padding)
+    return start, end
+
+
+class Resampler:
+    """
+    Resamples a stream of blocks with a windowed-sinc low-pass followed by linear
+    interpolation, giving the same output as filtering the whole clip at once.
+    """
+    HALF_TAPS = 32
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.src_rate, self.dst_rate = src_rate, dst_rate
+        self.step = src_rate / dst_rate
+        self.kernel = None
+        if dst_rate < src_rate:
+            cutoff = 0.5 * dst_rate / src_rate * 0.9
+            taps = np.arange(-self.HALF_TAPS, self.HALF_TAPS + 1)
+            kernel = np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+            self.kernel = (kernel / kernel.sum()).astype(np.float32)
+        # Unfiltered samples the next filter outputs still need (zero padding at the start)
+        self._raw = np.zeros(self.HALF_TAPS, dtype=np.float32)
+        # Filtered samples not yet interpolated past, and the index of the first one
+        self._filtered = np.zeros(0, dtype=np.float32)
+        self._offset = 0
+        self._consumed = 0
+        self._produced = 0
+
+    def _filter(self, block: np.ndarray, final: bool) -> np.ndarray:
+        if self.kernel is None:
+            return block
+        parts = [self._raw, block]
+        if final:
+            parts.append(np.zeros(self.HALF_TAPS, dtype=np.float32))
+        data = np.concatenate(parts)
+        if len(data) < len(self.kernel):
+            self._raw = data
+            return np.zeros(0, dtype=np.float32)
+        self._raw = data[len(data) - 2 * self.HALF_TAPS:]
+        return np.convolve(data, self.kernel, mode="valid").astype(np.float32, copy=False)
+
+    def process(self, block: np.ndarray, final: bool = False) -> np.ndarray:
+        self._consumed += len(block)
+        if self.src_rate == self.dst_rate:
+            return block
+        filtered = np.concatenate([self._filtered, self._filter(block, final)])
+        if final:
+            count = int(round(self._consumed / self.src_rate * self.dst_rate)) - self._produced
+        else:
+            # Only positions with both neighbours already filtered
+            last = self._offset + len(filtered) - 1
+            count = max(0, int(np.floor(last / self.step)) + 1 - self._produced)
+        if count <= 0 or len(filtered) == 0:
+            self._filtered = filtered
+            return np.zeros(0, dtype=np.float32)
+        positions = (self._produced + np.arange(count, dtype=np.float64)) * self.step - self._offset
+        out = np.interp(positions, np.arange(len(filtered)), filtered).astype(np.float32)
+        self._produced += count
+        keep_from = max(0, min(len(filtered), int(np.floor(self._produced * self.step)) - self._offset))
+        self._filtered = filtered[keep_from:]
+        self._offset += keep_from
+        return out
+
+
+def preprocess_wav(fileobj: BinaryIO, original_bytes: int) -> Tuple[BinaryIO, PreprocessReport]:
+    """
+    Trims silence, downmixes to mono and resamples to TARGET_RATE 16-bit PCM.
+
+    Two passes over the file a block at a time: window energies to find the speech,
+    then the speech range is decoded, resampled and written out. The output is a
+    spooled temporary file, so neither the input nor the output is held as a whole.
+
+    Returns:
+        The processed WAV as a seekable file and a report of the size reduction.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_BYTES)
+    with wave.open(fileobj, "rb") as wav:
+        rate, nchannels, sampwidth = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+        total_frames = wav.getnframes()
+        original_seconds = total_frames / rate if rate else 0.0
+        window = max(1, rate * VAD_WINDOW_MS // 1000)
+        start, end = speech_bounds(window_energies(wav, window), window, rate, total_frames)
+
+        resampler = Resampler(rate, TARGET_RATE)
+        written = 0
+        block_frames = max(1, int(rate * BLOCK_SECONDS))
+        with wave.open(output, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(TARGET_RATE)
+            wav.setpos(start)
+            position = start
+            while position < end:
+                raw = wav.readframes(min(block_frames, end - position))
+                if not raw:
+                    break
+                samples = pcm_to_float(raw, sampwidth, nchannels).mean(axis=1)
+                position += len(samples)
+                resampled = resampler.process(samples, final=position >= end)
+                out.writeframes(encode_pcm16(resampled))
+                written += len(resampled)
+            if position < end:
+                # Fewer frames than the header claims
+                resampled = resampler.process(np.zeros(0, dtype=np.float32), final=True)
+                out.writeframes(encode_pcm16(resampled))
+                written += len(resampled)
+
+    processed_bytes = output.tell()
+    output.seek(0)
+    report = PreprocessReport(
+        original_bytes=original_bytes,
+        processed_bytes=processed_bytes,
+        original_seconds=round(original_seconds, 2),
+        processed_seconds=round(written / TARGET_RATE, 2),
+    )
+    return output, report
+
+
+def encode_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def compression_available(codec: Optional[str] = COMPRESS_CODEC) -> bool:
+    return bool(codec) and codec in _CODECS and shutil.which("ffmpeg") is not None
+
+
+async def compress(audio: bytes, codec: str) -> Tuple[bytes, str, str]:
+    """
+    Re-encodes a WAV clip with ffmpeg.
+
+    Returns:
+        The encoded bytes with the filename and content type to upload them under.
+    """
+    args, filename, content_type = _CODECS[codec]
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    encoded, error = await process.communicate(audio)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {codec}: {error.decode(errors='ignore').strip()}")
+    return encoded, filename, content_type
@@ -0,0 +1,188 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.asynchronous.database import AsyncDatabase
+
+from ..db.change_feed import follow_changes
+from ..models.service_category import CategoryBase
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Catalog", "app.log")
+
+CATALOG_COLLECTIONS = ["categories", "subcategories", "brands"]
+REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", 300))
+WATCH_ENABLED = os.environ.get("CATALOG_WATCH", "true").lower() == "true"
+# Bursts of catalog edits are folded into one reload
+CHANGE_DEBOUNCE_SECONDS = 1.0
+
+
+class CatalogData:
+    """One immutable, fully indexed copy of the service catalog."""
+
+    def __init__(self, categories: List[dict], subcategories: List[dict], brands: List[dict]):
+        self.categories: List[CategoryBase] = []
+        for doc in categories:
+            try:
+                self.categories.append(CategoryBase.model_validate(doc))
+            except Exception as e:
+                logger.error(f"Skipping invalid category document {doc.get('_id')}: {e}")
+        self.category_by_id: Dict[ObjectId, CategoryBase] = {c.id: c for c in self.categories}
+        self.category_by_slug: Dict[str, CategoryBase] = {c.slug: c for c in self.categories}
+        self.category_by_title: Dict[str, CategoryBase] = {c.title.casefold(): c for c in self.categories}
+
+        self.subcategory_by_id: Dict[ObjectId, dict] = {doc["_id"]: doc for doc in subcategories if doc.get("title")}
+        self.subcategory_by_title: Dict[str, dict] = {doc["title"].casefold(): doc for doc in self.subcategory_by_id.values()}
+
+        brands_by_category: Dict[ObjectId, List[str]] = {}
+        for doc in brands:
+            if doc.get("name") and doc.get("category"):
+                brands_by_category.setdefault(ObjectId(doc["category"]), []).append(doc["name"])
+
+        # Answers for the agent tools, precomputed per slug
+        self.category_titles: List[str] = [c.title for c in self.categories]
+        self.subcategory_titles_by_slug: Dict[str, List[str]] = {
+            c.slug: [
+                self.subcategory_by_id[ObjectId(sub_id)]["title"]
+                for sub_id in c.subCategories
+                if ObjectId(sub_id) in self.subcategory_by_id
+            ]
+            for c in self.categories
+        }
+        self.brand_names_by_slug: Dict[str, List[str]] = {
+            c.slug: brands_by_category.get(c.id, []) for c in self.categories
+        }
+
+
+class CatalogSnapshot:
+    """
+    In-memory snapshot of categories, subcategories and brands.
+
+    Loaded once at startup and swapped atomically on refresh, so readers always see a
+    consistent catalog and every lookup is a dict access. Refreshes are driven by a
+    change stream on the catalog collections when the server supports one, and by a
+    TTL otherwise.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, watch: bool = WATCH_ENABLED):
+        self.refresh_seconds = refresh_seconds
+        self.watch = watch
+        self.loaded_at: Optional[float] = None
+        self._data: Optional[CatalogData] = None
+        self._db: Optional[AsyncDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        # Debounced reload after change events: one task, pushed back by every new event
+        self._reload_task: Optional[asyncio.Task] = None
+        self._reload_due = 0.0
+        self._changes = 0
+        self._refresh_hooks: List[Callable[["CatalogData"], Awaitable[None]]] = []
+
+    @property
+    def data(self) -> CatalogData:
+        if self._data is None:
+            raise RuntimeError("Catalog snapshot has not been loaded yet.")
+        return self._data
+
+    def add_refresh_hook(self, hook: Callable[["CatalogData"], Awaitable[None]]):
+        """
+        Registers `hook(data)`, awaited with every newly loaded CatalogData before it
+        replaces the current one, so state derived from it is ready by the time
+        readers see it. A failing hook is logged and the data is swapped in anyway.
+        """
+        self._refresh_hooks.append(hook)
+
+    async def start(self, db: AsyncDatabase):
+        self._db = db
+        await self.refresh()
+        self._task = asyncio.create_task(self._keep_fresh())
+
+    async def stop(self):
+        for task in (self._task, self._reload_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    async def refresh(self):
+        async with self._refresh_lock:
+            started = time.perf_counter()
+            categories, subcategories, brands = await asyncio.gather(
+                self._db.categories.find({}, {"title": 1, "slug": 1, "subCategories": 1, "createdAt": 1, "updatedAt": 1}).to_list(),
+                self._db.subcategories.find({}, {"title": 1, "slug": 1, "parentCategory": 1}).to_list(),
+                self._db.brands.find({}, {"name": 1, "category": 1}).to_list(),
+            )
+            data = CatalogData(categories, subcategories, brands)
+            for hook in self._refresh_hooks:
+                try:
+                    await hook(data)
+                except Exception as e:
+                    logger.error(f"Catalog refresh hook {getattr(hook, '__name__', hook)} failed: {e}")
+            self._data = data
+            self.loaded_at = time.time()
+            logger.info(
+                f"Catalog snapshot loaded: {len(data.categories)} categories, "
+                f"{len(data.subcategory_by_id)} subcategories, {len(brands)} brands "
+                f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+            )
+
+    async def _keep_fresh(self):
+        await follow_changes(
+            "catalog",
+            open_stream=lambda: self._db.watch([{"$match": {"ns.coll": {"$in": CATALOG_COLLECTIONS}}}]),
+            on_change=self._on_change,
+            resync=self.refresh,
+            refresh_seconds=self.refresh_seconds,
+            watch=self.watch,
+        )
+
+    async def _on_change(self, change: dict):
+        # The catalog is small, so any edit simply reloads the whole snapshot
+        self._changes += 1
+        self._reload_due = time.monotonic() + CHANGE_DEBOUNCE_SECONDS
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.create_task(self._reload_when_quiet())
+
+    async def _reload_when_quiet(self):
+        """Reloads once no change has arrived for CHANGE_DEBOUNCE_SECONDS."""
+        while True:
+            while (delay := self._reload_due - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            seen = self._changes
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error reloading the catalog after a change: {e}")
+            # Changes made while reloading may not be in what was read
+            if self._changes == seen:
+                return
+
+    # --- Lookups --- #
+
+    def categories(self) -> List[CategoryBase]:
+        return self.data.categories
+
+    def category_titles(self) -> List[str]:
+        return self.data.category_titles
+
+    def category_by_slug(self, slug: str) -> Optional[CategoryBase]:
+        return self.data.category_by_slug.get(slug.lower())
+
+    def category_by_title(self, title: str) -> Optional[CategoryBase]:
+        return self.data.category_by_title.get(title.casefold())
+
+    def category_by_id(self, category_id) -> Optional[CategoryBase]:
+        return self.data.category_by_id.get(ObjectId(category_id))
+
+    def subcategory_by_title(self, title: str) -> Optional[dict]:
+        return self.data.subcategory_by_title.get(title.casefold())
+
+    def subcategory_titles(self, category_slug: str) -> List[str]:
+        return self.data.subcategory_titles_by_slug.get(category_slug.lower(), [])
+
+    def brand_names(self, category_slug: str) -> List[str]:
+        return self.data.brand_names_by_slug.get(category_slug.lower(), [])
@@ -0,0 +1,280 @@
+"""
+Routes a free-text opening message ("my laptop won't charge") to likely catalog
+categories in-process, so the agent can skip the get_categories /
+get_subcategories round trips when the match is clear.
+
+Character n-gram TF-IDF over each category's title and slug and its
+subcategories' titles, cosine-scored with NumPy. A category scores as its best
+matching document.
+
+Benchmark (accuracy and latency per message) against the live catalog, on
+labelled messages or, without --labels, on noisy variants of subcategory titles:
+
+    python -m app.utils.category_classifier [--labels messages.jsonl]
+
+where each line of messages.jsonl is {"text": ..., "category_slug": ...}.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pydantic import BaseModel
+
+from .catalog import CatalogData, CatalogSnapshot
+from .metrics import metrics
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Category Classifier", "app.log")
+
+NGRAM_RANGE = (2, 4)
+# A guess is injected into the agent's turn only when it is this similar and this far ahead of the runner-up
+CONFIDENCE_THRESHOLD = float(os.environ.get("CATEGORY_CLASSIFIER_THRESHOLD", 0.25))
+MIN_MARGIN = float(os.environ.get("CATEGORY_CLASSIFIER_MARGIN", 0.1))
+CLASSIFIER_ENABLED = os.environ.get("CATEGORY_CLASSIFIER_ENABLED", "true").lower() == "true"
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", text.casefold().replace("&", " and ")).split())
+
+
+def char_ngrams(text: str, ngram_range: Tuple[int, int] = NGRAM_RANGE) -> Counter:
+    """Character n-grams of each word, padded so word starts and ends are features too."""
+    grams = Counter()
+    low, high = ngram_range
+    for word in normalize(text).split():
+        padded = f" {word} "
+        for n in range(low, high + 1):
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class CategoryGuess(BaseModel):
+    slug: str
+    title: str
+    score: float
+    # The subcategory whose title matched best, when it was one rather than the category itself
+    subcategory: Optional[str] = None
+
+
+class CategoryClassifier:
+    def __init__(self, documents: List[Tuple[str, str, str, Optional[str]]]):
+        """
+        Args:
+            documents: (text, category slug, category title, subcategory title or None)
+        """
+        self._labels = [(slug, title, subcategory) for _, slug, title, subcategory in documents]
+        counts = [char_ngrams(text) for text, *_ in documents]
+
+        self.vocabulary: Dict[str, int] = {}
+        document_frequency = Counter()
+        for grams in counts:
+            document_frequency.update(grams.keys())
+            for gram in grams:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+        n_documents = max(len(documents), 1)
+        self.idf = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for gram, column in self.vocabulary.items():
+            self.idf[column] = math.log((1 + n_documents) / (1 + document_frequency[gram])) + 1
+
+        # Dense (documents x vocabulary) is small for a catalog; queries only gather the columns they hit
+        self.matrix = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, grams in enumerate(counts):
+            columns = [self.vocabulary[gram] for gram in grams]
+            self.matrix[row, columns] = (1 + np.log(np.fromiter(grams.values(), dtype=np.float32))) * self.idf[columns]
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.where(norms == 0, 1, norms)
+
+        slugs = sorted({slug for slug, _, _ in self._labels})
+        self._category_index = {slug: i for i, slug in enumerate(slugs)}
+        self._document_category = np.array([self._category_index[slug] for slug, _, _ in self._labels], dtype=np.int64)
+        self._titles = {slug: title for slug, title, _ in self._labels}
+        self._slugs = slugs
+
+    @classmethod
+    def from_catalog_data(cls, data: CatalogData) -> "CategoryClassifier":
+        documents = []
+        for category in data.categories:
+            documents.append((category.title, category.slug, category.title, None))
+            documents.append((category.slug.replace("-", " "), category.slug, category.title, None))
+            for sub_id in category.subCategories:
+                subcategory = data.subcategory_by_id.get(ObjectId(sub_id))
+                if subcategory is not None:
+                    documents.append((subcategory["title"], category.slug, category.title, subcategory["title"]))
+        return cls(documents)
+
+    def classify(self, text: str, top_k: int = 3) -> List[CategoryGuess]:
+        grams = char_ngrams(text)
+        columns, weights = [], []
+        for gram, count in grams.items():
+            column = self.vocabulary.get(gram)
+            if column is not None:
+                columns.append(column)
+                weights.append((1 + math.log(count)) * self.idf[column])
+        if not columns or not len(self._slugs):
+            return []
+        weights = np.asarray(weights, dtype=np.float32)
+        # N-grams no document has still count toward the query norm, so off-topic text scores low
+        unseen_idf = math.log(1 + self.matrix.shape[0]) + 1
+        unseen = sum(((1 + math.log(count)) * unseen_idf) ** 2 for gram, count in grams.items() if gram not in self.vocabulary)
+        similarities = self.matrix[:, columns] @ weights / math.sqrt(float(weights @ weights) + unseen)
+
+        best = np.full(len(self._slugs), -1.0, dtype=np.float32)
+        np.maximum.at(best, self._document_category, similarities)
+        best_document = {}
+        for row in np.argsort(-similarities):
+            best_document.setdefault(self._document_category[row], row)
+            if len(best_document) == len(self._slugs):
+                break
+        order = np.argsort(-best)[:top_k]
+        guesses = []
+        for index in order:
+            slug = self._slugs[index]
+            _, _, subcategory = self._labels[best_document[index]]
+            guesses.append(CategoryGuess(slug=slug, title=self._titles[slug], score=round(float(best[index]), 4), subcategory=subcategory))
+        return guesses
+
+    def confident(self, guesses: List[CategoryGuess]) -> Optional[CategoryGuess]:
+        if not guesses or guesses[0].score < CONFIDENCE_THRESHOLD:
+            return None
+        if len(guesses) > 1 and guesses[0].score - guesses[1].score < MIN_MARGIN:
+            return None
+        return guesses[0]
+
+
+_cached: Tuple[Optional[CatalogData], Optional[CategoryClassifier]] = (None, None)
+
+
+async def rebuild_classifier(data: CatalogData):
+    """
+    Catalog refresh hook: builds the classifier for newly loaded data in a worker
+    thread and swaps it in with the data it was built from, in one assignment.
+    """
+    global _cached
+    if not CLASSIFIER_ENABLED:
+        return
+    started = time.perf_counter()
+    classifier = await asyncio.to_thread(CategoryClassifier.from_catalog_data, data)
+    _cached = (data, classifier)
+    logger.info(f"Category classifier built in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+def classifier_for(catalog: CatalogSnapshot) -> CategoryClassifier:
+    """
+    The classifier for the catalog, kept current by rebuild_classifier as the
+    snapshot's refresh hook. It is only built here, on the calling thread, when
+    none has been built yet.
+    """
+    global _cached
+    if _cached[1] is None:
+        data = catalog.data
+        _cached = (data, CategoryClassifier.from_catalog_data(data))
+    return _cached[1]
+
+
+def category_hint(text: str, catalog: Optional[CatalogSnapshot]) -> Optional[str]:
+    """
+    A routing note for the agent when the message clearly belongs to one category,
+    carrying its slug and subcategories so no tool call is needed to continue.
+    """
+    if not CLASSIFIER_ENABLED or catalog is None:
+        return None
+    started = time.perf_counter()
+    classifier = classifier_for(catalog)
+    guess = classifier.confident(classifier.classify(text))
+    metrics.observe("classifier.latency_ms", (time.perf_counter() - started) * 1000)
+    metrics.incr("classifier.messages", outcome="hit" if guess else "miss")
+    if guess is None:
+        return None
+    logger.info(f"Opening message routed to {guess.slug} (score {guess.score})")
+    subcategories = catalog.subcategory_titles(guess.slug)
+    hint = f"Routing note: this issue most likely belongs to the category \"{guess.title}\" (category_slug: {guess.slug})."
+    if subcategories:
+        hint += f" Its subcategories are: {', '.join(subcategories)}."
+    return hint + " Use this instead of calling get_categories or get_subcategories, unless the user says otherwise."
+
+
+def benchmark_messages(data: CatalogData, seed: int = 7) -> List[Tuple[str, str]]:
+    """Noisy variants of subcategory titles (dropped word, typo, lower case), labelled with their category."""
+    rng = random.Random(seed)
+    messages = []
+    for category in data.categories:
+        for sub_id in category.subCategories:
+            subcategory = data.subcategory_by_id.get(ObjectId(sub_id))
+            if subcategory is None:
+                continue
+            words = subcategory["title"].lower().split()
+            if len(words) > 2:
+                words.pop(rng.randrange(len(words)))
+            text = " ".join(words)
+            if len(text) > 4:
+                i = rng.randrange(1, len(text) - 1)
+                text = text[:i] + text[i + 1] + text[i] + text[i + 2:]
+            messages.append((f"I need help with {text}", category.slug))
+    return messages
+
+
+async def main():
+    import dotenv
+
+    from ..db.conn import db_client
+
+    parser = argparse.ArgumentParser(description="Benchmark the category classifier against the catalog.")
+    parser.add_argument("--labels", help="JSONL file of {\"text\", \"category_slug\"}")
+    args = parser.parse_args()
+
+    dotenv.load_dotenv()
+    client = db_client()
+    catalog = CatalogSnapshot(watch=False)
+    try:
+        await catalog.start(client[os.environ["DB_NAME"]])
+        await catalog.stop()
+    finally:
+        await client.close()
+
+    started = time.perf_counter()
+    classifier = CategoryClassifier.from_catalog_data(catalog.data)
+    print(f"Built over {classifier.matrix.shape[0]} documents, {classifier.matrix.shape[1]} n-grams in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    if args.labels:
+        with open(args.labels) as f:
+            messages = [(row["text"], row["category_slug"]) for row in (json.loads(line) for line in f if line.strip())]
+    else:
+        messages = benchmark_messages(catalog.data)
+    if not messages:
+        print("No messages to score")
+        return
+
+    top1 = top3 = confident = confident_correct = 0
+    latencies = []
+    for text, expected in messages:
+        started = time.perf_counter()
+        guesses = classifier.classify(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+        slugs = [guess.slug for guess in guesses]
+        top1 += bool(slugs) and slugs[0] == expected
+        top3 += expected in slugs
+        guess = classifier.confident(guesses)
+        if guess is not None:
+            confident += 1
+            confident_correct += guess.slug == expected
+    latencies.sort()
+    n = len(messages)
+    print(f"{n} messages: top-1 {top1 / n:.1%}, top-3 {top3 / n:.1%}")
+    print(f"confident on {confident / n:.1%}, of which correct {confident_correct / max(confident, 1):.1%}")
+    print(f"latency per message: p50 {latencies[n // 2]:.3f} ms, p95 {latencies[int(n * 0.95) - 1 if n > 1 else 0]:.3f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
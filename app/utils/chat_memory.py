@@ -0,0 +1,245 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.memory import BaseMemory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .llm_clients import LLMUsageRecorder, chat_model
+from ..models.agent_chat_model import ChatMessageBase, MessageSender
+from ..models.user_issue_model import CategoryDetails, DeviceDetails, ProblemDescription, PurchaseInformation
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Chat Memory", "app.log")
+
+# "budget": recent turns verbatim plus a summary of older ones, within MEMORY_MAX_TOKENS
+# "buffer": the whole conversation, every turn (ConversationBufferMemory)
+MEMORY_MODE = os.environ.get("CHAT_MEMORY_MODE", "budget").lower()
+MEMORY_MAX_TOKENS = int(os.environ.get("CHAT_MEMORY_MAX_TOKENS", 2000))
+MEMORY_RECENT_TURNS = int(os.environ.get("CHAT_MEMORY_RECENT_TURNS", 6))
+SUMMARY_MODEL = os.environ.get("CHAT_MEMORY_SUMMARY_MODEL", "o4-mini")
+# Stored messages after the saved summary that a resumed session reloads, at most
+RESUME_MAX_MESSAGES = int(os.environ.get("CHAT_RESUME_MAX_MESSAGES", 40))
+TOKENIZER_ENCODING = "o200k_base"
+
+# Role and separator tokens the chat format adds around each message
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@functools.lru_cache(maxsize=1)
+def tokenizer():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        # The BPE file is downloaded on first use; without it fall back to an estimate
+        logger.warning(f"Tokenizer {TOKENIZER_ENCODING} unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = tokenizer()
+    if encoding is None:
+        return len(text) // 3 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    return count_tokens(content) + _MESSAGE_OVERHEAD_TOKENS
+
+
+class CollectedFacts(BaseModel):
+    """What the agent has learned in turns that are no longer sent verbatim."""
+    category_details: Optional[CategoryDetails] = None
+    device_details: Optional[DeviceDetails] = None
+    purchase_info: Optional[PurchaseInformation] = None
+    problem_description: Optional[ProblemDescription] = None
+    modeOfService: Optional[str] = None
+    location: Optional[str] = None
+    confirmed_issues: List[str] = Field(default_factory=list, description="One-line summaries of issues the user already confirmed.")
+    pending_issues: List[str] = Field(default_factory=list, description="Other issues the user mentioned that are not handled yet.")
+
+    def is_empty(self) -> bool:
+        return not self.model_dump(exclude_none=True, exclude_defaults=True)
+
+    def as_message(self) -> SystemMessage:
+        facts = json.dumps(self.model_dump(exclude_none=True, exclude_defaults=True), default=str)
+        return SystemMessage(content=f"Information collected earlier in this conversation (older messages are summarized): {facts}")
+
+
+_FOLD_INSTRUCTIONS = """
+You maintain the notes of a technical support agent that gathers information about a user's device issue.
+
+You are given the current notes and an older part of the conversation that is no longer visible to the agent. Return the notes updated with every fact stated in these messages: category, subcategory, device, purchase, problem, mode of service and location. Keep facts from the current notes unless the messages correct them. When the user confirmed an issue's summary, add it to confirmed_issues and clear the per-issue fields; list issues mentioned but not yet handled in pending_issues. If a piece of information is missing, use `null`.
+
+{format_instructions}
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def _fold_chain():
+    parser = JsonOutputParser(pydantic_object=CollectedFacts)
+    # Static instructions first and per-conversation data last, for prompt cache reuse
+    prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=_FOLD_INSTRUCTIONS.format(format_instructions=parser.get_format_instructions())),
+        ("human", "Current notes:\n{facts}\n\nOlder part of the conversation:\n---\n{transcript}\n---"),
+    ])
+    return prompt | chat_model(SUMMARY_MODEL) | parser
+
+
+def transcript_of(messages: List[BaseMessage]) -> str:
+    return "\n".join(f"{'User' if isinstance(m, HumanMessage) else 'Agent'}: {m.content}" for m in messages)
+
+
+def history_messages(messages: List[ChatMessageBase]) -> List[BaseMessage]:
+    """
+    Stored chat messages as memory messages. Only the text of agent replies is
+    stored, so it is wrapped back into the JSON shape the agent answers in.
+    """
+    return [
+        HumanMessage(content=m.message) if m.sender == MessageSender.USER
+        else AIMessage(content=json.dumps({"response": m.message, "options": None}))
+        for m in messages
+    ]
+
+
+class TokenBudgetMemory(BaseMemory):
+    """
+    Conversation memory whose prompt footprint is bounded by max_tokens.
+
+    The last recent_turns turns are kept verbatim; older turns are folded into
+    CollectedFacts by a summarizer call that runs in the background after the turn
+    is saved, so it never delays a reply. Loading never waits for a fold either:
+    turns not folded yet stay verbatim while the budget allows, and the oldest
+    messages are dropped from the prompt (not from memory) whenever the facts plus
+    the messages would exceed max_tokens.
+
+    on_fold, when set, is awaited with the new facts and the number of stored
+    messages they cover, so the summary can be stored for resuming the conversation
+    later. A turn saved with input_stored=False (an input that never reached the
+    database) does not count its input.
+    """
+    memory_key: str = "chat_history"
+    input_key: str = "input"
+    output_key: str = "output"
+    max_tokens: int = MEMORY_MAX_TOKENS
+    recent_turns: int = MEMORY_RECENT_TURNS
+    on_fold: Optional[Callable[[CollectedFacts, int], Awaitable[Any]]] = None
+
+    _messages: List[BaseMessage] = PrivateAttr(default_factory=list)
+    # Conversation sequence number of _messages[0]
+    _first_seq: int = PrivateAttr(default=0)
+    # ids of messages in _messages that have no stored counterpart
+    _unstored: set = PrivateAttr(default_factory=set)
+    _facts: CollectedFacts = PrivateAttr(default_factory=CollectedFacts)
+    _fold_task: Optional[asyncio.Task] = PrivateAttr(default=None)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    @property
+    def facts(self) -> CollectedFacts:
+        return self._facts
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Messages not folded into the facts yet, oldest first."""
+        return list(self._messages)
+
+    def prompt_messages(self) -> List[BaseMessage]:
+        header = [] if self._facts.is_empty() else [self._facts.as_message()]
+        budget = self.max_tokens - sum(message_tokens(m) for m in header)
+        kept: List[BaseMessage] = []
+        for message in reversed(self._messages):
+            cost = message_tokens(message)
+            # The latest message is always kept, even if it alone is over budget
+            if kept and cost > budget:
+                break
+            kept.append(message)
+            budget -= cost
+        return header + kept[::-1]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return {self.memory_key: self.prompt_messages()}
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return self.load_memory_variables(inputs)
+
+    def restore(self, facts: Optional[dict], messages: List[BaseMessage], first_seq: int):
+        """Replaces the memory with a stored summary and the messages that follow it."""
+        self.clear()
+        self._facts = CollectedFacts.model_validate(facts or {})
+        self._messages = list(messages)
+        self._first_seq = first_seq
+        self.schedule_fold()
+
+    def add_turn(self, user_input: str, output: str, input_stored: bool = True):
+        human = HumanMessage(content=user_input)
+        if not input_stored:
+            self._unstored.add(id(human))
+        self._messages.extend([human, AIMessage(content=output)])
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]):
+        self.add_turn(inputs[self.input_key], outputs[self.output_key], inputs.get("input_stored", True))
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]):
+        self.save_context(inputs, outputs)
+        self.schedule_fold()
+
+    def schedule_fold(self):
+        """Starts folding turns older than recent_turns, unless a fold is running."""
+        if self._fold_task is not None and not self._fold_task.done():
+            return
+        if len(self._messages) <= 2 * self.recent_turns:
+            return
+        # A fresh context, so the summarizer does not inherit the turn's callbacks
+        self._fold_task = asyncio.create_task(self.fold(), context=contextvars.Context())
+
+    async def fold(self):
+        folded = self._messages[:len(self._messages) - 2 * self.recent_turns]
+        if not folded:
+            return
+        try:
+            updated = await _fold_chain().ainvoke({
+                "facts": json.dumps(self._facts.model_dump(exclude_none=True), default=str),
+                "transcript": transcript_of(folded),
+            }, config={"callbacks": [LLMUsageRecorder("memory_fold")]})
+            self._facts = CollectedFacts.model_validate(updated)
+        except Exception as e:
+            # The turns stay verbatim (within budget) and are folded with the next batch
+            logger.error(f"Error summarizing {len(folded)} older messages: {e}")
+            return
+        # Turns saved while the summarizer ran were appended after the folded ones
+        del self._messages[:len(folded)]
+        # Only stored messages move the summary along the conversation's seq
+        self._first_seq += sum(1 for message in folded if id(message) not in self._unstored)
+        self._unstored.difference_update(id(message) for message in folded)
+        logger.info(f"Folded {len(folded)} messages into the conversation summary")
+        if self.on_fold is not None:
+            try:
+                await self.on_fold(self._facts, self._first_seq)
+            except Exception as e:
+                logger.error(f"Error storing the conversation summary: {e}")
+
+    def clear(self):
+        if self._fold_task is not None:
+            self._fold_task.cancel()
+        self._messages = []
+        self._unstored = set()
+        self._facts = CollectedFacts()
+        self._first_seq = 0
+
+
+def create_memory(mode: str = MEMORY_MODE) -> BaseMemory:
+    if mode == "buffer":
+        from langchain.memory import ConversationBufferMemory
+        return ConversationBufferMemory(return_messages=True, memory_key="chat_history", input_key="input")
+    return TokenBudgetMemory()
@@ -0,0 +1,141 @@
+import json
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from .catalog import CatalogSnapshot
+from .metrics import metrics
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Conversation Flow", "app.log")
+
+# Part of the confirmation question SYS_PROMPT prescribes
+CONFIRMATION_MARKER = "Is this summary correct?"
+SUBCATEGORY_QUESTION = "Which of these best describes the service you need?"
+BRAND_QUESTION = "What brand is your device?"
+OTHER_OPTION = "Other"
+
+
+class FlowState(str, Enum):
+    START = "start"                 # nothing asked yet; the first message is the category
+    SUBCATEGORY = "subcategory"     # subcategory options offered by the server
+    BRAND = "brand"                 # brand options offered by the server
+    AGENT = "agent"                 # the agent is asking free-form questions
+    CONFIRMATION = "confirmation"   # the agent asked the user to confirm its summary
+    DONE = "done"                   # summary confirmed, issue created
+
+
+class ConversationFlow(BaseModel):
+    """
+    Where a conversation stands in the information-gathering flow, persisted on the
+    conversation header.
+
+    Steps whose next question comes straight from the catalog (category picked ->
+    subcategory options -> brand options) are answered here without a model call;
+    every other turn goes to the agent, which sees these turns in its memory like
+    any other. The agent's replies move the flow into CONFIRMATION when it asks the
+    user to confirm its summary.
+    """
+    state: FlowState = FlowState.START
+    category_slug: Optional[str] = None
+    subcategory: Optional[str] = None
+    brand: Optional[str] = None
+    # Options offered by the last reply, so a click on one can be recognised
+    options: List[str] = []
+    llm_calls_skipped: int = 0
+
+    def _choice(self, text: str) -> Optional[str]:
+        folded = text.strip().casefold()
+        return next((option for option in self.options if option.casefold() == folded), None)
+
+    def _reply(self, state: FlowState, question: str, options: List[str]) -> dict:
+        self.state = state
+        self.options = options + [OTHER_OPTION]
+        self.llm_calls_skipped += 1
+        metrics.incr("flow.llm_calls_skipped", step=state.value)
+        logger.info(f"Answered the {state.value} step from the catalog")
+        return {"response": question, "options": self.options}
+
+    def _after_category(self, catalog: CatalogSnapshot) -> Optional[dict]:
+        subcategories = catalog.subcategory_titles(self.category_slug)
+        if subcategories:
+            return self._reply(FlowState.SUBCATEGORY, SUBCATEGORY_QUESTION, subcategories)
+        return self._after_subcategory(catalog)
+
+    def _after_subcategory(self, catalog: CatalogSnapshot) -> Optional[dict]:
+        brands = catalog.brand_names(self.category_slug)
+        if brands:
+            return self._reply(FlowState.BRAND, BRAND_QUESTION, brands)
+        return self._hand_to_agent()
+
+    def _hand_to_agent(self) -> None:
+        self.state = FlowState.AGENT
+        self.options = []
+        return None
+
+    def answer(self, text: str, catalog: Optional[CatalogSnapshot]) -> Optional[dict]:
+        """
+        The server's reply ({"response", "options"}) if this message completes a
+        structured step, or None to hand the turn to the agent.
+        """
+        if catalog is None or self.state in (FlowState.CONFIRMATION, FlowState.DONE):
+            return None
+        choice = self._choice(text)
+
+        if self.state == FlowState.SUBCATEGORY:
+            if choice is None or choice == OTHER_OPTION:
+                return self._hand_to_agent()
+            self.subcategory = choice
+            return self._after_subcategory(catalog)
+
+        if self.state == FlowState.BRAND:
+            self.brand = choice if choice not in (None, OTHER_OPTION) else None
+            return self._hand_to_agent()
+
+        # START, or the agent offered categories again for a new issue
+        if self.state == FlowState.START or choice is not None:
+            category = catalog.category_by_title(text.strip())
+            if category is not None:
+                self.category_slug, self.subcategory, self.brand = category.slug, None, None
+                return self._after_category(catalog)
+        return self._hand_to_agent()
+
+    def observe_agent_reply(self, reply_text: str):
+        """Tracks the options and confirmation question of the agent's reply."""
+        try:
+            reply = json.loads(reply_text)
+        except (TypeError, ValueError):
+            reply = None
+        if not isinstance(reply, dict):
+            reply = {"response": reply_text}
+        self.options = [str(option) for option in reply.get("options") or []]
+        asked_to_confirm = CONFIRMATION_MARKER in str(reply.get("response", ""))
+        self.state = FlowState.CONFIRMATION if asked_to_confirm else FlowState.AGENT
+
+    def confirms(self, text: str) -> bool:
+        """Whether this message confirms the agent's summary."""
+        return self.state == FlowState.CONFIRMATION and "yes" in text.lower()
+
+    def persisted(self) -> dict:
+        """
+        The stored form. Options are only kept for steps the server asked; the
+        agent's change every turn and are not needed to resume.
+        """
+        data = self.model_dump(mode="json")
+        if self.state not in (FlowState.SUBCATEGORY, FlowState.BRAND):
+            data["options"] = []
+        return data
+
+    @classmethod
+    def resumed(cls, stored: Optional[dict], last_reply: Optional[str], message_count: int) -> "ConversationFlow":
+        if stored:
+            return cls.model_validate(stored)
+        flow = cls()
+        if message_count:
+            # Conversation from before the flow was tracked: the agent has it
+            if last_reply:
+                flow.observe_agent_reply(last_reply)
+            else:
+                flow._hand_to_agent()
+        return flow
@@ -0,0 +1,343 @@
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo.asynchronous.database import AsyncDatabase
+
+from .catalog import CatalogSnapshot
+from ..db.change_feed import follow_changes
+from .geek_ranking import FEATURE_COLUMNS, LATITUDE, LONGITUDE, CandidateSet, RankedPage, document_features, rank
+from ..db.geek_locations import GEO_MAX_DISTANCE_KM, haversine_m
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Geek Index", "app.log")
+
+MATCH_ENGINE = os.environ.get("GEEK_MATCH_ENGINE", "mongo").lower()
+REFRESH_SECONDS = float(os.environ.get("GEEK_INDEX_REFRESH_SECONDS", 300))
+WATCH_ENABLED = os.environ.get("GEEK_INDEX_WATCH", "true").lower() == "true"
+
+# Fields returned to clients, mirroring the $project stage of the aggregation
+OUTPUT_FIELDS = [
+    "_id", "fullName", "authProvider", "mobile", "isEmailVerified", "isPhoneVerified",
+    "profileImage", "description", "modeOfService", "availability", "rateCard",
+    "primarySkill", "reviews", "services", "type",
+]
+# Extra fields needed only for matching
+INDEX_FIELDS = ["secondarySkills", "address", "yoe", "profileCompletedPercentage"]
+ADDRESS_SEARCH_FIELDS = ["line1", "line2", "city", "state", "pin"]
+
+
+class GeekMatchCriteria(BaseModel):
+    """
+    Filters derived from a user issue, shared by every matching engine.
+
+    When `near` (longitude, latitude) is set, only geeks within `max_distance_m` match
+    and city/state are ignored; they are only the fallback for when no geek in range
+    has coordinates. `origin` is the user's own point, used to rank by distance.
+    `modes` are the geek modeOfService values that can serve the user (any if empty).
+    """
+    skill_ids: List[ObjectId] = []
+    modes: List[str] = []
+    city: Optional[str] = None
+    state: Optional[str] = None
+    location_tokens: List[str] = []
+    near: Optional[Tuple[float, float]] = None
+    origin: Optional[Tuple[float, float]] = None
+    max_distance_m: float = GEO_MAX_DISTANCE_KM * 1000
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def without_geo(self) -> "GeekMatchCriteria":
+        return self.model_copy(update={"near": None})
+
+
+def service_modes(user_mode: Optional[str]) -> List[str]:
+    """Geek modes that serve a user asking for `user_mode`: that mode, or geeks offering all."""
+    if not user_mode or user_mode == "All":
+        return []
+    return [user_mode, "All"]
+
+
+def bit_positions(bits: int) -> np.ndarray:
+    """Indices of the set bits of a Python int bitset, in ascending order."""
+    if not bits:
+        return np.zeros(0, dtype=np.int64)
+    raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder="little"))
+
+
+class GeekMatchIndex:
+    """
+    In-process inverted indexes over the geeks collection.
+
+    Every geek gets a dense slot number (slots freed by deletes are reused) and each index
+    maps a key to the set of slots that have it, stored as a Python int bitset:
+    skill id -> geeks with it as primary or secondary skill, city -> geeks, state ->
+    geeks and modeOfService -> geeks. A match is a handful of bitwise ANDs/ORs.
+    The indexes are updated one document at a time from a change stream, or rebuilt
+    on a TTL when change streams are unavailable.
+    """
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, watch: bool = WATCH_ENABLED):
+        self.refresh_seconds = refresh_seconds
+        self.watch = watch
+        self.ready = False
+        self._db: Optional[AsyncDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reset()
+
+    def _reset(self):
+        self._docs: List[Optional[dict]] = []
+        self._keys: List[Optional[List[Tuple[Dict, object]]]] = []
+        self._address_text: List[str] = []
+        # Ranking features per slot, see geek_ranking.FEATURE_COLUMNS
+        self._features = np.full((len(FEATURE_COLUMNS), 1024), np.nan)
+        self._ids = np.full(1024, "", dtype="<U24")
+        self._slot_by_id: Dict[ObjectId, int] = {}
+        self._free_slots: List[int] = []
+        self._live = 0
+        self._by_skill: Dict[ObjectId, int] = {}
+        self._by_primary: Dict[ObjectId, int] = {}
+        self._by_city: Dict[str, int] = {}
+        self._by_state: Dict[str, int] = {}
+        self._by_mode: Dict[str, int] = {}
+
+    async def start(self, db: AsyncDatabase):
+        self._db = db
+        await self.rebuild()
+        self._task = asyncio.create_task(follow_changes(
+            "geeks",
+            open_stream=lambda: self._db.geeks.watch(full_document="updateLookup"),
+            on_change=self._on_change,
+            resync=self.rebuild,
+            refresh_seconds=self.refresh_seconds,
+            watch=self.watch,
+        ))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def rebuild(self):
+        started = time.perf_counter()
+        projection = {field: 1 for field in OUTPUT_FIELDS + INDEX_FIELDS}
+        docs = await self._db.geeks.find({}, projection).to_list()
+
+        self._reset()
+        for doc in docs:
+            self._add(doc)
+        self.ready = True
+        logger.info(f"Geek index built for {len(docs)} geeks in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    async def _on_change(self, change: dict):
+        operation = change.get("operationType")
+        geek_id = change.get("documentKey", {}).get("_id")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is None:
+                self._remove(geek_id)
+            else:
+                self.upsert(doc)
+        elif operation == "delete":
+            self._remove(geek_id)
+        elif operation in ("drop", "rename", "invalidate"):
+            await self.rebuild()
+
+    # --- Maintenance --- #
+
+    def upsert(self, doc: dict):
+        doc = {field: doc[field] for field in OUTPUT_FIELDS + INDEX_FIELDS if field in doc}
+        slot = self._slot_by_id.get(doc["_id"])
+        if slot is None:
+            self._add(doc)
+        else:
+            self._clear(slot)
+            self._fill(slot, doc)
+
+    def _add(self, doc: dict):
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._slot_by_id[doc["_id"]] = slot
+            self._fill(slot, doc)
+            return
+        slot = len(self._docs)
+        self._docs.append(None)
+        self._keys.append(None)
+        self._address_text.append("")
+        capacity = self._features.shape[1]
+        if slot >= capacity:
+            grown = np.full((len(FEATURE_COLUMNS), 2 * capacity), np.nan)
+            grown[:, :capacity] = self._features
+            self._features = grown
+            self._ids = np.concatenate([self._ids, np.full(capacity, "", dtype="<U24")])
+        self._slot_by_id[doc["_id"]] = slot
+        self._fill(slot, doc)
+
+    def _remove(self, geek_id):
+        slot = self._slot_by_id.pop(geek_id, None)
+        if slot is not None:
+            self._clear(slot)
+            self._free_slots.append(slot)
+
+    def _fill(self, slot: int, doc: dict):
+        bit = 1 << slot
+        keys = []
+        skills = [doc.get("primarySkill")] + list(doc.get("secondarySkills") or [])
+        for skill in {ObjectId(s) for s in skills if s}:
+            keys.append((self._by_skill, skill))
+        if doc.get("primarySkill"):
+            keys.append((self._by_primary, ObjectId(doc["primarySkill"])))
+        address = doc.get("address") or {}
+        if address.get("city"):
+            keys.append((self._by_city, address["city"]))
+        if address.get("state"):
+            keys.append((self._by_state, address["state"]))
+        if doc.get("modeOfService"):
+            keys.append((self._by_mode, doc["modeOfService"]))
+
+        for index, key in keys:
+            index[key] = index.get(key, 0) | bit
+        self._live |= bit
+        self._docs[slot] = doc
+        self._keys[slot] = keys
+        self._address_text[slot] = "\x00".join(
+            str(address.get(field) or "").lower() for field in ADDRESS_SEARCH_FIELDS
+        )
+        self._features[:, slot] = document_features(doc)
+        self._ids[slot] = str(doc["_id"])
+
+    def _clear(self, slot: int):
+        mask = ~(1 << slot)
+        for index, key in self._keys[slot] or []:
+            remaining = index.get(key, 0) & mask
+            if remaining:
+                index[key] = remaining
+            else:
+                index.pop(key, None)
+        self._live &= mask
+        self._docs[slot] = None
+        self._keys[slot] = None
+        self._address_text[slot] = ""
+        self._features[:, slot] = np.nan
+
+    # --- Queries --- #
+
+    def _union(self, index: Dict, keys: Iterable) -> int:
+        bits = 0
+        for key in keys:
+            bits |= index.get(key, 0)
+        return bits
+
+    def match_bits(self, criteria: GeekMatchCriteria) -> int:
+        bits = self._live
+        if criteria.skill_ids:
+            bits &= self._union(self._by_skill, criteria.skill_ids)
+        if criteria.near is None and (criteria.city or criteria.state):
+            bits &= self._union(self._by_city, [criteria.city] if criteria.city else []) | \
+                self._union(self._by_state, [criteria.state] if criteria.state else [])
+        if criteria.modes:
+            bits &= self._union(self._by_mode, criteria.modes)
+        return bits
+
+    def match_slots(self, criteria: GeekMatchCriteria) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Slots of every matching geek, in slot order, or nearest first with their
+        distances in metres when the criteria have a point.
+        """
+        slots = bit_positions(self.match_bits(criteria))
+        if criteria.location_tokens:
+            # Free-text location: every token must appear in one of the address fields
+            tokens = [token.lower() for token in criteria.location_tokens]
+            slots = np.array(
+                [slot for slot in slots if all(token in self._address_text[slot] for token in tokens)],
+                dtype=np.int64,
+            )
+        if criteria.near is None:
+            return slots, None
+
+        distances = haversine_m(*criteria.near, self._features[LONGITUDE, slots], self._features[LATITUDE, slots])
+        # Geeks without coordinates have NaN distances and drop out here, as with $geoNear
+        in_range = np.flatnonzero(distances <= criteria.max_distance_m)
+        order = in_range[np.argsort(distances[in_range], kind="stable")]
+        return slots[order], distances[order]
+
+    def document(self, slot: int, catalog: CatalogSnapshot, distance: Optional[float] = None) -> dict:
+        """A matched geek in the same shape the aggregation pipeline returns."""
+        doc = self._docs[slot]
+        output = {field: doc[field] for field in OUTPUT_FIELDS if field in doc}
+        if distance is not None:
+            output["distance"] = distance
+        primary = catalog.category_by_id(doc["primarySkill"]) if doc.get("primarySkill") else None
+        if primary:
+            output["primarySkillName"] = primary.title
+        secondary = [catalog.category_by_id(skill) for skill in doc.get("secondarySkills") or []]
+        output["secondarySkillsNames"] = [category.title for category in secondary if category]
+        return output
+
+    def candidates(self, criteria: GeekMatchCriteria, slots: np.ndarray) -> CandidateSet:
+        """The matched slots as ranking columns, keyed by their position in `slots`."""
+        primary_match = np.zeros(len(slots), dtype=bool)
+        skill_coverage = np.zeros(len(slots))
+        if criteria.skill_ids:
+            primary_match = np.isin(slots, bit_positions(self._union(self._by_primary, criteria.skill_ids)))
+            for skill in criteria.skill_ids:
+                skill_coverage += np.isin(slots, bit_positions(self._by_skill.get(skill, 0)))
+            skill_coverage /= len(criteria.skill_ids)
+        return CandidateSet(np.arange(len(slots)), self._ids[slots], self._features[:, slots], primary_match, skill_coverage)
+
+    def rank(self, criteria: GeekMatchCriteria, depth: int, after: Optional[Tuple[float, str]] = None) -> RankedPage:
+        """The best `depth` matching geeks, optionally after a (score, geek id) keyset."""
+        started = time.perf_counter()
+        slots, distances = self.match_slots(criteria)
+        timings_ms = {"match": (time.perf_counter() - started) * 1000}
+
+        started = time.perf_counter()
+        candidates = self.candidates(criteria, slots)
+        timings_ms["load"] = (time.perf_counter() - started) * 1000
+
+        ranked = rank(candidates, depth, criteria.origin, criteria.max_distance_m, after=after, timings_ms=timings_ms)
+        ranked.distances = [None if distances is None else float(distances[position]) for position in ranked.keys]
+        logger.info(f"Ranked {ranked.total} geeks from the index: {ranked.timings_ms}")
+        return ranked
+
+    def hydrate(self, ids: List[str], catalog: CatalogSnapshot) -> Dict[str, dict]:
+        """Full documents for ranked geek ids, by id; geeks gone from the index are left out."""
+        slots = {geek_id: self._slot_by_id.get(ObjectId(geek_id)) for geek_id in ids}
+        return {geek_id: self.document(slot, catalog) for geek_id, slot in slots.items() if slot is not None}
+
+    def search(
+        self,
+        criteria: GeekMatchCriteria,
+        catalog: CatalogSnapshot,
+        skip: int,
+        limit: int,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> Tuple[List[dict], int]:
+        """
+        Returns one page of matching geeks, unranked, and the total number of matches.
+        Geeks are in (distance, geek id) order for a geo match and geek id order
+        otherwise, as the aggregation pipeline pages them; `after` resumes strictly
+        after a (distance or 0, geek id) keyset instead of skipping.
+        """
+        slots, distances = self.match_slots(criteria)
+        keys = np.zeros(len(slots)) if distances is None else distances
+        ids = self._ids[slots]
+        order = np.lexsort((ids, keys))
+        slots, keys, ids = slots[order], keys[order], ids[order]
+        start = skip
+        if after is not None:
+            after_key, after_id = after
+            start = int(np.count_nonzero((keys < after_key) | ((keys == after_key) & (ids <= after_id))))
+        page = [
+            self.document(int(slot), catalog, None if distances is None else float(keys[start + i]))
+            for i, slot in enumerate(slots[start:start + limit])
+        ]
+        return page, len(slots)
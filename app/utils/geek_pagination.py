@@ -0,0 +1,108 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from .geek_index import GeekMatchCriteria
+from .geek_ranking import RANKING_WEIGHTS
+
+# How much of the ranking is kept per issue; pages past it are served by keyset re-ranking
+CACHE_DEPTH = int(os.environ.get("GEEK_MATCH_CACHE_DEPTH", 500))
+CACHE_TTL_SECONDS = float(os.environ.get("GEEK_MATCH_CACHE_TTL_SECONDS", 120))
+CACHE_MAX_ENTRIES = int(os.environ.get("GEEK_MATCH_CACHE_ENTRIES", 1024))
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def criteria_fingerprint(criteria: GeekMatchCriteria, ranked: bool = True) -> str:
+    """
+    Identifies one search: the same criteria ranked with the same weights, or the
+    same criteria unranked. Cursors of one never resume the other.
+    """
+    order = RANKING_WEIGHTS.model_dump() if ranked else "unranked"
+    payload = json.dumps([criteria.model_dump(), order], default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class MatchCursor(BaseModel):
+    """
+    Continuation token for a geek match: the sort key and geek id of the last geek
+    returned, and the search it belongs to. The key is the score in a ranked match
+    and the distance (0 without a geo match) in an unranked one, which also carries
+    the position of the next geek, since it keeps no ranking to find it in.
+    Clients treat the encoded form as opaque.
+    """
+    score: float
+    geek_id: str
+    fingerprint: str
+    position: Optional[int] = None
+
+    def encode(self) -> str:
+        values = [self.score, self.geek_id, self.fingerprint]
+        if self.position is not None:
+            values.append(self.position)
+        payload = json.dumps(values, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @classmethod
+    def decode(cls, token: str, fingerprint: str) -> "MatchCursor":
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            score, geek_id, token_fingerprint, *position = json.loads(base64.urlsafe_b64decode(padded))
+            if len(position) > 1:
+                raise ValueError("too many values")
+            cursor = cls(score=score, geek_id=geek_id, fingerprint=token_fingerprint, position=position[0] if position else None)
+        except (binascii.Error, ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursorError(f"Malformed cursor: {e}") from e
+        if cursor.fingerprint != fingerprint:
+            raise InvalidCursorError("Cursor belongs to a different search")
+        return cursor
+
+    @property
+    def keyset(self) -> Tuple[float, str]:
+        return self.score, self.geek_id
+
+
+class MatchCache:
+    """
+    TTL-bounded LRU of per-issue match state: the top CACHE_DEPTH of each issue's
+    ranking and its total, so following pages are a slice instead of a new
+    match-and-rank pass, or an unranked match's total, so following pages skip the count.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# RankedPage per issue and ranked search
+match_cache = MatchCache()
+# (total, whether the geo match answered) per issue and unranked search
+total_cache = MatchCache()
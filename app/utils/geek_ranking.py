@@ -0,0 +1,271 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from ..db.geek_locations import haversine_m, point_from_address
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Geek Ranking", "app.log")
+
+# Off until benchmarked against the unranked match on production data
+RANKING_ENABLED = os.environ.get("GEEK_RANKING_ENABLED", "false").lower() == "true"
+# Upper bound on candidates pulled from MongoDB for one ranking pass; geo matches
+# arrive nearest first, so the cut drops the farthest geeks in range
+MAX_CANDIDATES = int(os.environ.get("GEEK_RANKING_MAX_CANDIDATES", 5000))
+# Years of experience beyond this add nothing to the score
+YOE_CAP = 20
+# Bayesian prior for review ratings: an unrated geek scores like PRIOR_COUNT reviews of PRIOR_RATING
+PRIOR_RATING = 3.5
+PRIOR_COUNT = 3
+MAX_RATING = 5.0
+
+# Per-geek feature columns, in the row order of CandidateSet.features
+FEATURE_COLUMNS = ["longitude", "latitude", "yoe", "rating_sum", "rating_count", "min_rate", "completeness"]
+LONGITUDE, LATITUDE, YOE, RATING_SUM, RATING_COUNT, MIN_RATE, COMPLETENESS = range(len(FEATURE_COLUMNS))
+
+
+def _number(path: str) -> dict:
+    return {"$cond": [{"$isNumber": path}, path, None]}
+
+
+def ranking_projection(skill_ids: List) -> dict:
+    """
+    Server-side $project that reduces a geek to flat ranking features: one field
+    per FEATURE_COLUMNS entry (null when unknown) plus how it covers `skill_ids`.
+    """
+    skills = {"$concatArrays": [["$primarySkill"], {"$ifNull": ["$secondarySkills", []]}]}
+    return {
+        "_id": 1,
+        "longitude": _number("$address.coordinates.longitude"),
+        "latitude": _number("$address.coordinates.latitude"),
+        "yoe": _number("$yoe"),
+        "rating_sum": {"$sum": "$reviews.rating"},
+        "rating_count": {"$size": {"$filter": {
+            "input": {"$ifNull": ["$reviews", []]},
+            "cond": {"$isNumber": "$$this.rating"},
+        }}},
+        "min_rate": {"$min": {"$filter": {
+            "input": {"$ifNull": ["$rateCard.rate", []]},
+            "cond": {"$gt": ["$$this", 0]},
+        }}},
+        "completeness": _number("$profileCompletedPercentage"),
+        "primary_match": {"$in": ["$primarySkill", skill_ids]},
+        "skill_hits": {"$size": {"$setIntersection": [skills, skill_ids]}},
+    }
+
+
+class RankingWeights(BaseModel):
+    skill: float = 3.0
+    distance: float = 2.0
+    experience: float = 1.0
+    rating: float = 1.5
+    price: float = 0.5
+    completeness: float = 0.5
+
+    @classmethod
+    def from_env(cls) -> "RankingWeights":
+        """Defaults overridden by GEEK_RANKING_WEIGHTS, e.g. '{"distance": 4, "price": 0}'."""
+        raw = os.environ.get("GEEK_RANKING_WEIGHTS")
+        if not raw:
+            return cls()
+        try:
+            return cls(**json.loads(raw))
+        except Exception as e:
+            logger.error(f"Invalid GEEK_RANKING_WEIGHTS, using defaults: {e}")
+            return cls()
+
+
+RANKING_WEIGHTS = RankingWeights.from_env()
+
+
+class CandidateSet:
+    """
+    Matched geeks laid out as columns: `keys` identify each candidate to its engine
+    (geek ids or index positions), `ids` are the geek ids as strings, `features` is a float64 (len(FEATURE_COLUMNS), n) array with NaN for
+    unknown values (one contiguous row per feature, so every signal is computed over
+    contiguous memory), and the two skill columns describe how well each candidate
+    covers the issue's skills.
+    """
+
+    def __init__(self, keys: np.ndarray, ids: np.ndarray, features: np.ndarray, primary_match: np.ndarray, skill_coverage: np.ndarray):
+        self.keys = keys
+        self.ids = ids
+        self.features = features
+        self.primary_match = primary_match
+        self.skill_coverage = skill_coverage
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_documents(cls, docs: List[dict], skill_ids: List) -> "CandidateSet":
+        """
+        Builds the columns from documents shaped by ranking_projection(skill_ids),
+        one column at a time; the server has already done the per-geek work.
+        """
+        n = len(docs)
+        features = np.array([[doc.get(column) for doc in docs] for column in FEATURE_COLUMNS], dtype=float)
+        features = features.reshape(len(FEATURE_COLUMNS), n)
+        longitudes, latitudes = features[LONGITUDE], features[LATITUDE]
+        # Same rule as point_from_address; NaN compares false and stays unknown
+        unusable = ~((np.abs(latitudes) <= 90) & (np.abs(longitudes) <= 180)) | ((latitudes == 0) & (longitudes == 0))
+        features[LONGITUDE, unusable] = np.nan
+        features[LATITUDE, unusable] = np.nan
+        features[RATING_SUM] = np.nan_to_num(features[RATING_SUM])
+        features[RATING_COUNT] = np.nan_to_num(features[RATING_COUNT])
+        primary_match = np.array([bool(doc.get("primary_match")) for doc in docs], dtype=bool)
+        skill_coverage = np.zeros(n)
+        if skill_ids:
+            skill_coverage = np.array([doc.get("skill_hits") or 0 for doc in docs], dtype=float) / len(set(skill_ids))
+        keys = np.empty(n, dtype=object)
+        keys[:] = [doc["_id"] for doc in docs]
+        ids = np.array([str(doc["_id"]) for doc in docs], dtype="<U24")
+        return cls(keys, ids, features, primary_match, skill_coverage)
+
+
+def document_features(doc: dict) -> List[float]:
+    """One row of FEATURE_COLUMNS for a raw geek document."""
+    longitude, latitude = point_from_address(doc.get("address")) or (np.nan, np.nan)
+    ratings = [r["rating"] for r in doc.get("reviews") or [] if isinstance(r.get("rating"), (int, float))]
+    rates = [c["rate"] for c in doc.get("rateCard") or [] if isinstance(c.get("rate"), (int, float)) and c["rate"] > 0]
+    rating_sum, rating_count, min_rate = sum(ratings), len(ratings), min(rates) if rates else None
+    return [
+        longitude,
+        latitude,
+        doc.get("yoe") if isinstance(doc.get("yoe"), (int, float)) else np.nan,
+        rating_sum,
+        rating_count,
+        min_rate if min_rate is not None else np.nan,
+        doc.get("profileCompletedPercentage") if isinstance(doc.get("profileCompletedPercentage"), (int, float)) else np.nan,
+    ]
+
+
+def component_scores(candidates: CandidateSet, origin: Optional[Tuple[float, float]], max_distance_m: float) -> Dict[str, np.ndarray]:
+    """Each ranking signal scaled to [0, 1], higher is better."""
+    f = candidates.features
+    n = len(candidates)
+
+    skill = 0.6 * candidates.primary_match + 0.4 * candidates.skill_coverage
+
+    if origin is not None:
+        distances = haversine_m(*origin, f[LONGITUDE], f[LATITUDE])
+        # Halves roughly every quarter of the search radius; unknown location scores 0
+        distance = np.nan_to_num(np.exp(-distances / (max_distance_m / 3)), nan=0.0)
+    else:
+        distance = np.zeros(n)
+
+    experience = np.log1p(np.clip(np.nan_to_num(f[YOE]), 0, YOE_CAP)) / np.log1p(YOE_CAP)
+
+    rating = (f[RATING_SUM] + PRIOR_RATING * PRIOR_COUNT) / (f[RATING_COUNT] + PRIOR_COUNT) / MAX_RATING
+
+    # Cheapest known rate scores 1, dearest 0, unknown sits in the middle
+    rates = f[MIN_RATE]
+    known = ~np.isnan(rates)
+    price = np.full(n, 0.5)
+    if known.any():
+        low, high = rates[known].min(), rates[known].max()
+        price[known] = 1.0 if high == low else 1.0 - (rates[known] - low) / (high - low)
+
+    completeness = np.clip(np.nan_to_num(f[COMPLETENESS]), 0, 100) / 100.0
+
+    return {
+        "skill": skill,
+        "distance": distance,
+        "experience": experience,
+        "rating": rating,
+        "price": price,
+        "completeness": completeness,
+    }
+
+
+def score(candidates: CandidateSet, weights: RankingWeights, origin: Optional[Tuple[float, float]], max_distance_m: float) -> np.ndarray:
+    components = component_scores(candidates, origin, max_distance_m)
+    total = np.zeros(len(candidates))
+    for name, values in components.items():
+        total += getattr(weights, name) * values
+    return total
+
+
+def top_k(scores: np.ndarray, k: int, tiebreak: np.ndarray) -> np.ndarray:
+    """
+    Indices of the k best scores, best first, ties in ascending `tiebreak` order.
+
+    argpartition finds the k-th best score; every candidate tied with it is kept
+    before the final sort, so the cut is exactly the first k of the total order and
+    keyset pagination never skips a tied geek.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        chosen = np.flatnonzero(scores >= threshold)
+    else:
+        chosen = np.arange(n)
+    return chosen[np.lexsort((tiebreak[chosen], -scores[chosen]))][:k]
+
+
+class RankedPage(BaseModel):
+    """
+    A stretch of the ranking: the geeks at positions offset .. offset + len(ids) of the
+    total order (score descending, geek id ascending) over `total` matches.
+    """
+    keys: List
+    ids: List[str]
+    scores: List[float]
+    distances: List[Optional[float]] = []
+    total: int
+    offset: int = 0
+    timings_ms: Dict[str, float] = {}
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def position_after(self, score: float, geek_id: str) -> Optional[int]:
+        """Index just past the given geek, if it is part of this stretch."""
+        try:
+            i = self.ids.index(geek_id)
+        except ValueError:
+            return None
+        return i + 1 if self.scores[i] == score else None
+
+
+def rank(
+    candidates: CandidateSet,
+    depth: int,
+    origin: Optional[Tuple[float, float]] = None,
+    max_distance_m: float = 25000.0,
+    weights: RankingWeights = RANKING_WEIGHTS,
+    after: Optional[Tuple[float, str]] = None,
+    timings_ms: Optional[Dict[str, float]] = None,
+) -> RankedPage:
+    """
+    Scores every candidate in one vectorized pass and returns the best `depth` of
+    them, or the best `depth` ranked after the (score, geek id) keyset `after`, with
+    per-stage timings (on top of any stages already in `timings_ms`).
+    """
+    timings_ms = dict(timings_ms or {})
+
+    started = time.perf_counter()
+    scores = score(candidates, weights, origin, max_distance_m)
+    timings_ms["score"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    eligible = np.arange(len(candidates))
+    if after is not None:
+        after_score, after_id = after
+        eligible = np.flatnonzero((scores < after_score) | ((scores == after_score) & (candidates.ids > after_id)))
+    order = eligible[top_k(scores[eligible], depth, candidates.ids[eligible])]
+    timings_ms["select"] = (time.perf_counter() - started) * 1000
+
+    return RankedPage(
+        keys=list(candidates.keys[order]),
+        ids=list(candidates.ids[order]),
+        scores=[float(s) for s in scores[order]],
+        total=len(candidates),
+        offset=len(candidates) - len(eligible),
+        timings_ms={stage: round(ms, 3) for stage, ms in timings_ms.items()},
+    )
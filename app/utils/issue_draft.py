@@ -0,0 +1,124 @@
+"""
+The user issue extracted incrementally while the conversation runs, so confirming
+the agent's summary does not wait on one large extraction over the whole transcript.
+
+After every turn only the new messages are folded into the draft, in the
+background; the draft is stored on the conversation header so a resumed session
+carries on from it.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from .issue_extractor import IssueExtractor, format_transcript
+from .metrics import metrics
+from ..models.agent_chat_model import ChatMessageBase, MessageSender
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Issue Draft", "app.log")
+
+ISSUE_DRAFT_ENABLED = os.environ.get("ISSUE_DRAFT_ENABLED", "true").lower() == "true"
+# How long a confirmation waits for an update still running before extracting from the full transcript
+ISSUE_DRAFT_WAIT_SECONDS = float(os.environ.get("ISSUE_DRAFT_WAIT_SECONDS", 20))
+
+
+class IssueDraft:
+    """
+    Extracted issue fields (IssueDetails, as a dict)
+    covering the first `through` messages of a conversation.
+    """
+
+    def __init__(
+        self,
+        extractor: IssueExtractor,
+        on_update: Optional[Callable[[dict, int], Awaitable[None]]] = None,
+        enabled: bool = ISSUE_DRAFT_ENABLED,
+    ):
+        self.extractor = extractor
+        # Called with (fields, through) after each update, e.g. to store the draft
+        self.on_update = on_update
+        self.enabled = enabled
+        self.fields: Optional[dict] = None
+        self.through = 0
+        # Some messages will never reach the draft (e.g. history only the client had)
+        self.incomplete = False
+        self._pending: List[ChatMessageBase] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def restore(self, stored: Optional[dict], messages: List[ChatMessageBase], first_seq: int):
+        """
+        Picks up a stored draft ({"fields", "through"}), with the stored messages
+        from first_seq on; those it does not cover yet are folded in the background.
+        """
+        if not self.enabled:
+            return
+        through = stored.get("through", 0) if stored else 0
+        if through < first_seq:
+            # The messages between the draft and the ones loaded are not at hand
+            self.incomplete = True
+            return
+        self.fields = stored.get("fields") if stored else None
+        self.through = through
+        self._pending = list(messages[through - first_seq:])
+        self.schedule()
+
+    def add_turn(self, user_message: str, bot_message: str):
+        if not self.enabled or self.incomplete:
+            return
+        self._pending += [
+            ChatMessageBase(sender=MessageSender.USER, message=user_message),
+            ChatMessageBase(sender=MessageSender.BOT, message=bot_message),
+        ]
+        self.schedule()
+
+    def schedule(self):
+        """Starts folding the pending messages, unless an update is running (it picks them up)."""
+        if self.incomplete or not self._pending:
+            return
+        if self._task is not None and not self._task.done():
+            return
+        # A fresh context, so the extractor does not inherit the turn's callbacks
+        self._task = asyncio.create_task(self._update(), context=contextvars.Context())
+
+    async def _update(self):
+        while self._pending:
+            batch = list(self._pending)
+            try:
+                self.fields = await self.extractor.update_issue_details(self.fields, format_transcript(batch))
+            except Exception as e:
+                # The messages stay pending and go with the next turn's update
+                metrics.incr("issue_draft.updates", outcome="error")
+                logger.error(f"Error updating the issue draft with {len(batch)} messages: {e}")
+                return
+            # Turns added while the extractor ran were appended after the batch
+            del self._pending[:len(batch)]
+            self.through += len(batch)
+            metrics.incr("issue_draft.updates", outcome="ok")
+            if self.on_update is not None:
+                try:
+                    await self.on_update(self.fields, self.through)
+                except Exception as e:
+                    logger.error(f"Error storing the issue draft: {e}")
+
+    async def result(self, timeout: float = ISSUE_DRAFT_WAIT_SECONDS) -> Optional[dict]:
+        """
+        The fields once every message has been folded in, waiting up to `timeout`
+        for an update still running; None when the draft cannot be used and the
+        issue has to be extracted from the full transcript.
+        """
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        # Retries messages a failed update left pending
+        self.schedule()
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Issue draft still updating after {timeout}s")
+        ready = not self.incomplete and not self._pending and self.fields is not None
+        metrics.incr("issue_draft.confirmations", outcome="ready" if ready else "fallback")
+        metrics.observe("issue_draft.wait_ms", (time.perf_counter() - started) * 1000)
+        return dict(self.fields) if ready else None
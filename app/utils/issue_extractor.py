@@ -1,37 +1,111 @@
-from langchain_openai import ChatOpenAI
+import functools
+import json
+import os
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from openai import LengthFinishReasonError
+from pydantic import ValidationError
 
-from ..models.user_issue_model import UserIssueBase
+from .chat_memory import count_tokens
+from .llm_clients import LLMUsageRecorder, chat_model
+from .metrics import metrics
+from ..models.agent_chat_model import ChatMessageBase
+from ..models.user_issue_model import IssueDetails, UserIssueBase
 from ..logs.logger import setup_logger
 
 logger = setup_logger("GoD AI Chatbot: Issue Extractor", "app.log")
 
+# "json_schema": OpenAI structured outputs, "function_calling": a forced tool call
+STRUCTURED_OUTPUT_METHOD = os.environ.get("ISSUE_EXTRACTION_METHOD", "json_schema")
+# Extra attempts after an output that does not fit the schema, each shown the error
+MAX_REPAIR_ATTEMPTS = int(os.environ.get("ISSUE_EXTRACTION_REPAIR_ATTEMPTS", 2))
+
+REPAIR_PROMPT = "That output does not match the issue schema: {error}\nReturn the corrected issue."
+
+
+def format_transcript(messages: List[ChatMessageBase]) -> str:
+    return "\n".join(f"{msg.sender.value}: {msg.message}" for msg in messages)
+
+
+def _raw_text(message: AIMessage) -> str:
+    """What the model answered, as plain text (tool call arguments in function calling mode)."""
+    if message.tool_calls:
+        return json.dumps(message.tool_calls[0]["args"])
+    return message.content if isinstance(message.content, str) else json.dumps(message.content)
+
+
 class IssueExtractor:
-    def __init__(self):
-        self.llm = ChatOpenAI(model="o4-mini")
-        self.parser = JsonOutputParser(pydantic_object=UserIssueBase)
-        self.prompt = ChatPromptTemplate.from_template(
-            """
-            You are an expert data extraction agent. Your task is to analyze a conversation transcript between a support agent and a user and extract the required information into a JSON object.
-            
-            Analyze the following transcript:
-            ---
-            {transcript}
-            ---
-            Based on the transcript, extract the device details, purchase information, problem description and service details. Also, create a final summary of the user's issue. If a piece of information is missing, use `null`. Always use a hyphen (`-`) wherever required. NEVER USE En dash.
+    """
+    Extracts IssueDetails from a conversation with the schema passed through the
+    API's structured output channel rather than as format instructions in the
+    prompt. Outputs that still fail validation are sent back with the error, at
+    most MAX_REPAIR_ATTEMPTS times.
+    """
+    def __init__(self, llm=None, method: str = STRUCTURED_OUTPUT_METHOD):
+        self.llm = llm or chat_model("o4-mini")
+        self.structured_llm = self.llm.with_structured_output(IssueDetails, method=method, include_raw=True)
+        # Static instructions first and the transcript last, so the instruction prefix
+        # is byte-identical across calls and eligible for the provider's prompt cache
+        instructions = """
+            You are an expert data extraction agent. Your task is to analyze a conversation transcript between a support agent and a user and extract the required information into the issue schema.
 
-            {format_instructions}
+            Based on the transcript, extract the device details, purchase information, problem description and service details. Also, create a final summary of the user's issue. If a piece of information is missing, use `null`. Always use a hyphen (`-`) wherever required. NEVER USE En dash.
             """
-        )
-        self.chain = self.prompt | self.llm | self.parser
-        
+        self.prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=instructions),
+            ("human", "Analyze the following transcript:\n---\n{transcript}\n---"),
+        ])
+        self.update_prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=instructions + """
+            You are given the issue extracted so far from the earlier part of the conversation and only the messages that followed it.
+            Return the complete updated issue: keep every earlier value unless the new messages add to or correct it, and rewrite the summary to cover the whole issue.
+            """),
+            ("human", "Extracted so far:\n{draft}\n\nNew messages:\n---\n{transcript}\n---"),
+        ])
+
+    @functools.cached_property
+    def prompt_tokens_saved(self) -> int:
+        """What the prose format instructions used to add to every prompt, less the schema sent instead."""
+        format_instructions = JsonOutputParser(pydantic_object=UserIssueBase).get_format_instructions()
+        schema = json.dumps(IssueDetails.model_json_schema(), separators=(",", ":"))
+        return max(count_tokens(format_instructions) - count_tokens(schema), 0)
+
+    async def _extract(self, messages: List[BaseMessage], purpose: str) -> dict:
+        usage = LLMUsageRecorder(purpose)
+        error = None
+        for attempt in range(MAX_REPAIR_ATTEMPTS + 1):
+            metrics.incr("extractor.attempts", purpose=purpose)
+            raw = None
+            try:
+                result = await self.structured_llm.ainvoke(messages, config={"callbacks": [usage]})
+                raw, parsed, error = result["raw"], result["parsed"], result["parsing_error"]
+                if parsed is None and error is None:
+                    error = "no issue was returned"
+            except (ValidationError, LengthFinishReasonError) as e:
+                # Raised by the SDK when it parses the response itself
+                parsed, error = None, e
+            if error is None:
+                metrics.incr("extractor.prompt_tokens_saved", self.prompt_tokens_saved, purpose=purpose)
+                if attempt:
+                    metrics.incr("extractor.repairs", outcome="ok", purpose=purpose)
+                logger.info(f"Extracted issue details in {attempt + 1} attempt(s), usage: {usage.summary()}")
+                return parsed.model_dump(mode="json", exclude_none=True)
+
+            metrics.incr("extractor.parse_failures", purpose=purpose)
+            logger.warning(f"Extraction attempt {attempt + 1} did not match the schema: {error}")
+            if raw is not None:
+                messages = messages + [AIMessage(content=_raw_text(raw))]
+            messages = messages + [HumanMessage(content=REPAIR_PROMPT.format(error=error))]
+        metrics.incr("extractor.repairs", outcome="failed", purpose=purpose)
+        raise ValueError(f"No valid issue after {MAX_REPAIR_ATTEMPTS + 1} attempts: {error}")
+
     async def extract_issue_details(self, transcript: str, user_id: str, conversation_id: str) -> dict:
         try:
-            format_instructions = self.parser.get_format_instructions()
             logger.info(f"Extracting issue details from transcript: {transcript}")
-            response = await self.chain.ainvoke({"transcript": transcript, "format_instructions": format_instructions})
-            logger.info(f"Extracted issue details")
+            response = await self._extract(self.prompt.format_messages(transcript=transcript), "extractor")
             # logger.info(f"Extracted issue details: {response}")
             response['user_id'] = user_id
             response['conversation_id'] = conversation_id
@@ -39,3 +113,15 @@ class IssueExtractor:
         except Exception as e:
             logger.error(f"Error extracting issue details: {e}")
             raise e
+
+    async def update_issue_details(self, draft: Optional[dict], transcript: str) -> dict:
+        """
+        Folds the messages in `transcript` into a previous extraction (None for the
+        first messages of a conversation) and returns the updated fields.
+        """
+        try:
+            messages = self.update_prompt.format_messages(draft=json.dumps(draft or {}, default=str), transcript=transcript)
+            return await self._extract(messages, "extractor_update")
+        except Exception as e:
+            logger.error(f"Error updating issue details: {e}")
+            raise e
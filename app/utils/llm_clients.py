@@ -0,0 +1,192 @@
+"""
+One keep-alive HTTP client per process for every OpenAI call: the raw AsyncOpenAI
+client (TTS, STT) and every LangChain ChatOpenAI model share its connection pool,
+so a new chat session reuses warm connections instead of opening its own pool.
+
+Benchmark of per-session setup, old (a ChatOpenAI and extractor per connection)
+against shared:
+
+    python -m app.utils.llm_clients [--sessions 50] [--network]
+
+--network also times N first requests over fresh clients against N over the
+shared one, which needs OPENAI_API_KEY and network access.
+"""
+import argparse
+import asyncio
+import functools
+import os
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_openai import ChatOpenAI
+from openai import AsyncOpenAI
+
+from .metrics import metrics
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: LLM Clients", "app.log")
+
+HTTP2_ENABLED = os.environ.get("LLM_HTTP2", "true").lower() == "true"
+MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 100))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get("LLM_KEEPALIVE_EXPIRY_SECONDS", 120))
+# Matches the OpenAI SDK default; reasoning models can take minutes on long prompts
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get("LLM_REQUEST_TIMEOUT_SECONDS", 600))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def shared_http_client() -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("HTTP/2 requested but the h2 package is missing (pip install 'httpx[http2]'); using HTTP/1.1")
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=10.0),
+        follow_redirects=True,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def shared_openai_client() -> AsyncOpenAI:
+    return AsyncOpenAI(http_client=shared_http_client())
+
+
+@functools.lru_cache(maxsize=None)
+def chat_model(model: str = "o4-mini", streaming: bool = False) -> ChatOpenAI:
+    """
+    A process-wide ChatOpenAI on the shared connection pool. Models are stateless, so
+    per-session callbacks are passed at invocation time rather than bound here.
+    """
+    # stream_usage: streamed replies report token usage (and cached tokens) too
+    return ChatOpenAI(model=model, streaming=streaming, stream_usage=True, http_async_client=shared_http_client())
+
+
+class LLMUsageRecorder(AsyncCallbackHandler):
+    """
+    Records token usage and latency of every model call it sees into the metrics
+    registry, split by whether the provider served part of the prompt from its
+    prompt cache, and keeps totals for the run it was passed to (one chat turn).
+    """
+
+    def __init__(self, purpose: str):
+        self.purpose = purpose
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latency_ms = 0.0
+        self._started: Dict[UUID, tuple] = {}
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        self._started[run_id] = (time.perf_counter(), (metadata or {}).get("ls_model_name", "unknown"))
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        started, model = self._started.pop(run_id, (None, "unknown"))
+        latency_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None and getattr(message, "usage_metadata", None):
+                    usage = message.usage_metadata
+        prompt = usage.get("input_tokens", 0)
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        completion = usage.get("output_tokens", 0)
+
+        self.calls += 1
+        self.prompt_tokens += prompt
+        self.cached_tokens += cached
+        self.completion_tokens += completion
+        self.latency_ms += latency_ms
+
+        labels = {"model": model, "purpose": self.purpose}
+        metrics.incr("llm.calls", **labels)
+        metrics.incr("llm.prompt_tokens", prompt, **labels)
+        metrics.incr("llm.cached_tokens", cached, **labels)
+        metrics.incr("llm.completion_tokens", completion, **labels)
+        metrics.observe("llm.latency_ms", latency_ms, cache="hit" if cached else "miss", **labels)
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_ms": round(self.latency_ms, 1),
+        }
+
+
+async def close_clients():
+    if shared_http_client.cache_info().currsize:
+        await shared_http_client().aclose()
+
+
+async def main():
+    import dotenv
+
+    from .agent_setup import AgentTemplate, ChatAssistantChain
+    from .issue_extractor import IssueExtractor
+
+    parser = argparse.ArgumentParser(description="Benchmark per-session LLM setup.")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--network", action="store_true", help="Also time first requests over fresh vs shared clients")
+    args = parser.parse_args()
+    dotenv.load_dotenv()
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    def per_session_before():
+        # What every /chat connection used to build
+        llm = ChatOpenAI(model="o4-mini", streaming=True)
+        llm.async_client  # noqa: B018 - the SDK client and its pool are created with the model
+        IssueExtractor(llm=ChatOpenAI(model="o4-mini"))
+        return ChatAssistantChain(template=AgentTemplate(catalog=None, llm=llm))
+
+    template = AgentTemplate(catalog=None)
+    IssueExtractor()
+
+    def per_session_after():
+        return ChatAssistantChain(template=template)
+
+    for label, build in (("per-session clients", per_session_before), ("shared clients", per_session_after)):
+        started = time.perf_counter()
+        for _ in range(args.sessions):
+            build()
+        elapsed = (time.perf_counter() - started) * 1000 / args.sessions
+        print(f"{label:>20}: {elapsed:7.2f} ms per session setup")
+
+    if args.network:
+        async def first_request(client: AsyncOpenAI) -> float:
+            started = time.perf_counter()
+            await client.models.list()
+            return (time.perf_counter() - started) * 1000
+
+        fresh = []
+        for _ in range(5):
+            client = AsyncOpenAI()
+            fresh.append(await first_request(client))
+            await client.close()
+        await first_request(shared_openai_client())
+        shared = [await first_request(shared_openai_client()) for _ in range(5)]
+        print(f"{'fresh connection':>20}: {sum(fresh) / len(fresh):7.1f} ms per request (TCP + TLS each time)")
+        print(f"{'shared keep-alive':>20}: {sum(shared) / len(shared):7.1f} ms per request")
+        await close_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
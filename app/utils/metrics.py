@@ -0,0 +1,88 @@
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# For in-process work such as catalog-backed tools
+FAST_LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None past the last bound)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {f"le_{bound}": count for bound, count in zip(self.bounds, self.counts) if count},
+            "overflow": self.counts[-1],
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-local counters and latency histograms, keyed by name plus labels, e.g.
+    `llm.cached_tokens{model=o4-mini}`. Served as JSON by /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1, **labels: str):
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def observe(self, name: str, value: float, buckets: Iterable[float] = LATENCY_BUCKETS_MS, **labels: str):
+        """Buckets only apply when the histogram is first created."""
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(sorted(self._counters.items())),
+                "histograms": {key: histogram.snapshot() for key, histogram in sorted(self._histograms.items())},
+            }
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,207 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Stream Parser", "app.log")
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class AgentResponseStreamParser:
+    """
+    Incremental parser for the JSON object described by AgentResponse.
+
+    The model output is fed in arbitrary chunks. Characters of the top-level
+    "response" string are decoded and returned as soon as they arrive, and the
+    top-level "options" value is returned once it is complete. Anything before
+    the first '{' (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self, stream_key: str = "response", collect_keys: tuple = ("options",)):
+        self.stream_key = stream_key
+        self.collect_keys = collect_keys
+        self.reset()
+
+    def reset(self):
+        """Forget everything seen so far, ready for a new model output."""
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = None  # None, "" (after backslash) or partial \\u digits
+        self._expect_key = False
+        self._key_buffer: List[str] = []
+        self._current_key: Optional[str] = None
+        self._reading_key = False
+        self._streaming = False
+        self._collecting = False
+        self._collect_buffer: List[str] = []
+        self._pending_surrogate: Optional[int] = None
+        self.streamed: List[str] = []
+        self.collected: Dict[str, Any] = {}
+
+    @property
+    def text(self) -> str:
+        """The part of the streamed field decoded so far."""
+        return "".join(self.streamed)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Feed a chunk of model output.
+
+        Returns:
+            A list of events, each either {"response": "<fragment>"} or
+            {"<collected key>": <decoded value>}.
+        """
+        events: List[Dict[str, Any]] = []
+        fragment: List[str] = []
+
+        for char in chunk:
+            if self._done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+
+            if self._collecting:
+                self._collect_char(char, events)
+                continue
+
+            if self._in_string:
+                decoded = self._string_char(char)
+                if decoded is None:
+                    continue
+                if self._reading_key:
+                    self._key_buffer.append(decoded)
+                elif self._streaming:
+                    fragment.append(decoded)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._reading_key = True
+                    self._key_buffer = []
+                elif self._depth == 1 and self._current_key == self.stream_key:
+                    self._streaming = True
+                continue
+
+            if char.isspace():
+                continue
+
+            if self._depth == 1 and char == ":":
+                if self._current_key in self.collect_keys:
+                    self._collecting = True
+                    self._collect_buffer = []
+                    self._collect_depth = 0
+                    self._collect_in_string = False
+                    self._collect_escape = False
+                continue
+
+            if char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._done = True
+            elif char == "," and self._depth == 1:
+                self._expect_key = True
+                self._current_key = None
+
+        if fragment:
+            text = "".join(fragment)
+            self.streamed.append(text)
+            events.insert(0, {self.stream_key: text})
+        return events
+
+    def _string_char(self, char: str) -> Optional[str]:
+        """Consume one character inside a string, returning its decoded form if complete."""
+        if self._escape is not None:
+            if self._escape == "":
+                if char == "u":
+                    self._escape = "u"
+                    return None
+                self._escape = None
+                return _ESCAPES.get(char, char)
+            self._escape += char
+            if len(self._escape) < 5:
+                return None
+            code = int(self._escape[1:], 16)
+            self._escape = None
+            if 0xD800 <= code < 0xDC00:
+                self._pending_surrogate = code
+                return None
+            if 0xDC00 <= code < 0xE000 and self._pending_surrogate is not None:
+                code = 0x10000 + ((self._pending_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                self._pending_surrogate = None
+            return chr(code)
+
+        if char == "\\":
+            self._escape = ""
+            return None
+
+        if char == '"':
+            self._in_string = False
+            if self._reading_key:
+                self._reading_key = False
+                self._expect_key = False
+                self._current_key = "".join(self._key_buffer)
+            self._streaming = False
+            return None
+
+        return char
+
+    def _collect_char(self, char: str, events: List[Dict[str, Any]]):
+        """Accumulate the raw text of a collected value until it is complete."""
+        if self._collect_in_string:
+            self._collect_buffer.append(char)
+            if self._collect_escape:
+                self._collect_escape = False
+            elif char == "\\":
+                self._collect_escape = True
+            elif char == '"':
+                self._collect_in_string = False
+            return
+
+        if self._collect_depth == 0 and char in ",}":
+            self._finish_collect(events)
+            # Let the top-level scanner see the delimiter as well.
+            self._collecting = False
+            if char == "}":
+                self._depth = 0
+                self._done = True
+            else:
+                self._expect_key = True
+                self._current_key = None
+            return
+
+        self._collect_buffer.append(char)
+        if char == '"':
+            self._collect_in_string = True
+        elif char in "{[":
+            self._collect_depth += 1
+        elif char in "}]":
+            self._collect_depth -= 1
+
+    def _finish_collect(self, events: List[Dict[str, Any]]):
+        raw = "".join(self._collect_buffer).strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not decode streamed '{self._current_key}' value: {e}")
+            return
+        self.collected[self._current_key] = value
+        events.append({self._current_key: value})
@@ -0,0 +1,248 @@
+import asyncio
+import io
+import os
+import wave
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+import numpy as np
+from fastapi import UploadFile
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+
+from .audio_preprocess import (
+    COMPRESS_CODEC,
+    PREPROCESS_ENABLED,
+    PreprocessReport,
+    compress,
+    compression_available,
+    preprocess_wav,
+    window_energies,
+)
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: STT", "app.log")
+
+STT_MODEL = "whisper-1"
+MAX_UPLOAD_BYTES = int(os.environ.get("STT_MAX_UPLOAD_MB", 100)) * 1024 * 1024
+# Whisper's own per-request limit; only WAV uploads can be split to get under it
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+SEGMENT_SECONDS = float(os.environ.get("STT_SEGMENT_SECONDS", 30))
+SILENCE_SEARCH_SECONDS = float(os.environ.get("STT_SILENCE_SEARCH_SECONDS", 5))
+MAX_CONCURRENCY = int(os.environ.get("STT_MAX_CONCURRENCY", 4))
+WINDOW_MS = 30
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds what we are willing to transcribe."""
+
+
+class Transcription(BaseModel):
+    text: str
+    preprocessing: Optional[PreprocessReport] = None
+
+
+def check_upload_size(size: int, limit: int = MAX_UPLOAD_BYTES):
+    if size > limit:
+        raise UploadTooLargeError(f"Audio upload is {size} bytes, the limit is {limit} bytes.")
+
+
+def upload_size(file: UploadFile) -> int:
+    """Size of a spooled upload, measured without reading it into memory."""
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+def is_wav(fileobj: BinaryIO) -> bool:
+    header = fileobj.read(12)
+    fileobj.seek(0)
+    return len(header) == 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def decodable_wav(fileobj: BinaryIO) -> bool:
+    """
+    Whether the stdlib wave module can read this WAV. It only decodes integer
+    PCM: IEEE-float files (and, before Python 3.12, WAVE_FORMAT_EXTENSIBLE ones)
+    are valid WAVs it rejects.
+    """
+    try:
+        with wave.open(fileobj, "rb"):
+            return True
+    except (wave.Error, EOFError) as e:
+        logger.info(f"WAV upload cannot be decoded here, sending it as is: {e}")
+        return False
+    finally:
+        fileobj.seek(0)
+
+
+def plan_segments(
+    energies: np.ndarray,
+    window_frames: int,
+    total_frames: int,
+    framerate: int,
+    segment_seconds: float = SEGMENT_SECONDS,
+    search_seconds: float = SILENCE_SEARCH_SECONDS,
+) -> List[Tuple[int, int]]:
+    """
+    Splits the audio into segments no longer than `segment_seconds`.
+
+    Each cut is placed at the quietest window within the last `search_seconds` before
+    the hard limit, so words are rarely cut in half.
+
+    Returns:
+        (start_frame, end_frame) pairs covering the whole clip in order.
+    """
+    max_windows = max(1, int(segment_seconds * framerate) // window_frames)
+    search_windows = max(1, min(max_windows - 1, int(search_seconds * framerate) // window_frames))
+
+    bounds = []
+    start = 0
+    n_windows = len(energies)
+    while n_windows - start > max_windows:
+        lo = start + max_windows - search_windows
+        hi = start + max_windows
+        cut = lo + int(np.argmin(energies[lo:hi]))
+        if cut <= start:
+            cut = hi
+        bounds.append((start * window_frames, cut * window_frames))
+        start = cut
+    bounds.append((start * window_frames, total_frames))
+    return bounds
+
+
+def read_segment(wav: wave.Wave_read, start: int, end: int) -> bytes:
+    """Copies a frame range into a standalone WAV file in memory."""
+    wav.setpos(start)
+    raw = wav.readframes(end - start)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(wav.getnchannels())
+        out.setsampwidth(wav.getsampwidth())
+        out.setframerate(wav.getframerate())
+        out.writeframes(raw)
+    return buffer.getvalue()
+
+
+async def transcribe_bytes(client: AsyncOpenAI, audio: Union[bytes, BinaryIO], filename: str = "audio.wav", content_type: str = "audio/wav") -> str:
+    # Whisper auto-detects language
+    transcription = await client.audio.transcriptions.create(
+        model=STT_MODEL,
+        file=(filename, audio, content_type),
+    )
+    return transcription.text
+
+
+async def transcribe_wav(
+    client: AsyncOpenAI,
+    fileobj: BinaryIO,
+    max_concurrency: int = MAX_CONCURRENCY,
+    codec: Optional[str] = None,
+) -> Tuple[str, int]:
+    """
+    Transcribes a WAV file in silence-aligned segments.
+
+    Segments are read one at a time and each is sent to Whisper as soon as a
+    concurrency slot is free, so at most `max_concurrency` segments are held in
+    memory. The transcripts are joined back in their original order. With a `codec`,
+    every segment is re-encoded with ffmpeg before upload.
+
+    Returns:
+        The transcript and the number of audio bytes uploaded.
+    """
+    wav = wave.open(fileobj, "rb")
+    uploaded = 0
+    try:
+        framerate = wav.getframerate()
+        total_frames = wav.getnframes()
+        window_frames = max(1, framerate * WINDOW_MS // 1000)
+
+        energies = await asyncio.to_thread(window_energies, wav, window_frames)
+        bounds = plan_segments(energies, window_frames, total_frames, framerate)
+        logger.info(f"Transcribing {total_frames / framerate:.1f}s of audio in {len(bounds)} segment(s)")
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(segment: bytes) -> str:
+            nonlocal uploaded
+            try:
+                filename, content_type = "audio.wav", "audio/wav"
+                if codec:
+                    segment, filename, content_type = await compress(segment, codec)
+                uploaded += len(segment)
+                return await transcribe_bytes(client, segment, filename, content_type)
+            finally:
+                semaphore.release()
+
+        tasks = []
+        try:
+            for start, end in bounds:
+                await semaphore.acquire()
+                try:
+                    segment = await asyncio.to_thread(read_segment, wav, start, end)
+                except Exception:
+                    semaphore.release()
+                    raise
+                tasks.append(asyncio.create_task(run(segment)))
+            texts = await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            raise
+    finally:
+        wav.close()
+
+    return " ".join(text.strip() for text in texts if text and text.strip()), uploaded
+
+
+async def transcribe_decoded_wav(client: AsyncOpenAI, fileobj: BinaryIO, size: int) -> Transcription:
+    if not PREPROCESS_ENABLED:
+        text, _ = await transcribe_wav(client, fileobj)
+        return Transcription(text=text)
+
+    processed, report = await asyncio.to_thread(preprocess_wav, fileobj, size)
+    try:
+        codec = COMPRESS_CODEC if compression_available() else None
+        text, uploaded = await transcribe_wav(client, processed, codec=codec)
+    finally:
+        processed.close()
+    report.processed_bytes = uploaded
+    if codec:
+        report.codec = codec
+    logger.info(
+        f"Audio preprocessing saved {report.bytes_saved} bytes "
+        f"({report.original_bytes} -> {report.processed_bytes}, "
+        f"{report.original_seconds}s -> {report.processed_seconds}s)"
+    )
+    return Transcription(text=text, preprocessing=report)
+
+
+async def transcribe_audio(client: AsyncOpenAI, fileobj: BinaryIO, size: int, filename: str = "audio", content_type: Optional[str] = None) -> Transcription:
+    """
+    Transcribes a seekable audio file.
+
+    WAV audio is preprocessed (silence trimmed, mono, 16 kHz, optionally
+    compressed), split on silence and transcribed in parallel. Other containers
+    cannot be decoded here, so they go to Whisper untouched in one request and must
+    fit under its size limit, as do WAVs the wave module cannot decode.
+    """
+    check_upload_size(size)
+
+    if is_wav(fileobj) and decodable_wav(fileobj):
+        try:
+            return await transcribe_decoded_wav(client, fileobj, size)
+        except (wave.Error, EOFError) as e:
+            logger.warning(f"Could not decode the WAV upload, sending it as is: {e}")
+            fileobj.seek(0)
+
+    check_upload_size(size, WHISPER_MAX_BYTES)
+    fileobj.seek(0)
+    text = await transcribe_bytes(client, fileobj, filename, content_type)
+    return Transcription(text=text)
+
+
+async def transcribe_upload(client: AsyncOpenAI, file: UploadFile) -> Transcription:
+    """Transcribes an uploaded audio file straight from Starlette's spooled temp file."""
+    return await transcribe_audio(client, file.file, upload_size(file), file.filename or "audio", file.content_type)
@@ -0,0 +1,118 @@
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: TTS", "app.log")
+
+TTS_MODEL = "gpt-4o-mini-tts"
+DEFAULT_VOICE = "verse"
+DEFAULT_FORMAT = "wav"
+CHUNK_SIZE = 4096
+
+TTS_INSTRUCTIONS = 'Voice Affect: Calm, composed, and reassuring. Competent and in control, instilling trust.\n\nTone: Sincere, empathetic, with genuine concern for the customer and understanding of the situation.\n\nPacing: Slower during the apology to allow for clarity and processing. Faster when offering solutions to signal action and resolution.\n\nEmotions: Calm reassurance, empathy, and gratitude.\n\nPronunciation: Clear, precise: Ensures clarity, especially with key details.'
+
+# Output formats we serve, in order of preference when the client accepts several.
+# pcm is raw 24kHz 16-bit little-endian mono without a header.
+AUDIO_FORMATS = {
+    "opus": "audio/ogg",
+    "mp3": "audio/mpeg",
+    "pcm": "audio/pcm",
+    "wav": "audio/wav",
+}
+
+_MEDIA_TYPE_ALIASES = {
+    "audio/opus": "opus",
+    "audio/ogg": "opus",
+    "audio/webm": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/pcm": "pcm",
+    "audio/l16": "pcm",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+}
+
+
+def negotiate_audio_format(requested: Optional[str] = None, accept: Optional[str] = None) -> str:
+    """
+    Picks the audio format for a TTS response.
+
+    An explicit `format` in the request body wins. Otherwise the Accept header is
+    matched against the supported media types, honouring q-values. Falls back to WAV
+    so clients that send neither keep getting what they always got.
+    """
+    if requested:
+        requested = requested.lower().strip()
+        if requested in AUDIO_FORMATS:
+            return requested
+        if requested in _MEDIA_TYPE_ALIASES:
+            return _MEDIA_TYPE_ALIASES[requested]
+        raise ValueError(f"Unsupported audio format: {requested}")
+
+    if accept:
+        candidates = []
+        for position, part in enumerate(accept.split(",")):
+            media_type, *params = [p.strip() for p in part.split(";")]
+            quality = 1.0
+            for param in params:
+                if param.startswith("q="):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            fmt = _MEDIA_TYPE_ALIASES.get(media_type.lower())
+            if fmt and quality > 0:
+                candidates.append((-quality, position, fmt))
+        if candidates:
+            return min(candidates)[2]
+
+    return DEFAULT_FORMAT
+
+
+async def open_speech_stream(
+    client: AsyncOpenAI,
+    text: str,
+    voice: str = DEFAULT_VOICE,
+    audio_format: str = DEFAULT_FORMAT,
+    instructions: str = TTS_INSTRUCTIONS,
+) -> Tuple[AsyncIterator[bytes], AsyncExitStack]:
+    """
+    Starts a streaming speech synthesis request.
+
+    The request is opened before returning so upstream errors surface to the caller
+    instead of in the middle of a streamed body.
+
+    Returns:
+        An async iterator over audio chunks and the exit stack that closes the
+        upstream response once the iterator is exhausted or abandoned.
+    """
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(
+            client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=text,
+                response_format=audio_format,
+                instructions=instructions,
+            )
+        )
+    except Exception:
+        await stack.aclose()
+        raise
+
+    async def chunks() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in response.iter_bytes(CHUNK_SIZE):
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error streaming TTS audio: {e}")
+            raise
+        finally:
+            await stack.aclose()
+
+    return chunks(), stack
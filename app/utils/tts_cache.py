@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from openai import AsyncOpenAI
+
+from .tts import DEFAULT_FORMAT, DEFAULT_VOICE, TTS_INSTRUCTIONS, open_speech_stream
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: TTS Cache", "app.log")
+
+# Fixed phrases the server and the agent prompt send verbatim on almost every conversation.
+DEFAULT_HOT_PHRASES = [
+    "I have gathered all the necessary information. Is this summary correct?",
+    "Your issue is being processed and we'll find a suitable geek for you shortly.",
+    "Please select a Geek to proceed",
+    "No suitable geeks found. Please try later.",
+    "What brand is your device?",
+    "How often does this issue occur?",
+]
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio.
+
+    Entries are keyed by a SHA-256 of (text, voice, instructions, format) and kept in
+    two size-bounded LRU tiers: an in-memory dict for the hottest clips and a directory
+    on disk that survives restarts. A disk hit is promoted back into memory.
+    """
+
+    def __init__(self, cache_dir: str, max_memory_bytes: int, max_disk_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    @classmethod
+    def from_env(cls) -> "TTSCache":
+        return cls(
+            cache_dir=os.environ.get("TTS_CACHE_DIR", ".tts_cache"),
+            max_memory_bytes=int(os.environ.get("TTS_CACHE_MEMORY_MB", 32)) * 1024 * 1024,
+            max_disk_bytes=int(os.environ.get("TTS_CACHE_DISK_MB", 512)) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def make_key(text: str, voice: str, instructions: str, audio_format: str) -> str:
+        payload = json.dumps([text, voice, instructions, audio_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.audio")
+
+    def _load_disk_index(self):
+        """Rebuilds the disk LRU order from file modification times."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".audio"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, name[: -len(".audio")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        logger.info(f"TTS cache loaded {len(self._disk)} clips ({self._disk_bytes} bytes) from disk")
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _write_disk(self, key: str, data: bytes, evicted: List[str]):
+        """Writes a clip to disk and deletes the files of evicted clips."""
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+
+        if key in self._disk:
+            try:
+                data = await asyncio.to_thread(self._read_disk, key)
+            except FileNotFoundError:
+                self._disk_bytes -= self._disk.pop(key, 0)
+            else:
+                self._disk.move_to_end(key)
+                self._remember(key, data)
+                self.hits += 1
+                self.disk_hits += 1
+                return data
+
+        self.misses += 1
+        return None
+
+    def _read_disk(self, key: str) -> bytes:
+        path = self._path(key)
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+
+    async def put(self, key: str, data: bytes):
+        if not data:
+            return
+        self._remember(key, data)
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key)
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+
+        # Bookkeeping stays on the event loop, only the file I/O goes to a thread
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(old_key)
+
+        try:
+            await asyncio.to_thread(self._write_disk, key, data, evicted)
+            if evicted:
+                logger.info(f"TTS cache evicted {len(evicted)} clips from disk")
+        except OSError as e:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            logger.error(f"Error writing TTS clip to cache: {e}")
+
+    async def tee(self, key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Passes audio chunks through and caches the clip once it has streamed completely."""
+        buffer = bytearray()
+        async for chunk in chunks:
+            buffer.extend(chunk)
+            yield chunk
+        await self.put(key, bytes(buffer))
+
+    async def synthesize(
+        self,
+        client: AsyncOpenAI,
+        text: str,
+        voice: str = DEFAULT_VOICE,
+        audio_format: str = DEFAULT_FORMAT,
+        instructions: str = TTS_INSTRUCTIONS,
+    ) -> bytes:
+        """Returns the full clip for a phrase, synthesizing and caching it on a miss."""
+        key = self.make_key(text, voice, instructions, audio_format)
+        data = await self.get(key)
+        if data is not None:
+            return data
+        return await self._render(client, key, text, voice, audio_format, instructions)
+
+    async def _render(self, client: AsyncOpenAI, key: str, text: str, voice: str, audio_format: str, instructions: str) -> bytes:
+        audio_chunks, _ = await open_speech_stream(client, text=text, voice=voice, audio_format=audio_format, instructions=instructions)
+        buffer = bytearray()
+        async for chunk in audio_chunks:
+            buffer.extend(chunk)
+        data = bytes(buffer)
+        await self.put(key, data)
+        return data
+
+    async def prerender(self, client: AsyncOpenAI, phrases: Iterable[str], voices: Iterable[str], formats: Iterable[str]):
+        """Synthesizes the hot phrases that are not cached yet."""
+        rendered = 0
+        for phrase in phrases:
+            for voice in voices:
+                for audio_format in formats:
+                    key = self.make_key(phrase, voice, TTS_INSTRUCTIONS, audio_format)
+                    if key in self._memory or key in self._disk:
+                        continue
+                    try:
+                        await self._render(client, key, phrase, voice, audio_format, TTS_INSTRUCTIONS)
+                        rendered += 1
+                    except Exception as e:
+                        logger.error(f"Error pre-rendering TTS phrase '{phrase}': {e}")
+        logger.info(f"TTS cache pre-rendered {rendered} clips")
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+def load_hot_phrases() -> List[str]:
+    """
+    Reads the phrases to pre-render at startup.
+
+    TTS_HOT_PHRASES_FILE points at a text file with one phrase per line; without it the
+    built-in DEFAULT_HOT_PHRASES are used.
+    """
+    path = os.environ.get("TTS_HOT_PHRASES_FILE")
+    if not path:
+        return list(DEFAULT_HOT_PHRASES)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        logger.error(f"Error reading TTS hot phrases from {path}: {e}")
+        return list(DEFAULT_HOT_PHRASES)
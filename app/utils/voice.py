@@ -0,0 +1,177 @@
+import asyncio
+import io
+import json
+import re
+from typing import List, Optional
+
+from fastapi import WebSocket
+from openai import AsyncOpenAI
+
+from .stt import Transcription, transcribe_audio
+from .tts import DEFAULT_FORMAT, DEFAULT_VOICE
+from .tts_cache import TTSCache
+from ..logs.logger import setup_logger
+
+logger = setup_logger("GoD AI Chatbot: Voice", "app.log")
+
+# Sentence end: terminal punctuation followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?…।])\s+|\n+")
+
+
+async def transcribe_utterance(client: AsyncOpenAI, audio: bytes, audio_format: str = "wav") -> Transcription:
+    """Transcribes one utterance received as binary WebSocket frames."""
+    return await transcribe_audio(client, io.BytesIO(audio), len(audio), filename=f"audio.{audio_format}")
+
+
+class UtteranceBuffer:
+    """
+    Collects the binary frames of one spoken message, up to `max_bytes`. An
+    utterance that outgrows it is dropped as a whole, frames and all, until the
+    client ends it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._buffer = bytearray()
+        self.overflowed = False
+
+    def add(self, frame: bytes) -> Optional[str]:
+        """Buffers a frame; returns an error for the client when the utterance is dropped."""
+        if self.overflowed:
+            return None
+        if len(self._buffer) + len(frame) > self.max_bytes:
+            self._buffer = bytearray()
+            self.overflowed = True
+            return f"Audio message exceeds {self.max_bytes} bytes."
+        self._buffer.extend(frame)
+        return None
+
+    def take(self) -> bytes:
+        """The utterance (empty if it was dropped), resetting for the next one."""
+        audio = bytes(self._buffer)
+        self._buffer = bytearray()
+        self.overflowed = False
+        return audio
+
+
+class SentenceSplitter:
+    """Accumulates streamed text and hands back complete sentences."""
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.start()].strip()
+            # Very short pieces ("Hi.", "1.") are merged into the next sentence
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest or None
+
+
+class VoiceReplyStreamer:
+    """
+    Speaks a streamed agent reply back over the chat socket.
+
+    Text is split at sentence boundaries while the model is still writing, each
+    sentence is synthesized (through the TTS cache) as soon as it is complete, and
+    the clips are sent in order as an {"type": "audio", ...} text frame followed by
+    one binary frame with the audio. Synthesis of later sentences overlaps with
+    sending earlier ones.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        client: AsyncOpenAI,
+        tts_cache: TTSCache,
+        voice: str = DEFAULT_VOICE,
+        audio_format: str = DEFAULT_FORMAT,
+        max_parallel: int = 2,
+    ):
+        self.websocket = websocket
+        self.client = client
+        self.tts_cache = tts_cache
+        self.voice = voice
+        self.audio_format = audio_format
+        self.splitter = SentenceSplitter()
+        self.fed = False
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._sender = asyncio.create_task(self._send_in_order())
+
+    def feed(self, text: str):
+        self.fed = True
+        for sentence in self.splitter.feed(text):
+            self._schedule(sentence)
+
+    def _schedule(self, sentence: str):
+        task = asyncio.create_task(self._synthesize(sentence))
+        self._queue.put_nowait((sentence, task))
+
+    async def _synthesize(self, sentence: str) -> bytes:
+        async with self._semaphore:
+            return await self.tts_cache.synthesize(self.client, sentence, voice=self.voice, audio_format=self.audio_format)
+
+    async def _send_in_order(self):
+        index = 0
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            sentence, task = item
+            try:
+                audio = await task
+            except Exception as e:
+                logger.error(f"Error synthesizing sentence for voice reply: {e}")
+                continue
+            await self.websocket.send_text(json.dumps({
+                "type": "audio",
+                "index": index,
+                "text": sentence,
+                "format": self.audio_format,
+                "bytes": len(audio),
+            }))
+            await self.websocket.send_bytes(audio)
+            index += 1
+        await self.websocket.send_text(json.dumps({"type": "audio_end", "clips": index}))
+
+    async def finish(self, full_text: Optional[str] = None):
+        """
+        Speaks whatever is left and waits until every clip has been sent.
+
+        If nothing was streamed (e.g. the reply was not streamable JSON), the final
+        reply text is split and spoken instead.
+        """
+        if not self.fed and full_text:
+            self.feed(full_text)
+        rest = self.splitter.flush()
+        if rest:
+            self._schedule(rest)
+        self._queue.put_nowait(None)
+        await self._sender
+
+    async def cancel(self):
+        self._sender.cancel()
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                item[1].cancel()
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # e.g. the socket closed under a send
+            logger.error(f"Voice reply sender ended with an error: {e}")
@@ -1,10 +1,13 @@
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 from langchain.callbacks.base import AsyncCallbackHandler
+import json
 
 # from typing import List
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from uuid import UUID
 
+from .stream_parser import AgentResponseStreamParser
+
 class ConnectionManager:
     """Class defining socket events"""
     def __init__(self):
@@ -23,15 +26,38 @@ class ConnectionManager:
     async def receive_message(self, websocket: WebSocket):
         """receive message event"""
         return await websocket.receive_text()
+    
+    async def receive_frame(self, websocket: WebSocket) -> Union[str, bytes]:
+        """receive a text or binary frame"""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        return message.get("text")
         
     def disconnect(self, websocket: WebSocket):
         """disconnect event"""
         self.active_connections.remove(websocket)
         
 class WebSocketCallbackHandler(AsyncCallbackHandler):
-    def __init__(self, websocket: WebSocket, manager: ConnectionManager):
+    """
+    Streams the agent's reply to the client while the model is still generating.
+
+    Every model call inside the agent is parsed incrementally; fragments of the
+    `response` field are sent as {"type": "response_delta", "response": ...} frames
+    and the `options` list as a single {"type": "options", "options": [...]} frame
+    once it is complete. Tool-calling steps produce no content and send nothing.
+
+    With `send_deltas=False` nothing is sent as text; the parsed fragments only go to
+    `voice_streamer`, which is set for the duration of a voice turn.
+    """
+    def __init__(self, websocket: WebSocket, manager: ConnectionManager, send_deltas: bool = True):
         self.websocket = websocket
         self.manager = manager
+        self.send_deltas = send_deltas
+        self.voice_streamer = None
+        self.parser = AgentResponseStreamParser()
         
     async def on_chat_model_start(
         self,
@@ -44,8 +70,8 @@ class WebSocketCallbackHandler(AsyncCallbackHandler):
         metadata: Optional[Dict[str, Any]] = None,
         **kwargs: Any,
     ) -> None:
-        # Optional: Send a message to the client indicating the start of processing
-        # await self.manager.send_message("Chat model processing started.", self.websocket)
+        # Each agent step is a fresh model output, so parsing starts over.
+        self.parser.reset()
         return None
     
     async def on_llm_start(
@@ -59,14 +85,22 @@ class WebSocketCallbackHandler(AsyncCallbackHandler):
         metadata: Optional[Dict[str, Any]] = None,
         **kwargs: Any,
     ) -> None:
-        # Optional: Send a message to the client indicating the start of processing
-        # await self.manager.send_message("Chat model processing started.", self.websocket)
+        self.parser.reset()
         return None
         
     async def on_llm_new_token(self, token: str, **kwargs):
-        """Send each new token to the client"""
-        await self.manager.send_message(token, self.websocket)
+        """Send the decoded response text and options to the client as they arrive"""
+        for event in self.parser.feed(token):
+            if "response" in event:
+                if self.voice_streamer is not None:
+                    self.voice_streamer.feed(event["response"])
+                frame = {"type": "response_delta", "response": event["response"]}
+            else:
+                frame = {"type": "options", "options": event.get("options")}
+            if self.send_deltas:
+                await self.manager.send_message(json.dumps(frame), self.websocket)
         
     async def on_llm_end(self, reponse, **kwargs):
-        """Signal the end of response."""
-        await self.manager.send_message("[END]", self.websocket)
\ No newline at end of file
+        """Signal the end of a streamed response."""
+        if self.send_deltas and self.parser.streamed:
+            await self.manager.send_message(json.dumps({"type": "response_end"}), self.websocket)
@@ -0,0 +1,48 @@
+import io
+import os
+import struct
+import wave
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+
+def pcm_wav(samples: np.ndarray, rate: int = 16000) -> bytes:
+    """A 16-bit mono PCM WAV of float samples in [-1, 1]."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def float_wav(samples: np.ndarray, rate: int = 16000) -> bytes:
+    """A 32-bit IEEE-float mono WAV (format tag 3), which the wave module cannot read."""
+    data = samples.astype("<f4").tobytes()
+    fmt = struct.pack("<HHIIHH", 3, 1, rate, rate * 4, 4, 32)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+class FakeWhisper:
+    """Stands in for AsyncOpenAI: records every transcription request."""
+
+    def __init__(self, text: str = "hello"):
+        self.requests = []
+        self.text = text
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, file):
+        filename, audio, content_type = file
+        self.requests.append((filename, audio.read() if hasattr(audio, "read") else audio, content_type))
+        return SimpleNamespace(text=self.text)
+
+
+@pytest.fixture
+def whisper():
+    return FakeWhisper()
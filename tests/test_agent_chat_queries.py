@@ -0,0 +1,312 @@
+import asyncio
+import copy
+from collections import OrderedDict
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.db import agent_chat_queries
+from app.db.agent_chat_queries import (
+    append_messages_to_convo,
+    get_chat_history_with_agent,
+    get_conversation_snapshot,
+    get_conversations_by_user,
+    get_message_count,
+    get_messages_range,
+    save_conversation_flow,
+    save_issue_draft,
+)
+from app.models.agent_chat_model import ChatMessageBase, ConversationSummary, MessageSender
+
+USER_ID = str(ObjectId())
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field, _MISSING)
+        if isinstance(condition, dict) and "$exists" in condition:
+            if (value is not _MISSING) != condition["$exists"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _evaluate(expression, doc: dict):
+    """The few aggregation expressions the header update uses."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = doc
+        for part in expression[1:].split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    if isinstance(expression, dict) and len(expression) == 1:
+        (operator, argument), = expression.items()
+        if operator == "$literal":
+            return argument
+        if operator == "$ifNull":
+            value = _evaluate(argument[0], doc)
+            return value if value is not None else _evaluate(argument[1], doc)
+        if operator == "$add":
+            return sum(_evaluate(term, doc) for term in argument)
+        if operator == "$lt":
+            return _evaluate(argument[0], doc) < _evaluate(argument[1], doc)
+        if operator == "$cond":
+            return _evaluate(argument[1] if _evaluate(argument[0], doc) else argument[2], doc)
+    return expression
+
+
+_MISSING = object()
+
+
+class FakeCollection:
+    """An in-memory stand-in for the collection methods the chat queries call."""
+
+    def __init__(self, unique: str = None):
+        self.docs = []
+        self.unique = unique
+
+    def _find(self, query):
+        return next((doc for doc in self.docs if _matches(doc, query)), None)
+
+    def _insert(self, doc):
+        if self.unique and any(d.get(self.unique) == doc.get(self.unique) for d in self.docs):
+            raise DuplicateKeyError("duplicate key")
+        self.docs.append({"_id": ObjectId(), **doc})
+
+    async def find_one(self, query, projection=None):
+        doc = self._find(query)
+        if doc is None:
+            return None
+        doc = copy.deepcopy(doc)
+        window = (projection or {}).get("chat_messages")
+        if isinstance(window, dict):
+            offset, limit = window["$slice"]
+            doc["chat_messages"] = doc["chat_messages"][offset:offset + limit]
+        return doc
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self._insert(copy.deepcopy(doc))
+
+    async def delete_many(self, query):
+        self.docs = [doc for doc in self.docs if not _matches(doc, query)]
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self._find(query)
+        matched = doc is not None
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0)
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            self._insert(doc)
+            doc = self.docs[-1]
+        if isinstance(update, list):
+            doc.update({field: _evaluate(expression, doc) for field, expression in update[0]["$set"].items()})
+        else:
+            doc.update(copy.deepcopy(update.get("$set", {})))
+        return SimpleNamespace(matched_count=int(matched))
+
+    async def find_one_and_update(self, query, pipeline, upsert=False, return_document=None):
+        doc = self._find(query)
+        if doc is None:
+            self._insert(dict(query))
+            doc = self.docs[-1]
+        updates = {field: _evaluate(expression, doc) for field, expression in pipeline[0]["$set"].items()}
+        doc.update(updates)
+        return copy.deepcopy(doc)
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            query, update = operation._filter, operation._doc
+            doc = self._find(query)
+            if doc is None:
+                self._insert({**query, **update.get("$setOnInsert", {}), "messages": [], "count": 0})
+                doc = self.docs[-1]
+            push = update["$push"]["messages"]
+            doc["messages"] = sorted(doc["messages"] + copy.deepcopy(push["$each"]), key=lambda m: m["seq"])
+            doc["count"] += update["$inc"]["count"]
+
+    async def aggregate(self, pipeline):
+        """Only the bucket range read of get_messages_range and the legacy message count."""
+        match = pipeline[0]["$match"]
+        if "bucket" not in match:
+            return FakeCursor([{"count": len(doc["chat_messages"])} for doc in self.docs if _matches(doc, match)])
+        low, high = match["bucket"]["$gte"], match["bucket"]["$lte"]
+        condition = pipeline[2]["$project"]["messages"]["$filter"]["cond"]["$and"]
+        first, end = condition[0]["$gte"][1], condition[1]["$lt"][1]
+        buckets = sorted(
+            (doc for doc in self.docs if doc["conversation_id"] == match["conversation_id"] and low <= doc["bucket"] <= high),
+            key=lambda doc: doc["bucket"],
+        )
+        return FakeCursor([{"messages": [m for m in b["messages"] if first <= m["seq"] < end]} for b in buckets])
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+    async def to_list(self):
+        return list(self.docs)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.conversations = FakeCollection(unique="conversation_id")
+        self.chat_message_buckets = FakeCollection()
+        self.chat_messages_with_bot = FakeCollection()
+
+
+def message(text: str, sender: MessageSender = MessageSender.USER) -> ChatMessageBase:
+    return ChatMessageBase(sender=sender, message=text, sentAt=datetime.now(timezone.utc))
+
+
+def legacy_conversation(db: FakeDatabase, conversation_id: str, texts):
+    db.chat_messages_with_bot.docs.append({
+        "_id": ObjectId(),
+        "conversation_id": conversation_id,
+        "user_id": ObjectId(USER_ID),
+        "chat_messages": [message(text).model_dump(mode="python") for text in texts],
+    })
+
+
+def test_header_without_message_count_is_still_migrated(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "_bucketed_conversations", OrderedDict())
+    db = FakeDatabase()
+    legacy_conversation(db, "c1", ["hi", "my laptop", "it flickers"])
+    # State saved for the conversation before its first append after the layout change
+    db.conversations.docs.append({"_id": ObjectId(), "conversation_id": "c1", "memory_summary": {"facts": {}, "through": 0}})
+
+    async def main():
+        await append_messages_to_convo(USER_ID, "c1", [message("still flickers")], db)
+        assert await get_message_count("c1", db) == 4
+        messages = await get_messages_range("c1", db, 0, 4)
+        assert [m.message for m in messages] == ["hi", "my laptop", "it flickers", "still flickers"]
+        history = await get_chat_history_with_agent("c1", db)
+        assert len(history[0].chat_messages) == 4
+
+    asyncio.run(main())
+    header = db.conversations.docs[0]
+    assert header["memory_summary"] == {"facts": {}, "through": 0} and header["message_count"] == 4
+
+
+def test_legacy_history_survives_a_flow_save(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "_bucketed_conversations", OrderedDict())
+    db = FakeDatabase()
+    legacy_conversation(db, "c3", ["hi", "my phone", "won't charge"])
+
+    async def main():
+        # Resuming a legacy conversation saves its flow before anything is appended
+        assert not await save_conversation_flow("c3", {"state": "category"}, db)
+        assert await get_message_count("c3", db) == 3
+        await append_messages_to_convo(USER_ID, "c3", [message("hello again")], db)
+        assert await save_conversation_flow("c3", {"state": "category"}, db)
+        messages = await get_messages_range("c3", db, 0, 10)
+        assert [m.message for m in messages] == ["hi", "my phone", "won't charge", "hello again"]
+
+    asyncio.run(main())
+    assert db.conversations.docs[0]["flow"] == {"state": "category"}
+
+
+def test_message_range_follows_seq_not_position(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "BUCKET_SIZE", 3)
+    db = FakeDatabase()
+    # Bucket 0 is missing seq 1, e.g. a message lost to a partial write
+    db.chat_message_buckets.docs.append({
+        "conversation_id": "c2", "bucket": 0, "start_seq": 0,
+        "messages": [{**message(f"m{seq}").model_dump(mode="python"), "seq": seq} for seq in (0, 2)],
+    })
+    db.chat_message_buckets.docs.append({
+        "conversation_id": "c2", "bucket": 1, "start_seq": 3,
+        "messages": [{**message(f"m{seq}").model_dump(mode="python"), "seq": seq} for seq in (3, 4, 5)],
+    })
+
+    messages = asyncio.run(get_messages_range("c2", db, 2, 3))
+    assert [m.message for m in messages] == ["m2", "m3", "m4"]
+
+
+def test_older_issue_draft_does_not_replace_a_newer_one(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "_bucketed_conversations", OrderedDict())
+    db = FakeDatabase()
+
+    async def main():
+        await append_messages_to_convo(USER_ID, "c4", [message("hi"), message("my tv is dead")], db)
+        assert await save_issue_draft("c4", {"title": "TV"}, 2, db)
+        await save_issue_draft("c4", {"title": "stale"}, 1, db)
+
+    asyncio.run(main())
+    assert db.conversations.docs[0]["issue_draft"]["fields"] == {"title": "TV"}
+
+
+def test_empty_range_of_a_bucketed_conversation_skips_the_legacy_layout(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "_bucketed_conversations", OrderedDict())
+    db = FakeDatabase()
+
+    async def legacy_read(*args, **kwargs):
+        raise AssertionError("legacy layout read")
+
+    async def main():
+        await append_messages_to_convo(USER_ID, "c5", [message("hi")], db)
+        db.chat_messages_with_bot.find_one = legacy_read
+        assert await get_messages_range("c5", db, 5, 10) == []
+        assert await get_messages_range("c5", db, 5, 10, bucketed=True) == []
+
+    asyncio.run(main())
+
+
+def test_bucketed_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "_bucketed_conversations", OrderedDict())
+    monkeypatch.setattr(agent_chat_queries, "BUCKETED_CACHE_SIZE", 2)
+    db = FakeDatabase()
+
+    async def main():
+        for conversation_id in ("a", "b", "a", "c"):
+            await append_messages_to_convo(USER_ID, conversation_id, [message("hi")], db)
+
+    asyncio.run(main())
+    # "b" was the least recently used
+    assert list(agent_chat_queries._bucketed_conversations) == ["a", "c"]
+
+
+class ListingCursor(FakeCursor):
+    def sort(self, keys):
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+
+def test_listing_merges_conversations_not_migrated_yet(monkeypatch):
+    older, newer = datetime(2024, 1, 1), datetime(2024, 3, 1)
+    db = FakeDatabase()
+    db.conversations.find = lambda query, projection: ListingCursor([
+        {"conversation_id": "bucketed", "message_count": 2, "createdAt": older, "updatedAt": older},
+    ])
+
+    async def get_legacy_conversation_summaries(user_id, db, limit, keyset=None):
+        return [ConversationSummary(conversation_id="legacy", message_count=3, createdAt=older, updatedAt=newer)]
+
+    monkeypatch.setattr(agent_chat_queries, "get_legacy_conversation_summaries", get_legacy_conversation_summaries)
+
+    page = asyncio.run(get_conversations_by_user(USER_ID, db, limit=1))
+    assert [c.conversation_id for c in page.conversations] == ["legacy"]
+    assert page.next_cursor is not None
+
+
+def test_legacy_conversation_resumes_from_its_latest_messages(monkeypatch):
+    monkeypatch.setattr(agent_chat_queries, "_bucketed_conversations", OrderedDict())
+    db = FakeDatabase()
+    legacy_conversation(db, "c6", ["m0", "m1", "m2", "m3", "m4"])
+
+    snapshot = asyncio.run(get_conversation_snapshot("c6", db, max_messages=2))
+    assert (snapshot.message_count, snapshot.first_seq) == (5, 3)
+    assert [m.message for m in snapshot.messages] == ["m3", "m4"]
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.models.agent_chat_model import ChatMessageBase, ConversationSnapshot, MessageSender
+from app.utils.agent_setup import ERROR_REPLY, ChatAssistantChain
+from app.utils.chat_memory import TokenBudgetMemory
+
+
+class FailingExecutor:
+    async def ainvoke(self, inputs, config=None):
+        raise RuntimeError("rate limited")
+
+
+def test_failed_turn_returns_an_error_reply():
+    assistant = ChatAssistantChain.__new__(ChatAssistantChain)
+    assistant.callback_handler = None
+    assistant.agent_executor = FailingExecutor()
+
+    response = asyncio.run(assistant.run("my laptop"))
+
+    assert response["error"]
+    assert json.loads(response["response"])["response"] == ERROR_REPLY.response
+
+
+def test_resume_rebuilds_memory_from_the_stored_conversation():
+    assistant = ChatAssistantChain.__new__(ChatAssistantChain)
+    assistant.memory = TokenBudgetMemory(recent_turns=4)
+    snapshot = ConversationSnapshot(
+        message_count=7,
+        first_seq=4,
+        memory_summary={"device_details": {"brand": "Dell"}},
+        messages=[
+            ChatMessageBase(sender=MessageSender.USER, message="it flickers"),
+            ChatMessageBase(sender=MessageSender.BOT, message="Since when?"),
+            ChatMessageBase(sender=MessageSender.USER, message="since Monday"),
+        ],
+    )
+
+    pending = asyncio.run(_resume(assistant, snapshot))
+
+    # The unanswered message is handed back to be run again, not put in memory
+    assert pending == "since Monday"
+    memory = assistant.memory
+    assert memory.facts.device_details.brand == "Dell"
+    assert memory._first_seq == 4
+    human, ai = memory.messages
+    assert isinstance(human, HumanMessage) and human.content == "it flickers"
+    assert isinstance(ai, AIMessage) and json.loads(ai.content) == {"response": "Since when?", "options": None}
+
+
+async def _resume(assistant, snapshot):
+    return assistant.resume(snapshot)
@@ -0,0 +1,60 @@
+import asyncio
+from uuid import uuid4
+
+from bson import ObjectId
+
+from app.utils import agent_setup
+from app.utils.agent_setup import ToolTimingRecorder, catalog_tools
+from app.utils.catalog import CatalogData, CatalogSnapshot
+from app.utils.metrics import MetricsRegistry
+
+
+def laptop_catalog() -> CatalogSnapshot:
+    sub_id = ObjectId()
+    category = {"_id": ObjectId(), "title": "Laptops", "slug": "laptops", "subCategories": [str(sub_id)]}
+    snapshot = CatalogSnapshot(watch=False)
+    snapshot._data = CatalogData([category], [{"_id": sub_id, "title": "Battery"}], [{"name": "Dell", "category": category["_id"]}])
+    return snapshot
+
+
+def test_catalog_tools_are_coroutines_with_their_schemas():
+    tools = {tool.name: tool for tool in catalog_tools(laptop_catalog())}
+
+    assert set(tools) == {"get_subcategories", "get_brands", "get_categories"}
+    assert all(tool.coroutine is not None and tool.func is None for tool in tools.values())
+    assert list(tools["get_brands"].args) == ["category_slug"]
+    assert tools["get_categories"].args == {}
+
+    async def main():
+        return await asyncio.gather(
+            tools["get_subcategories"].ainvoke({"category_slug": "Laptops"}),
+            tools["get_brands"].ainvoke({"category_slug": "laptops"}),
+            tools["get_categories"].ainvoke({}),
+        )
+
+    assert asyncio.run(main()) == [["Battery"], ["Dell"], ["Laptops"]]
+
+
+def test_overlapping_tool_calls_record_the_time_saved(monkeypatch):
+    registry = MetricsRegistry()
+    clock = iter([0.0, 0.010, 0.050, 0.060, 1.0, 1.020])
+    monkeypatch.setattr(agent_setup, "metrics", registry)
+    monkeypatch.setattr(agent_setup.time, "perf_counter", lambda: next(clock))
+    recorder = ToolTimingRecorder()
+    subcategories, brands, categories = uuid4(), uuid4(), uuid4()
+
+    async def main():
+        # One step asking for subcategories and brands at once ...
+        await recorder.on_tool_start({"name": "get_subcategories"}, "", run_id=subcategories)
+        await recorder.on_tool_start({"name": "get_brands"}, "", run_id=brands)
+        await recorder.on_tool_end([], run_id=subcategories)
+        await recorder.on_tool_end([], run_id=brands)
+        # ... and a later step with a single call
+        await recorder.on_tool_start({"name": "get_categories"}, "", run_id=categories)
+        await recorder.on_tool_error(ValueError(), run_id=categories)
+
+    asyncio.run(main())
+    # 50 ms + 50 ms of calls within a 60 ms batch; a lone call saves nothing
+    assert recorder.summary() == {"calls": 3, "latency_ms": 120.0, "saved_ms": 40.0}
+    assert registry.counter("tool.concurrent_batches") == 1
+    assert registry.counter("tool.calls", tool="get_categories", outcome="error") == 1
@@ -0,0 +1,58 @@
+import io
+import wave
+
+import numpy as np
+
+from app.utils import audio_preprocess
+from app.utils.audio_preprocess import Resampler, preprocess_wav
+from tests.conftest import pcm_wav
+
+
+def resample_whole(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Reference: the filter and interpolation over the whole clip at once."""
+    if dst_rate < src_rate:
+        cutoff = 0.5 * dst_rate / src_rate * 0.9
+        taps = np.arange(-32, 33)
+        kernel = np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        kernel /= kernel.sum()
+        samples = np.convolve(samples, kernel.astype(np.float32), mode="same")
+    n_out = int(round(len(samples) / src_rate * dst_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(samples)), samples)
+
+
+def test_streaming_resampler_matches_whole_clip():
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.5, 0.5, 44100 * 3 + 17).astype(np.float32)
+    resampler = Resampler(44100, 16000)
+    blocks, position = [], 0
+    for size in (1000, 40, 30000, 7, 50000):
+        blocks.append(resampler.process(samples[position:position + size]))
+        position += size
+    blocks.append(resampler.process(samples[position:], final=True))
+    streamed = np.concatenate(blocks)
+
+    expected = resample_whole(samples, 44100, 16000)
+    assert len(streamed) == len(expected)
+    assert np.max(np.abs(streamed - expected)) < 1e-4
+
+
+def test_preprocess_trims_silence_and_resamples(monkeypatch):
+    monkeypatch.setattr(audio_preprocess, "BLOCK_SECONDS", 1)
+    rate = 44100
+    t = np.arange(2 * rate) / rate
+    speech = 0.5 * np.sin(2 * np.pi * 300 * t)
+    silence = np.zeros(3 * rate)
+    audio = pcm_wav(np.concatenate([silence, speech, silence]), rate)
+
+    processed, report = preprocess_wav(io.BytesIO(audio), len(audio))
+    with wave.open(processed, "rb") as wav:
+        assert wav.getframerate() == 16000
+        assert wav.getnchannels() == 1
+        seconds = wav.getnframes() / 16000
+
+    assert report.original_seconds == 8.0
+    # Speech plus the padding either side
+    assert 2.0 <= seconds <= 2.6
+    assert report.processed_seconds == round(seconds, 2)
+    assert report.processed_bytes < report.original_bytes
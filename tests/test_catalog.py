@@ -0,0 +1,183 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from app.db.change_feed import follow_changes
+from app.utils import catalog as catalog_module
+from app.utils import category_classifier
+from app.utils.catalog import CatalogData, CatalogSnapshot
+from app.utils.category_classifier import CategoryClassifier, classifier_for, rebuild_classifier
+
+
+class CountingSnapshot(CatalogSnapshot):
+    def __init__(self):
+        super().__init__(watch=False)
+        self.refreshes = 0
+
+    async def refresh(self):
+        self.refreshes += 1
+        await asyncio.sleep(0.01)
+
+
+class FakeStream:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for event in self.events:
+            yield event
+
+
+def test_burst_of_changes_reloads_once(monkeypatch):
+    monkeypatch.setattr(catalog_module, "CHANGE_DEBOUNCE_SECONDS", 0.05)
+
+    async def run():
+        snapshot = CountingSnapshot()
+        for _ in range(10):
+            await snapshot._on_change({"operationType": "update"})
+            await asyncio.sleep(0.01)
+        await snapshot._reload_task
+        return snapshot.refreshes
+
+    assert asyncio.run(run()) == 1
+
+
+def test_change_during_reload_triggers_another(monkeypatch):
+    monkeypatch.setattr(catalog_module, "CHANGE_DEBOUNCE_SECONDS", 0.01)
+
+    async def run():
+        snapshot = CountingSnapshot()
+        await snapshot._on_change({})
+        await asyncio.sleep(0.015)  # reload running
+        await snapshot._on_change({})
+        await snapshot._reload_task
+        return snapshot.refreshes
+
+    assert asyncio.run(run()) == 2
+
+
+def follow_until_reopened(streams, on_change, resync):
+    """Runs follow_changes over `streams` and stops it once it asks for one more."""
+    streams = list(streams)
+
+    async def main():
+        exhausted = asyncio.Event()
+
+        async def open_stream():
+            if not streams:
+                exhausted.set()
+                await asyncio.Event().wait()
+            return streams.pop(0)
+
+        task = asyncio.create_task(follow_changes("test", open_stream, on_change, resync, refresh_seconds=1, reopen_seconds=0))
+        await exhausted.wait()
+        task.cancel()
+
+    asyncio.run(main())
+
+
+def test_failing_callback_does_not_stop_the_feed():
+    applied = []
+
+    async def on_change(change):
+        if change["n"] == 1:
+            raise ValueError("bad document")
+        applied.append(change["n"])
+
+    async def resync():
+        pass
+
+    follow_until_reopened([FakeStream([{"n": 0}, {"n": 1}, {"n": 2}])], on_change, resync)
+    assert applied == [0, 2]
+
+
+def test_ended_stream_is_resynced_and_reopened():
+    events = []
+
+    async def on_change(change):
+        events.append(change["n"])
+
+    async def resync():
+        events.append("resync")
+
+    # e.g. an invalidate after the collection was renamed: the stream just stops
+    follow_until_reopened([FakeStream([{"n": 0}]), FakeStream([{"n": 1}])], on_change, resync)
+    assert events == [0, "resync", 1, "resync"]
+
+
+def test_catalog_data_lookups():
+    sub_id = ObjectId()
+    category = {"_id": ObjectId(), "title": "Laptops", "slug": "laptops", "subCategories": [str(sub_id)]}
+    data = CatalogData([category], [{"_id": sub_id, "title": "Battery"}], [{"name": "Dell", "category": category["_id"]}])
+
+    assert data.subcategory_titles_by_slug == {"laptops": ["Battery"]}
+    assert data.brand_names_by_slug == {"laptops": ["Dell"]}
+    assert data.category_by_title["laptops"].slug == "laptops"
+
+
+class FakeFind:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self):
+        return list(self.docs)
+
+
+class FakeCatalogCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeFind(self.docs)
+
+
+def test_classifier_is_rebuilt_off_the_loop_before_the_swap(monkeypatch):
+    sub_id = ObjectId()
+    category = {"_id": ObjectId(), "title": "Laptops", "slug": "laptops", "subCategories": [str(sub_id)]}
+    db = SimpleNamespace(
+        categories=FakeCatalogCollection([category]),
+        subcategories=FakeCatalogCollection([{"_id": sub_id, "title": "Battery"}]),
+        brands=FakeCatalogCollection([]),
+    )
+    monkeypatch.setattr(category_classifier, "_cached", (None, None))
+    monkeypatch.setattr(category_classifier, "CLASSIFIER_ENABLED", True)
+    build_threads = []
+    build = CategoryClassifier.from_catalog_data
+
+    def from_catalog_data(data):
+        build_threads.append(threading.get_ident())
+        return build(data)
+
+    monkeypatch.setattr(CategoryClassifier, "from_catalog_data", staticmethod(from_catalog_data))
+
+    async def run():
+        snapshot = CatalogSnapshot(watch=False)
+        seen = []
+
+        async def hook(data):
+            # Readers still see the previous data while derived state is built
+            seen.append(snapshot._data is data)
+
+        snapshot.add_refresh_hook(hook)
+        snapshot.add_refresh_hook(rebuild_classifier)
+        snapshot._db = db
+        await snapshot.refresh()
+        return snapshot, seen
+
+    snapshot, seen = asyncio.run(run())
+    assert seen == [False]
+    assert build_threads and threading.get_ident() not in build_threads
+    assert category_classifier._cached[0] is snapshot.data
+    assert classifier_for(snapshot).classify("laptop battery")[0].slug == "laptops"
+    assert len(build_threads) == 1
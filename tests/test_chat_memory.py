@@ -0,0 +1,27 @@
+import asyncio
+
+from langchain_core.runnables import RunnableLambda
+
+from app.utils import chat_memory
+from app.utils.chat_memory import TokenBudgetMemory
+
+
+def test_summary_through_counts_only_stored_messages(monkeypatch):
+    monkeypatch.setattr(chat_memory, "_fold_chain", lambda: RunnableLambda(lambda inputs: {}))
+    folds = []
+
+    async def on_fold(facts, through):
+        folds.append(through)
+
+    async def main():
+        memory = TokenBudgetMemory(recent_turns=1, on_fold=on_fold)
+        memory.restore(None, [], first_seq=4)
+        # The client's own copy of the history, answered but never stored as a message
+        memory.add_turn('[{"sender": "user", "message": "hi"}]', "Hello again", input_stored=False)
+        memory.add_turn("my laptop", "Which model?")
+        memory.add_turn("X1", "Thanks")
+        await memory.fold()
+
+    asyncio.run(main())
+    # Four messages folded, three of them stored: seq 4 .. 6
+    assert folds == [7]
@@ -0,0 +1,19 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models.agent_chat_model import PaginatedConversationResponse
+from app.routes import chat_route
+
+
+def test_user_without_conversations_gets_an_empty_list(monkeypatch):
+    async def get_conversations_by_user(user_id, db, limit=20, cursor=None):
+        return PaginatedConversationResponse()
+
+    monkeypatch.setattr(chat_route, "get_conversations_by_user", get_conversations_by_user)
+    app = FastAPI()
+    app.include_router(chat_route.chat_router)
+    app.state.database = None
+
+    response = TestClient(app).get("/chat/conversation/u1")
+    assert response.status_code == 200
+    assert response.json() == {"conversations": [], "next_cursor": None}
@@ -0,0 +1,98 @@
+import asyncio
+
+from app.db import chat_write_buffer
+from app.db.chat_write_buffer import ChatWriteBuffer
+from app.models.agent_chat_model import ChatMessageBase, MessageSender
+
+
+def message(text: str) -> ChatMessageBase:
+    return ChatMessageBase(sender=MessageSender.USER, message=text)
+
+
+def test_a_turn_and_its_header_state_are_one_write(monkeypatch):
+    writes = []
+
+    async def append_messages_to_convo(user_id, conversation_id, messages, db, header_fields=None):
+        writes.append(([m.message for m in messages], sorted(header_fields or {})))
+
+    async def update_conversation_header(conversation_id, fields, db):
+        writes.append(([], sorted(fields)))
+        return True
+
+    monkeypatch.setattr(chat_write_buffer, "append_messages_to_convo", append_messages_to_convo)
+    monkeypatch.setattr(chat_write_buffer, "update_conversation_header", update_conversation_header)
+
+    async def main():
+        buffer = ChatWriteBuffer(None, durability="buffered", max_messages=2)
+        await buffer.append("u", "c", message("my fridge is warm"))
+        # The draft of the user message lands while the agent is still answering
+        assert await buffer.update_header("c", {"issue_draft": {}})
+        await buffer.append("u", "c", message("Which brand is it?"))
+        assert await buffer.update_header("c", {"flow": {}})
+        await buffer.close()
+        assert buffer.stats()["writes"] == 1
+
+    asyncio.run(main())
+    assert writes == [(["my fridge is warm", "Which brand is it?"], ["flow", "issue_draft"])]
+
+
+def test_header_state_without_pending_messages_does_not_flush(monkeypatch):
+    writes = []
+
+    async def append_messages_to_convo(user_id, conversation_id, messages, db, header_fields=None):
+        writes.append("append")
+
+    async def update_conversation_header(conversation_id, fields, db):
+        writes.append("header")
+        return True
+
+    monkeypatch.setattr(chat_write_buffer, "append_messages_to_convo", append_messages_to_convo)
+    monkeypatch.setattr(chat_write_buffer, "update_conversation_header", update_conversation_header)
+
+    async def main():
+        buffer = ChatWriteBuffer(None, durability="buffered", max_messages=2)
+        await buffer.append("u", "c", message("hi"))
+        await buffer.append("u", "c", message("Hello!"))
+        await buffer.flush("c")
+        assert await buffer.update_header("c", {"issue_draft": {}})
+
+    asyncio.run(main())
+    assert writes == ["append", "header"]
+
+
+def test_other_writes_wait_for_buffered_messages(monkeypatch):
+    writes = []
+
+    async def append_messages_to_convo(user_id, conversation_id, messages, db, header_fields=None):
+        writes.append([m.message for m in messages])
+
+    monkeypatch.setattr(chat_write_buffer, "append_messages_to_convo", append_messages_to_convo)
+
+    async def create_issue():
+        writes.append("issue")
+        return True
+
+    async def main():
+        buffer = ChatWriteBuffer(None, durability="buffered", max_messages=2, interval_seconds=60)
+        await buffer.append("u", "c", message("hi"))
+        assert await buffer.write_through("c", create_issue)
+        assert buffer.pending_count() == 0
+
+    asyncio.run(main())
+    assert writes == [["hi"], "issue"]
+
+
+def test_shutdown_flush_is_bounded(monkeypatch):
+    async def append_messages_to_convo(user_id, conversation_id, messages, db, header_fields=None):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(chat_write_buffer, "append_messages_to_convo", append_messages_to_convo)
+
+    async def main():
+        buffer = ChatWriteBuffer(None, durability="buffered", max_messages=2, interval_seconds=60)
+        await buffer.append("u", "c", message("hi"))
+        started = asyncio.get_running_loop().time()
+        await buffer.close(timeout=0.05)
+        return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(main()) < 1
@@ -0,0 +1,54 @@
+from bson import ObjectId
+
+from app.utils.agent_tools import build_match_stages
+from app.utils.geek_index import GeekMatchCriteria, GeekMatchIndex, bit_positions, service_modes
+
+SKILL = ObjectId()
+
+
+def geek(mode: str, city: str = "Pune", skill: ObjectId = SKILL) -> dict:
+    return {"_id": ObjectId(), "primarySkill": skill, "modeOfService": mode, "address": {"city": city, "state": "MH"}}
+
+
+def test_user_mode_filters_geeks():
+    index = GeekMatchIndex()
+    online, offline, both = geek("Online"), geek("Offline"), geek("All")
+    for doc in (online, offline, both):
+        index.upsert(doc)
+
+    def matched(mode):
+        criteria = GeekMatchCriteria(skill_ids=[SKILL], modes=service_modes(mode))
+        return {index._ids[slot] for slot in bit_positions(index.match_bits(criteria))}
+
+    assert matched("Online") == {str(online["_id"]), str(both["_id"])}
+    assert matched("Offline") == {str(offline["_id"]), str(both["_id"])}
+    assert len(matched("All")) == 3
+
+
+def test_freed_slots_are_reused():
+    index = GeekMatchIndex()
+    docs = [geek("All") for _ in range(5)]
+    for doc in docs:
+        index.upsert(doc)
+    for doc in docs[:3]:
+        index._remove(doc["_id"])
+    for _ in range(3):
+        index.upsert(geek("All"))
+
+    assert len(index._docs) == 5
+    assert len(bit_positions(index.match_bits(GeekMatchCriteria(skill_ids=[SKILL])))) == 5
+
+
+def test_removed_geek_leaves_every_index():
+    index = GeekMatchIndex()
+    doc = geek("Online", city="Nagpur")
+    index.upsert(doc)
+    index._remove(doc["_id"])
+
+    assert index._live == 0
+    assert not index._by_city and not index._by_mode and not index._by_skill
+
+
+def test_mongo_stages_filter_modes_too():
+    stages = build_match_stages(GeekMatchCriteria(skill_ids=[SKILL], modes=["Online", "All"]))
+    assert stages[0]["$match"]["modeOfService"] == {"$in": ["Online", "All"]}
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from app.db import geek_locations
+from app.db.geek_locations import LOCATIONS_COLLECTION, GeekLocationSync, sync_locations
+from app.utils.agent_tools import build_match_stages, match_collection
+from app.utils.geek_index import GeekMatchCriteria
+
+SKILL = ObjectId()
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        return name
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+class RecordingCollection:
+    def __init__(self, results):
+        self.pipelines = []
+        self.results = results
+        self.deleted = None
+
+    async def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return FakeCursor(self.results)
+
+    async def delete_many(self, query):
+        self.deleted = query["_id"]["$in"]
+        return SimpleNamespace(deleted_count=len(self.deleted))
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self):
+        return list(self.docs)
+
+
+def test_sync_writes_only_moved_points_and_drops_orphans():
+    orphan = ObjectId()
+    db = FakeDatabase(geeks=RecordingCollection([]), **{LOCATIONS_COLLECTION: RecordingCollection([{"_id": orphan}])})
+
+    assert asyncio.run(sync_locations(db)) == 1
+    merge = db.geeks.pipelines[0]
+    stages = [next(iter(stage)) for stage in merge]
+    # Geeks whose stored point already matches are filtered out before $merge
+    assert stages[-4:] == ["$lookup", "$match", "$project", "$merge"]
+    assert merge[-4]["$lookup"]["from"] == LOCATIONS_COLLECTION
+    assert merge[-3]["$match"]["$expr"] == {"$ne": [{"$first": "$stored.location"}, "$location"]}
+    assert db[LOCATIONS_COLLECTION].deleted == [orphan]
+
+
+def test_geo_match_runs_on_own_collection():
+    criteria = GeekMatchCriteria(skill_ids=[SKILL], modes=["Offline", "All"], near=(73.85, 18.52))
+    stages = build_match_stages(criteria)
+
+    assert match_collection(FakeDatabase(), criteria) == LOCATIONS_COLLECTION
+    assert match_collection(FakeDatabase(), criteria.without_geo()) == "geeks"
+    assert list(stages[0]) == ["$geoNear"] and "query" not in stages[0]["$geoNear"]
+    assert stages[1]["$lookup"]["from"] == "geeks"
+    # Skills and modes are geek fields, so they are filtered after the join
+    assert stages[4]["$match"]["modeOfService"] == {"$in": ["Offline", "All"]}
+
+
+def test_address_changes_and_deletes_resync_one_geek(monkeypatch):
+    synced = []
+
+    async def sync_locations(db, geek_id=None):
+        synced.append(geek_id)
+        return 0
+
+    monkeypatch.setattr(geek_locations, "sync_locations", sync_locations)
+    sync = GeekLocationSync(watch=False)
+    geek_id = ObjectId()
+    changes = [
+        {"operationType": "update", "documentKey": {"_id": geek_id}, "updateDescription": {"updatedFields": {"rateCard": 1}}},
+        {"operationType": "update", "documentKey": {"_id": geek_id}, "updateDescription": {"updatedFields": {"address.city": "Pune"}}},
+        {"operationType": "delete", "documentKey": {"_id": geek_id}},
+    ]
+
+    async def main():
+        for change in changes:
+            await sync._on_change(change)
+
+    asyncio.run(main())
+    assert synced == [geek_id, geek_id]
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from app.utils import agent_tools
+from app.utils.agent_tools import build_page_stages, get_unranked_page
+from app.utils.geek_index import GeekMatchCriteria, GeekMatchIndex
+from app.utils.geek_pagination import InvalidCursorError, MatchCache, MatchCursor, criteria_fingerprint
+
+SKILL = ObjectId()
+
+
+class Catalog:
+    def category_by_id(self, category_id):
+        return None
+
+
+def ready_index(n: int) -> GeekMatchIndex:
+    index = GeekMatchIndex()
+    for _ in range(n):
+        index.upsert({"_id": ObjectId(), "primarySkill": SKILL, "modeOfService": "All", "address": {"city": "Pune"}})
+    index.ready = True
+    return index
+
+
+def pages(index, criteria, page_size, monkeypatch):
+    monkeypatch.setattr(agent_tools, "total_cache", MatchCache())
+    issue = SimpleNamespace(id="issue-1")
+
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            geeks, total, position, cursor = await get_unranked_page(None, Catalog(), issue, criteria, 0, page_size, cursor, index)
+            assert position == len(seen) and total == 7
+            seen += [str(geek["_id"]) for geek in geeks]
+            if cursor is None:
+                return seen
+
+    return asyncio.run(walk())
+
+
+def test_unranked_cursors_walk_the_match_in_id_order(monkeypatch):
+    index = ready_index(7)
+    seen = pages(index, GeekMatchCriteria(skill_ids=[SKILL]), 3, monkeypatch)
+    assert seen == sorted(index._ids[:7])
+
+
+def test_unranked_search_rejects_ranked_cursor(monkeypatch):
+    monkeypatch.setattr(agent_tools, "total_cache", MatchCache())
+    criteria = GeekMatchCriteria(skill_ids=[SKILL])
+    ranked = MatchCursor(score=1.0, geek_id=str(ObjectId()), fingerprint=criteria_fingerprint(criteria)).encode()
+    with pytest.raises(InvalidCursorError):
+        asyncio.run(get_unranked_page(None, Catalog(), SimpleNamespace(id="i"), criteria, 0, 3, ranked, ready_index(2)))
+
+
+def test_total_is_counted_once_per_search(monkeypatch):
+    index = ready_index(7)
+    counts = []
+    match_slots = index.match_slots
+
+    def counting(criteria):
+        counts.append(1)
+        return match_slots(criteria)
+
+    index.match_slots = counting
+    pages(index, GeekMatchCriteria(skill_ids=[SKILL]), 3, monkeypatch)
+    # One count, then one match per page
+    assert len(counts) == 1 + 3
+
+
+def test_keyset_stages():
+    geek_id = str(ObjectId())
+    stages = build_page_stages(GeekMatchCriteria(near=(73.85, 18.52)), 10, 5, after=(120.5, geek_id))
+    assert stages[0]["$match"]["$or"][1] == {"distance": 120.5, "_id": {"$gt": ObjectId(geek_id)}}
+    assert stages[1:] == [{"$sort": {"distance": 1, "_id": 1}}, {"$limit": 5}]
+    assert build_page_stages(GeekMatchCriteria(), 10, 5) == [{"$sort": {"_id": 1}}, {"$skip": 10}, {"$limit": 5}]
+
+
+def test_cursor_round_trip_keeps_position():
+    cursor = MatchCursor(score=0.0, geek_id="g", fingerprint="f", position=6)
+    assert MatchCursor.decode(cursor.encode(), "f") == cursor
+
+
+def test_unranked_geo_cursors_walk_nearest_first(monkeypatch):
+    index = GeekMatchIndex()
+    # Pairs at the same spot tie on distance and fall back to id order
+    for longitude in (73.86, 73.86, 73.87, 73.88, 73.88, 73.89, 73.90):
+        index.upsert({
+            "_id": ObjectId(), "primarySkill": SKILL, "modeOfService": "All",
+            "address": {"city": "Pune", "coordinates": {"latitude": 18.52, "longitude": longitude}},
+        })
+    index.ready = True
+    criteria = GeekMatchCriteria(skill_ids=[SKILL], near=(73.85, 18.52))
+    offsets, _ = index.search(criteria, Catalog(), 0, 7)
+
+    assert pages(index, criteria, 2, monkeypatch) == [str(geek["_id"]) for geek in offsets]
+    distances = [geek["distance"] for geek in offsets]
+    assert distances == sorted(distances)
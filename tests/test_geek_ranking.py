@@ -0,0 +1,48 @@
+import numpy as np
+from bson import ObjectId
+
+from app.db.geek_locations import haversine_m
+from app.utils.geek_ranking import CandidateSet, document_features, rank
+
+SKILL, OTHER = ObjectId(), ObjectId()
+
+
+def test_projected_documents_match_raw_features():
+    raw = {
+        "_id": ObjectId(),
+        "primarySkill": OTHER,
+        "secondarySkills": [SKILL],
+        "address": {"coordinates": {"latitude": 18.52, "longitude": 73.85}},
+        "yoe": 4,
+        "reviews": [{"rating": 5}, {"rating": 3}, {}],
+        "rateCard": [{"rate": 0}, {"rate": 400}, {"rate": 250}],
+    }
+    # What ranking_projection([SKILL]) returns for it, plus one with nothing usable
+    projected = [
+        {"_id": raw["_id"], "longitude": 73.85, "latitude": 18.52, "yoe": 4, "rating_sum": 8, "rating_count": 2,
+         "min_rate": 250, "completeness": None, "primary_match": False, "skill_hits": 1},
+        {"_id": ObjectId(), "longitude": 0, "latitude": 0, "yoe": None, "rating_sum": 0, "rating_count": 0,
+         "min_rate": None, "completeness": None, "primary_match": True, "skill_hits": 1},
+    ]
+    candidates = CandidateSet.from_documents(projected, [SKILL])
+
+    np.testing.assert_array_equal(candidates.features[:, 0], document_features(raw))
+    assert np.isnan(candidates.features[:2, 1]).all()
+    assert list(candidates.primary_match) == [False, True]
+    assert list(candidates.skill_coverage) == [1.0, 1.0]
+    assert CandidateSet.from_documents([], [SKILL]).features.shape == (7, 0)
+
+
+def test_distance_is_great_circle():
+    # Pune to Mumbai, about 120 km
+    distance = haversine_m(73.8567, 18.5204, np.array([72.8777]), np.array([19.0760]))[0]
+    assert 115_000 < distance < 125_000
+
+
+def test_nearer_geek_ranks_first():
+    docs = [
+        {"_id": ObjectId(), "longitude": lon, "latitude": 18.52, "rating_sum": 0, "rating_count": 0}
+        for lon in (73.95, 73.86)
+    ]
+    ranked = rank(CandidateSet.from_documents(docs, []), 2, origin=(73.85, 18.52))
+    assert ranked.ids == [str(docs[1]["_id"]), str(docs[0]["_id"])]
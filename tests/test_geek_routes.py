@@ -0,0 +1,35 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routes import geek_routes
+from app.utils import agent_tools
+from app.utils.geek_index import GeekMatchCriteria
+
+ISSUE = {"user_id": "u1", "conversation_id": "c1", "summary": "Laptop screen flickers"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def build_match_criteria(db, catalog, user_issue):
+        return GeekMatchCriteria()
+
+    monkeypatch.setattr(agent_tools, "build_match_criteria", build_match_criteria)
+    app = FastAPI()
+    app.include_router(geek_routes.router)
+    app.state.database = app.state.catalog = app.state.geek_index = None
+    return TestClient(app)
+
+
+def test_malformed_cursor_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(agent_tools, "RANKING_ENABLED", True)
+    response = client.post("/geek_query/get_geeks_from_user_issue", params={"cursor": "not-a-cursor"}, json=ISSUE)
+    assert response.status_code == 400
+    assert "Malformed cursor" in response.json()["detail"]
+
+
+def test_malformed_cursor_is_rejected_while_ranking_is_disabled(client, monkeypatch):
+    monkeypatch.setattr(agent_tools, "RANKING_ENABLED", False)
+    response = client.post("/geek_query/get_geeks_from_user_issue", params={"cursor": "abc"}, json=ISSUE)
+    assert response.status_code == 400
+    assert "Malformed cursor" in response.json()["detail"]
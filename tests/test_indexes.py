@@ -0,0 +1,90 @@
+import asyncio
+
+from app.db.indexes import (
+    INDEXES,
+    OWN_COLLECTIONS,
+    QUERY_SHAPES,
+    QueryShape,
+    check_query_shapes,
+    ensure_indexes,
+    execution_totals,
+    plan_stages,
+)
+
+# An aggregate explain from a sharded-style layout: the plan and stats sit in a
+# $cursor stage rather than at the top level
+INDEXED = {
+    "stages": [{"$cursor": {
+        "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "conversation_id_1"}}},
+        "executionStats": {"nReturned": 2, "totalKeysExamined": 2, "totalDocsExamined": 2},
+    }}, {"$sort": {"sortKey": {"bucket": 1}}}],
+}
+SCANNED = {
+    "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}},
+    "executionStats": {"nReturned": 1, "totalKeysExamined": 0, "totalDocsExamined": 5000},
+}
+WIDE = {
+    "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}},
+    "executionStats": {"nReturned": 1, "totalKeysExamined": 40},
+}
+
+
+def test_plan_stages_and_totals_from_nested_explain():
+    assert plan_stages(INDEXED) == ["FETCH", "IXSCAN"]
+    assert execution_totals(INDEXED) == (2, 2)
+    assert plan_stages(SCANNED) == ["COLLSCAN"]
+
+
+class ExplainingDatabase:
+    def __init__(self, explains):
+        self.explains = explains
+
+    async def command(self, command):
+        return self.explains[command["explain"].get("find") or command["explain"]["aggregate"]]
+
+
+def test_check_flags_scans_and_wide_index_reads():
+    shapes = [
+        QueryShape(name="header", collection="conversations", filter={"conversation_id": "c"}),
+        QueryShape(name="scan", collection="user_issues", filter={"user_id": 1}),
+        QueryShape(name="wide", collection="geeks", filter={"address.city": "Pune"}),
+    ]
+    db = ExplainingDatabase({"conversations": INDEXED, "user_issues": SCANNED, "geeks": WIDE})
+
+    failures = asyncio.run(check_query_shapes(db, max_ratio=2.0, shapes=shapes))
+
+    assert len(failures) == 2
+    assert failures[0].startswith("scan: COLLSCAN on user_issues")
+    assert failures[1].startswith("wide: 40 keys examined for 1 documents")
+
+
+def test_every_query_shape_has_an_index():
+    indexed = {spec.collection for spec in INDEXES}
+    assert all(shape.collection in indexed for shape in QUERY_SHAPES)
+
+
+class IndexingDatabase(dict):
+    def __init__(self):
+        super().__init__()
+        self.created = []
+
+    def __missing__(self, name):
+        collection = self[name] = IndexingCollection(name, self.created)
+        return collection
+
+
+class IndexingCollection:
+    def __init__(self, name, created):
+        self.name = name
+        self.created = created
+
+    async def create_index(self, keys, **options):
+        self.created.append(self.name)
+        return options.get("name") or "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def test_startup_leaves_backend_collections_alone():
+    db = IndexingDatabase()
+    asyncio.run(ensure_indexes(db, OWN_COLLECTIONS))
+    assert set(db.created) <= set(OWN_COLLECTIONS)
+    assert "geeks" not in db.created
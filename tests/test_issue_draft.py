@@ -0,0 +1,106 @@
+import asyncio
+
+from app.models.agent_chat_model import ChatMessageBase, MessageSender
+from app.utils.issue_draft import IssueDraft
+
+
+class StubExtractor:
+    """Records the transcripts it is given; each call waits for `release` if set."""
+
+    def __init__(self, failures: int = 0):
+        self.transcripts = []
+        self.failures = failures
+        self.release = None
+
+    async def update_issue_details(self, fields, transcript):
+        self.transcripts.append(transcript)
+        if self.release is not None:
+            await self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ValueError("model unavailable")
+        return {**(fields or {}), "turns": len(self.transcripts)}
+
+
+def stored(texts):
+    return [ChatMessageBase(sender=MessageSender.USER, message=text) for text in texts]
+
+
+def test_draft_older_than_the_loaded_messages_is_not_used():
+    extractor = StubExtractor()
+
+    async def main():
+        draft = IssueDraft(extractor, enabled=True)
+        # Messages 0 .. 3 are not loaded, and the draft only covers 0 .. 1
+        draft.restore({"fields": {"title": "TV"}, "through": 2}, stored(["m4", "m5"]), first_seq=4)
+        draft.add_turn("it is a Sony", "Thanks")
+        return draft, await draft.result(timeout=1)
+
+    draft, result = asyncio.run(main())
+    assert draft.incomplete and result is None
+    assert extractor.transcripts == []
+
+
+def test_turns_added_during_an_update_are_folded_in_one_batch():
+    extractor = StubExtractor()
+    updates = []
+
+    async def on_update(fields, through):
+        updates.append(through)
+
+    async def main():
+        extractor.release = asyncio.Event()
+        draft = IssueDraft(extractor, on_update=on_update, enabled=True)
+        draft.add_turn("my tv is dead", "Which brand?")
+        await asyncio.sleep(0)  # first update running
+        draft.add_turn("Sony", "Which model?")
+        draft.add_turn("Bravia", "Thanks")
+        extractor.release.set()
+        return await draft.result(timeout=1)
+
+    result = asyncio.run(main())
+    assert len(extractor.transcripts) == 2
+    assert extractor.transcripts[1] == "user: Sony\nbot: Which model?\nuser: Bravia\nbot: Thanks"
+    assert updates == [2, 6]
+    assert result == {"turns": 2}
+
+
+def test_messages_stay_pending_after_a_failed_update():
+    extractor = StubExtractor(failures=1)
+    updates = []
+
+    async def on_update(fields, through):
+        updates.append(through)
+
+    async def main():
+        draft = IssueDraft(extractor, on_update=on_update, enabled=True)
+        draft.add_turn("my tv is dead", "Which brand?")
+        await draft._task
+        assert draft.through == 0
+        draft.add_turn("Sony", "Which model?")
+        return await draft.result(timeout=1)
+
+    result = asyncio.run(main())
+    assert extractor.transcripts[1].startswith("user: my tv is dead")
+    assert updates == [4]
+    assert result is not None
+
+
+def test_result_gives_up_on_a_slow_update():
+    extractor = StubExtractor()
+
+    async def main():
+        extractor.release = asyncio.Event()
+        draft = IssueDraft(extractor, enabled=True)
+        draft.add_turn("my tv is dead", "Which brand?")
+        started = asyncio.get_running_loop().time()
+        result = await draft.result(timeout=0.05)
+        elapsed = asyncio.get_running_loop().time() - started
+        # The update itself carries on and lands later
+        extractor.release.set()
+        await draft._task
+        return result, elapsed, draft.fields
+
+    result, elapsed, fields = asyncio.run(main())
+    assert result is None and elapsed < 1
+    assert fields == {"turns": 1}
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.utils import issue_extractor
+from app.utils.issue_extractor import MAX_REPAIR_ATTEMPTS, IssueExtractor
+from app.utils.metrics import MetricsRegistry
+from app.models.user_issue_model import IssueDetails
+
+
+class FakeStructuredLLM:
+    """Answers with the queued results of with_structured_output(include_raw=True)."""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def with_structured_output(self, schema, method=None, include_raw=False):
+        return self
+
+    async def ainvoke(self, messages, config=None):
+        self.calls.append(messages)
+        return self.results.pop(0)
+
+
+def invalid(text: str = '{"summary": 42}') -> dict:
+    return {"raw": AIMessage(content=text), "parsed": None, "parsing_error": ValueError("summary must be a string")}
+
+
+def valid(summary: str) -> dict:
+    return {"raw": AIMessage(content="{}"), "parsed": IssueDetails(summary=summary), "parsing_error": None}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(issue_extractor, "metrics", registry)
+    monkeypatch.setattr(issue_extractor, "count_tokens", len)
+    return registry
+
+
+def test_invalid_output_is_repaired_with_the_error(registry):
+    llm = FakeStructuredLLM([invalid(), valid("Screen flickers")])
+    extractor = IssueExtractor(llm=llm)
+
+    fields = asyncio.run(extractor.update_issue_details(None, "user: my screen flickers"))
+
+    assert fields == {"summary": "Screen flickers"}
+    first, repair = llm.calls
+    # The failed output and the error are sent back after the original prompt
+    assert repair[:len(first)] == first
+    assert isinstance(repair[-2], AIMessage) and repair[-2].content == '{"summary": 42}'
+    assert isinstance(repair[-1], HumanMessage) and "summary must be a string" in repair[-1].content
+    assert registry.counter("extractor.attempts", purpose="extractor_update") == 2
+    assert registry.counter("extractor.parse_failures", purpose="extractor_update") == 1
+    assert registry.counter("extractor.repairs", outcome="ok", purpose="extractor_update") == 1
+
+
+def test_gives_up_after_every_repair_attempt_fails(registry):
+    attempts = MAX_REPAIR_ATTEMPTS + 1
+    llm = FakeStructuredLLM([invalid() for _ in range(attempts)])
+    extractor = IssueExtractor(llm=llm)
+
+    with pytest.raises(ValueError, match=f"after {attempts} attempts"):
+        asyncio.run(extractor.extract_issue_details("user: hi", "u", "c"))
+
+    assert len(llm.calls) == attempts
+    assert registry.counter("extractor.parse_failures", purpose="extractor") == attempts
+    assert registry.counter("extractor.repairs", outcome="failed", purpose="extractor") == 1
@@ -0,0 +1,70 @@
+import asyncio
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from app.utils import llm_clients
+from app.utils.agent_setup import STATIC_SYS_PROMPT, AgentTemplate, ChatAssistantChain
+from app.utils.llm_clients import LLMUsageRecorder, chat_model, shared_http_client
+from app.utils.metrics import MetricsRegistry
+
+
+def test_sessions_share_one_model_and_template(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    model = chat_model("o4-mini", streaming=True)
+    assert chat_model("o4-mini", streaming=True) is model
+    assert model.http_async_client is shared_http_client()
+
+    template = AgentTemplate(catalog=None, llm=model)
+    first, second = ChatAssistantChain(template=template), ChatAssistantChain(template=template)
+
+    # Only the memory is built per session
+    assert first.agent_executor.agent.runnable is second.agent_executor.agent.runnable is template.agent
+    assert first.memory is not second.memory
+    assert first.agent_executor.memory is first.memory
+
+
+def model_result(prompt: int, cached: int, completion: int) -> LLMResult:
+    usage = {
+        "input_tokens": prompt,
+        "output_tokens": completion,
+        "total_tokens": prompt + completion,
+        "input_token_details": {"cache_read": cached},
+    }
+    return LLMResult(generations=[[ChatGeneration(message=AIMessage(content="{}", usage_metadata=usage))]])
+
+
+def test_usage_recorder_splits_cached_prompt_tokens(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(llm_clients, "metrics", registry)
+    recorder = LLMUsageRecorder("agent")
+
+    async def call(result):
+        run_id = uuid4()
+        await recorder.on_chat_model_start({}, [], run_id=run_id, metadata={"ls_model_name": "o4-mini"})
+        await recorder.on_llm_end(result, run_id=run_id)
+
+    async def main():
+        await call(model_result(prompt=3000, cached=2816, completion=40))
+        await call(model_result(prompt=3100, cached=0, completion=25))
+
+    asyncio.run(main())
+    summary = recorder.summary()
+    assert (summary["calls"], summary["prompt_tokens"], summary["cached_tokens"], summary["completion_tokens"]) == (2, 6100, 2816, 65)
+    labels = {"model": "o4-mini", "purpose": "agent"}
+    assert registry.counter("llm.cached_tokens", **labels) == 2816
+    histograms = registry.snapshot()["histograms"]
+    assert histograms["llm.latency_ms{cache=hit,model=o4-mini,purpose=agent}"]["count"] == 1
+    assert histograms["llm.latency_ms{cache=miss,model=o4-mini,purpose=agent}"]["count"] == 1
+
+
+def test_static_prompt_prefix_comes_first(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    template = AgentTemplate(catalog=None, llm=chat_model("o4-mini", streaming=True))
+    first = template.prompt.messages[0]
+
+    # Nothing that changes per session or per day ahead of the cached prefix
+    assert first.content == STATIC_SYS_PROMPT
+    assert "current_date" not in STATIC_SYS_PROMPT
+    assert template.prompt.input_variables == ["agent_scratchpad", "chat_history", "current_date", "input"]
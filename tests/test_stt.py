@@ -0,0 +1,54 @@
+import asyncio
+import io
+
+import numpy as np
+
+from app.utils import stt
+from tests.conftest import float_wav, pcm_wav
+
+
+def tone(seconds: float, rate: int = 16000) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    return (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def test_float_wav_is_sent_unsplit(whisper):
+    audio = float_wav(tone(1.0))
+    result = asyncio.run(stt.transcribe_audio(whisper, io.BytesIO(audio), len(audio), "clip.wav", "audio/wav"))
+
+    assert result.text == "hello"
+    assert result.preprocessing is None
+    assert whisper.requests == [("clip.wav", audio, "audio/wav")]
+
+
+def test_pcm_wav_is_decoded(whisper):
+    audio = pcm_wav(tone(1.0))
+    assert stt.decodable_wav(io.BytesIO(audio))
+    result = asyncio.run(stt.transcribe_audio(whisper, io.BytesIO(audio), len(audio), "clip.wav", "audio/wav"))
+
+    assert result.text == "hello"
+    assert len(whisper.requests) == 1
+
+
+def test_undecodable_wav_over_whisper_limit_is_rejected(whisper, monkeypatch):
+    monkeypatch.setattr(stt, "WHISPER_MAX_BYTES", 100)
+    audio = float_wav(tone(0.1))
+    try:
+        asyncio.run(stt.transcribe_audio(whisper, io.BytesIO(audio), len(audio)))
+    except stt.UploadTooLargeError:
+        pass
+    else:
+        raise AssertionError("expected UploadTooLargeError")
+    assert not whisper.requests
+
+
+def test_segments_cover_the_clip_in_order():
+    rate, window = 16000, 480
+    energies = np.ones(int(70 * rate) // window, dtype=np.float32)
+    energies[int(27 * rate) // window] = 0.0
+    bounds = stt.plan_segments(energies, window, 70 * rate, rate, segment_seconds=30, search_seconds=5)
+
+    assert bounds[0] == (0, (int(27 * rate) // window) * window)
+    assert all(end == start for (_, end), (start, _) in zip(bounds, bounds[1:]))
+    assert bounds[-1][1] == 70 * rate
+    assert all(end - start <= 30 * rate for start, end in bounds)
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.tts import negotiate_audio_format, open_speech_stream
+
+
+def test_explicit_format_wins_over_accept():
+    assert negotiate_audio_format("MP3", "audio/ogg") == "mp3"
+    assert negotiate_audio_format("audio/x-wav") == "wav"
+    with pytest.raises(ValueError):
+        negotiate_audio_format("flac")
+
+
+def test_accept_header_is_matched_by_quality():
+    assert negotiate_audio_format(accept="audio/wav;q=0.5, audio/ogg;q=0.9, audio/mpeg;q=0.9") == "opus"
+    assert negotiate_audio_format(accept="audio/ogg;q=0, audio/l16") == "pcm"
+    assert negotiate_audio_format(accept="text/html") == "wav"
+    assert negotiate_audio_format() == "wav"
+
+
+class FakeSpeechResponse:
+    def __init__(self, chunks, log):
+        self.chunks = chunks
+        self.log = log
+
+    async def __aenter__(self):
+        self.log.append("opened")
+        return self
+
+    async def __aexit__(self, *exc):
+        self.log.append("closed")
+
+    async def iter_bytes(self, chunk_size):
+        for chunk in self.chunks:
+            self.log.append(len(chunk))
+            yield chunk
+
+
+def fake_client(chunks, log, requests):
+    def create(**kwargs):
+        requests.append(kwargs)
+        return FakeSpeechResponse(chunks, log)
+
+    return SimpleNamespace(audio=SimpleNamespace(speech=SimpleNamespace(with_streaming_response=SimpleNamespace(create=create))))
+
+
+def test_audio_is_relayed_chunk_by_chunk():
+    log, requests = [], []
+    client = fake_client([b"ab", b"cde"], log, requests)
+
+    async def main():
+        chunks, _ = await open_speech_stream(client, "Hello", audio_format="opus")
+        # The upstream request is open before the first chunk is pulled
+        assert log == ["opened"]
+        received = []
+        async for chunk in chunks:
+            received.append(chunk)
+            log.append("relayed")
+        return received
+
+    assert asyncio.run(main()) == [b"ab", b"cde"]
+    assert log == ["opened", 2, "relayed", 3, "relayed", "closed"]
+    assert requests[0]["response_format"] == "opus"
@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+from app.utils.tts_cache import TTSCache
+
+
+def clip(size: int) -> bytes:
+    return b"x" * size
+
+
+def test_memory_tier_evicts_least_recently_used_by_size(tmp_path):
+    cache = TTSCache(str(tmp_path), max_memory_bytes=250, max_disk_bytes=10_000)
+
+    async def main():
+        await cache.put("a", clip(100))
+        await cache.put("b", clip(100))
+        assert await cache.get("a") == clip(100)  # "b" is now the oldest
+        await cache.put("c", clip(100))
+
+    asyncio.run(main())
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.stats()["memory_bytes"] == 200
+    # Still on disk, so a later lookup is a disk hit that is promoted back
+    assert asyncio.run(cache.get("b")) == clip(100)
+    assert cache.disk_hits == 1
+
+
+def test_disk_tier_deletes_evicted_files(tmp_path):
+    cache = TTSCache(str(tmp_path), max_memory_bytes=0, max_disk_bytes=250)
+
+    async def main():
+        for key in ("a", "b", "c"):
+            await cache.put(key, clip(100))
+        return await cache.get("a")
+
+    assert asyncio.run(main()) is None
+    assert sorted(os.listdir(tmp_path)) == ["b.audio", "c.audio"]
+    stats = cache.stats()
+    assert (stats["disk_entries"], stats["disk_bytes"], stats["misses"]) == (2, 200, 1)
+
+
+def test_disk_index_survives_a_restart(tmp_path):
+    asyncio.run(TTSCache(str(tmp_path), 1000, 1000).put("a", clip(10)))
+
+    reopened = TTSCache(str(tmp_path), 1000, 1000)
+    assert asyncio.run(reopened.get("a")) == clip(10)
+    assert reopened.stats()["hit_rate"] == 1.0
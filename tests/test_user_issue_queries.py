@@ -0,0 +1,64 @@
+import asyncio
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient
+
+from app.db.conn import db_client
+from app.db.user_issue_queries import get_issue_by_user
+
+USER_ID = str(ObjectId())
+
+
+class SlowCursor:
+    """A find() cursor whose round trip takes `delay` seconds of awaiting, not blocking."""
+
+    def __init__(self, docs, delay):
+        self.docs = docs
+        self.delay = delay
+
+    def sort(self, *args):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self.delay)
+        for doc in self.docs:
+            yield doc
+
+
+class SlowCollection:
+    def __init__(self, docs, delay):
+        self.docs = docs
+        self.delay = delay
+
+    def find(self, query):
+        return SlowCursor(self.docs, self.delay)
+
+
+class SlowDatabase:
+    def __init__(self, delay):
+        issue = {"_id": str(ObjectId()), "user_id": USER_ID, "conversation_id": "c", "summary": "TV is dead"}
+        self.user_issues = SlowCollection([issue], delay)
+
+
+def test_client_is_async(monkeypatch):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://localhost:27017")
+    client = db_client()
+    assert isinstance(client, AsyncMongoClient)
+    asyncio.run(client.close())
+
+
+def test_slow_queries_do_not_serialize_sessions():
+    db = SlowDatabase(delay=0.1)
+
+    async def main():
+        started = asyncio.get_running_loop().time()
+        results = await asyncio.gather(*(get_issue_by_user(USER_ID, db) for _ in range(5)))
+        return results, asyncio.get_running_loop().time() - started
+
+    results, elapsed = asyncio.run(main())
+    assert [len(issues) for issues in results] == [1] * 5
+    # Five 100 ms round trips overlap instead of adding up to 500 ms
+    assert elapsed < 0.3
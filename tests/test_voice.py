@@ -0,0 +1,50 @@
+import asyncio
+
+from app.utils.voice import SentenceSplitter, UtteranceBuffer, VoiceReplyStreamer
+
+
+class FakeSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(text)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+
+class SlowCache:
+    async def synthesize(self, client, sentence, voice, audio_format):
+        await asyncio.sleep(10)
+        return b""
+
+
+def test_utterance_over_limit_is_dropped_until_it_ends():
+    buffer = UtteranceBuffer(max_bytes=10)
+    assert buffer.add(b"12345") is None
+    assert "exceeds 10 bytes" in buffer.add(b"123456")
+    assert buffer.add(b"1") is None
+    assert buffer.take() == b""
+
+    assert buffer.add(b"abc") is None
+    assert buffer.take() == b"abc"
+
+
+def test_sentences_are_split_at_boundaries():
+    splitter = SentenceSplitter()
+    assert splitter.feed("Hi. Your laptop is covered by ") == []
+    assert splitter.feed("warranty. Which brand is it? ") == ["Hi. Your laptop is covered by warranty.", "Which brand is it?"]
+    assert splitter.flush() is None
+
+
+def test_cancel_waits_for_the_sender():
+    async def run():
+        streamer = VoiceReplyStreamer(FakeSocket(), client=None, tts_cache=SlowCache())
+        streamer.feed("This sentence is long enough. ")
+        await asyncio.sleep(0)
+        await streamer.cancel()
+        return streamer._sender
+
+    sender = asyncio.run(run())
+    assert sender.done() and sender.cancelled()